@@ -3,7 +3,8 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from app.EmailBackEnd import EmailBackEnd
 from app.models import *
-from django.db.models import Sum
+from django.db.models import F, Sum
+from app.earnings import mark_course_paid
 from E_LMS.views import page_not_found
 from django.core.mail import send_mail
 from django.conf import settings
@@ -35,9 +36,9 @@ def admin_dashboard(request):
     teacher_count = Teacher.objects.count()
     application_count = TeacherApplication.objects.filter(status='pending').count()
 
-    total_earnings = AdminEarning.objects.aggregate(total=models.Sum('commission_amount'))['total'] or 0
+    total_earnings = DailyEarnings.objects.aggregate(total=models.Sum('commission'))['total'] or 0
 
-    recent_courses = Course.objects.select_related('teacher', 'course_category').order_by('-id')[:5]
+    recent_courses = Course.objects.select_related('teacher__user', 'course_category', 'stats').order_by('-id')[:5]
 
     context = {
         'course_count': course_count,
@@ -122,7 +123,7 @@ def admin_courses(request):
     if user.role != 'admin':
         return page_not_found(request)
 
-    courses = Course.objects.select_related('teacher', 'course_category').all().order_by('-id')
+    courses = Course.objects.select_related('teacher__user', 'course_category', 'stats').all().order_by('-id')
 
     context = {
         'courses': courses
@@ -163,24 +164,21 @@ def admin_earnings(request):
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
 
-    # Base queryset
-    earnings_qs = AdminEarning.objects.all()
+    # Pre-aggregated per day (app/earnings.py): a few rows per day, however many sales
+    earnings_qs = DailyEarnings.objects.all()
 
     if start_date:
-        earnings_qs = earnings_qs.filter(payment__payment_date__date__gte=start_date)
+        earnings_qs = earnings_qs.filter(day__gte=start_date)
     if end_date:
-        earnings_qs = earnings_qs.filter(payment__payment_date__date__lte=end_date)
+        earnings_qs = earnings_qs.filter(day__lte=end_date)
 
     # Total admin earnings for filtered range
-    total_admin_earnings = earnings_qs.aggregate(total=Sum('commission_amount'))['total'] or 0
+    total_admin_earnings = earnings_qs.aggregate(total=Sum('commission'))['total'] or 0
 
-    # Optional: earnings grouped by date
-    from django.db.models.functions import TruncDate
     earnings_by_date = (
         earnings_qs
-        .annotate(date=TruncDate('payment__payment_date'))
-        .values('date')
-        .annotate(day_total=Sum('commission_amount'))
+        .values(date=F('day'))
+        .annotate(day_total=Sum('commission'))
         .order_by('-date')
     )
 
@@ -202,21 +200,20 @@ def admin_earnings_view(request):
 
     filter_status = request.GET.get('status', 'all')  # all, paid, unpaid
 
-    earnings_qs = TeacherEarning.objects.select_related('course', 'teacher__user')
-
-    if filter_status == 'paid':
-        earnings_qs = earnings_qs.filter(is_paid=True)
-    elif filter_status == 'unpaid':
-        earnings_qs = earnings_qs.filter(is_paid=False)
-
-    # Group by course and teacher and sum amounts
-    earnings_summary = earnings_qs.values(
+    # Paid and unpaid totals per course and teacher, from the daily rollups
+    totals = DailyEarnings.objects.values(
         'course__id',
         'course__title',
         'teacher__user__first_name',
         'teacher__user__last_name',
-        'is_paid',
-    ).annotate(total_earned=Sum('amount')).order_by('-total_earned')
+    ).annotate(share=Sum('teacher_share'), paid=Sum('teacher_paid')).order_by()
+
+    earnings_summary = []
+    for row in totals:
+        for is_paid, total in ((True, row['paid']), (False, row['share'] - row['paid'])):
+            if total and filter_status in ('all', 'paid' if is_paid else 'unpaid'):
+                earnings_summary.append({**row, 'is_paid': is_paid, 'total_earned': total})
+    earnings_summary.sort(key=lambda item: item['total_earned'], reverse=True)
 
     context = {
         'teacher_earnings': earnings_summary,
@@ -232,14 +229,11 @@ def pay_teacher_earning(request, course_id):
     if user.role != 'admin':
         return page_not_found(request)
 
-    # Pay all unpaid earnings for this course
-    earnings_to_pay = TeacherEarning.objects.filter(course_id=course_id, is_paid=False)
-
-    if not earnings_to_pay.exists():
+    # Pay all unpaid earnings for this course (and move them to paid in the rollups)
+    if not mark_course_paid(course_id):
         messages.warning(request, "No unpaid earnings found for this course.")
         return redirect('admin_payments')
 
-    earnings_to_pay.update(is_paid=True)
     messages.success(request, "Marked teacher earnings as paid for the selected course.")
     return redirect('admin_payments')
 
@@ -45,6 +45,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.middleware.PrecompressedStaticMiddleware',
+    'app.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +67,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'app.context_processors.navigation',
             ],
         },
     },
@@ -80,9 +83,182 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock when a transaction starts: SQLite ignores
+        # select_for_update(), and a deferred transaction that reads and then
+        # writes (payment settlement) fails with "database is locked" instead
+        # of waiting when another writer got in between.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+# The page/fragment caches, their version keys (app/cache_versions.py) and
+# the rebuild locks (app/page_cache.py) must be shared by every worker
+# process: in production set REDIS_URL (needs the redis package). LocMemCache
+# is per process, so it is only right for runserver, tests and single-worker
+# deployments; `manage.py check --deploy` warns about it (app.W001).
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'e-lms',
+        }
+    }
+
+# Header navigation tree (app/navigation.py). Course/category signals bump its
+# version at once, but only in the cache they run against: keep the timeout
+# short unless that cache is shared by every worker.
+NAV_CACHE_TIMEOUT = 60 * 60 * 24 if REDIS_URL else 60 * 5
+
+# Per-request SQL query budgets (app.middleware.QueryBudgetMiddleware), keyed by URL name.
+# Requests over budget are logged to 'app.query_budget' with their duplicate queries.
+# Each budget is the worst case over anonymous/student/teacher/admin with a cold
+# cache (a logged-in request spends 2 on session + user); QueryCountRegressionTests
+# asserts every named route against this same table. 'name:METHOD' entries
+# override a route's budget for that method (form posts usually write more).
+
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_DEFAULT = 15
+QUERY_BUDGETS = {
+    'base': 4,
+    'page_not_found': 4,
+    'home': 6,
+    'all_courses': 5,
+    'courses_filter_data': 5,
+    'search': 7,
+    'course_details': 9,
+    'contact': 4,
+    'about': 4,
+    'register': 4,
+    'doLogin': 1,
+    'teacher_dashboard': 5,
+    'edit_teacher_profile': 5,
+    'add_course': 6,
+    'my_coursess': 5,
+    'edit_course': 10,
+    'add_lesson': 4,
+    'add_video': 7,
+    'video_upload_start': 3,
+    'video_upload_start:POST': 7,
+    'video_upload_detail': 4,
+    'video_upload_detail:DELETE': 5,
+    'video_upload_chunk': 3,
+    'video_upload_chunk:PUT': 5,
+    'video_upload_finish': 3,
+    # two files through DedupFileSystemStorage, the search reindex and the
+    # upload's claim and cascade delete; once per video, not per chunk
+    'video_upload_finish:POST': 31,
+    'get_lessons_ajax': 3,
+    'get_next_serial_number': 3,
+    'enrolled_students': 5,
+    'teacher_earnings': 5,
+    'admin_dashboard': 8,
+    'edit_profile': 4,
+    'admin_courses': 4,
+    'admin_students': 4,
+    'admin_teachers': 4,
+    'admin_earnings': 4,
+    'admin_payments': 4,
+    'pay_teacher_earning': 11,  # + one rollup upsert per day paid out
+    'apply_as_teacher': 4,
+    'apply_as_teacher:POST': 20,  # uniqueness checks, application row, deduplicated resume save
+    'admin_joining_applications': 5,
+    'update_application_status': 4,
+    'logout': 4,
+    'profile': 5,
+    'profile_update': 5,
+    'checkout': 5,
+    'checkout:POST': 8,
+    'my_courses': 6,
+    'verify_payment': 4,
+    'verify_payment:POST': 16,  # the whole settlement transaction
+    'payment_webhook': 0,
+    'payment_webhook:POST': 1,
+    'watch_course': 7,
+    'stream_video': 3,
+    'stream_hls': 3,
+    'stream_signed': 0,
+    'media_auth': 0,
+    'image_rendition': 5,
+}
+
+# Uploaded media (app.storage): every file is stored once per SHA-256 under
+# MEDIA_ROOT/blobs/ and the name a FileField holds is a hard link to it, so
+# uploading the same bytes again costs no extra disk space.
+
+STORAGES = {
+    'default': {'BACKEND': 'app.storage.DedupFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'app.static_pipeline.BundledManifestStaticFilesStorage'},
+}
+
+# `manage.py media_gc` only walks these directories under MEDIA_ROOT. MEDIA_ROOT
+# is the project directory here, so never add '' or '.' to this list.
+
+MEDIA_GC_ROOTS = ('Media', 'media', 'videos', 'joiningapplications', 'hls', 'blobs')
+
+# Lecture video delivery (app.streaming). None streams from Python in
+# MEDIA_STREAM_CHUNK_SIZE chunks (development). In production set 'nginx'
+# (X-Accel-Redirect to an `internal` location at MEDIA_ACCEL_PREFIX aliased to
+# the media directory) or 'apache' (mod_xsendfile) so the web server sends the bytes.
+
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Signed media URLs (app.media_tokens): watch_course checks enrollment once and
+# issues HMAC tokens bound to user, video and expiry; stream_signed validates
+# them without any database access. To let nginx send the files, protect a
+# location mirroring the stream_signed URLs with auth_request:
+#
+#   location ~ ^/videos/\d+/signed/[^/]+/(?<media_name>.+)$ {
+#       auth_request /media/auth;
+#       alias <MEDIA_ROOT>/$media_name;
+#   }
+#   location = /media/auth {
+#       internal;
+#       proxy_pass http://django;
+#       proxy_pass_request_body off;
+#       proxy_set_header Content-Length "";
+#       proxy_set_header X-Original-URI $request_uri;
+#   }
+
+MEDIA_TOKEN_TTL = 6 * 60 * 60
+MEDIA_TOKEN_SECRET = None    # defaults to SECRET_KEY
+
+# Resumable lecture uploads (app.uploads): the browser sends the file in
+# chunks of this size, each PUT streamed to disk with a SHA-256 check.
+
+VIDEO_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Teacher application resumes (app.resumes): PDF signature and size are checked
+# while the upload streams in; `manage.py resume_worker` extracts page count
+# and text for the admin previews.
+
+RESUME_MAX_SIZE = 5 * 1024 * 1024
+
+# HLS transcoding (app.transcode_queue, run `manage.py transcode_worker`).
+# None uses ffmpeg when it is on PATH; 'app.transcoding.StubBackend' fakes it.
+
+TRANSCODE_BACKEND = None
+TRANSCODE_BACKEND_OPTIONS = {}
+TRANSCODE_MAX_ATTEMPTS = 3
+TRANSCODE_LEASE_SECONDS = 600
+
+# Course image / thumbnail renditions (app.renditions, {% responsive_image %})
+
+IMAGE_RENDITION_WIDTHS = (320, 640, 960)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -125,6 +301,53 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# `manage.py collectstatic` is the static build step (app.static_pipeline):
+# it concatenates each bundle below, fingerprints every file and writes .gz
+# (and, with the brotli package installed, .br) siblings. {% bundle %} in
+# base*.html emits one tag per bundle once it is built, the sources in DEBUG.
+# PrecompressedStaticMiddleware serves STATIC_ROOT with far-future headers;
+# behind nginx use `gzip_static on; brotli_static on; expires max;` instead.
+
+STATIC_SERVE_PRECOMPRESSED = True
+STATIC_BUNDLES = {
+    'bundles/site.css': [
+        'assets/fonts/fontawesome/fontawesome.css',
+        'assets/libs/aos/dist/aos.css',
+        'assets/libs/choices.js/public/assets/styles/choices.min.css',
+        'assets/libs/flickity-fade/flickity-fade.css',
+        'assets/libs/flickity/dist/flickity.min.css',
+        'assets/libs/highlightjs/styles/vs2015.css',
+        'assets/libs/jarallax/dist/jarallax.css',
+        'assets/libs/quill/dist/quill.core.css',
+        'assets/css/theme.min.css',
+    ],
+    'bundles/site.js': [
+        'assets/libs/jquery/dist/jquery.min.js',
+        'assets/libs/bootstrap/dist/js/bootstrap.bundle.min.js',
+        'assets/libs/aos/dist/aos.js',
+        'assets/libs/choices.js/public/assets/scripts/choices.min.js',
+        'assets/libs/countup.js/dist/countUp.min.js',
+        'assets/libs/dropzone/dist/min/dropzone.min.js',
+        'assets/libs/flickity/dist/flickity.pkgd.min.js',
+        'assets/libs/flickity-fade/flickity-fade.js',
+        'assets/libs/highlightjs/highlight.pack.min.js',
+        'assets/libs/imagesloaded/imagesloaded.pkgd.min.js',
+        'assets/libs/isotope-layout/dist/isotope.pkgd.min.js',
+        'assets/libs/jarallax/dist/jarallax.min.js',
+        'assets/libs/jarallax/dist/jarallax-video.min.js',
+        'assets/libs/jarallax/dist/jarallax-element.min.js',
+        'assets/libs/parallax-js/dist/parallax.min.js',
+        'assets/libs/quill/dist/quill.min.js',
+        'assets/libs/smooth-scroll/dist/smooth-scroll.min.js',
+        'assets/libs/typed.js/lib/typed.min.js',
+        'assets/js/theme.min.js',
+    ],
+    # watch_course only: hls.js 1.x, vendored like the libs above
+    'bundles/player.js': [
+        'assets/libs/hls.js/dist/hls.min.js',
+    ],
+}
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -149,3 +372,22 @@ AUTH_USER_MODEL = "app.Users"
 
 KEY_ID = "rzp_test_RIbecyGHDS1bWa"
 KEY_SECRET = "jaEU60MULOR63PTq1ICY4WJD"
+
+# Payment gateway client (app/gateway.py). PAYMENT_GATEWAY_URL = None is the
+# real Razorpay API; `manage.py payment_gateway_stub` serves a local fake
+# (default http://127.0.0.1:8765) for offline load tests.
+PAYMENT_GATEWAY_URL = None
+PAYMENT_GATEWAY_TIMEOUT = (3.05, 10)     # (connect, read) seconds
+PAYMENT_GATEWAY_POOL_SIZE = 10           # keep-alive connections per worker process
+PAYMENT_GATEWAY_RETRIES = 1              # connect failures, and reads of idempotent calls only
+PAYMENT_GATEWAY_BREAKER = (5, 30)        # open after 5 failures in a row, try again after 30 s
+
+# Gateway webhooks (payments/webhook, app/webhooks.py): the secret entered for
+# the webhook in the Razorpay dashboard. Unset, every delivery is refused.
+# Queued events are applied by `manage.py payment_webhook_worker`.
+PAYMENT_WEBHOOK_SECRET = None
+
+# Teacher dashboard numbers (app/teacher_metrics.py) are cached per teacher and
+# dropped when one of their payments settles or is paid out; the timeout only
+# bounds how stale free-course enrollment counts can get.
+TEACHER_METRICS_TIMEOUT = 5 * 60
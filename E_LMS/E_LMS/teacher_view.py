@@ -3,11 +3,15 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from app.models import *
 from django.http import JsonResponse
+from django.urls import reverse
+from app.media_probe import probe_video
+from app.teacher_metrics import get_teacher_metrics
+from app.uploads import UploadError, start_upload, write_chunk, upload_status, finish_upload, abort_upload
 from E_LMS.views import page_not_found
 from datetime import date
-from django.db.models import Sum
 import re,os
 from django.conf import settings
+from django.core.files.storage import default_storage
 
 FIRST_NAME_REGEX = re.compile(r'^[A-Za-z\s]+$')
 LAST_NAME_REGEX = re.compile(r'^[A-Za-z\s]+$')
@@ -35,32 +39,25 @@ def teacher_dashboard(request):
     teacher = request.user.teacher_profile
 
     # fetch teacher details
-    courses = Course.objects.filter(teacher=teacher)
-    total_courses = courses.count()
-
-    # students enrolled in teacher's courses
-    total_students = Enrollment.objects.filter(course__in=courses).count()
+    courses = Course.objects.filter(teacher=teacher).select_related("course_category", "stats")
 
-    # teacher earnings
-    pending_earnings = TeacherEarning.objects.filter(
-        teacher=teacher, is_paid=False
-    ).aggregate(total=models.Sum("amount"))["total"] or 0
-    recieved_earnings = TeacherEarning.objects.filter(teacher=teacher, is_paid=True).aggregate(total=models.Sum("amount"))["total"] or 0
+    # course/student counts and earnings: one query, cached per teacher
+    metrics = get_teacher_metrics(teacher.id)
 
     context = {
         "teacher": teacher,
         "courses": courses,
-        "total_courses": total_courses,
-        "total_students": total_students,
-        "pending_earnings": pending_earnings,
-        "received_earnings": recieved_earnings
-
-
+        "total_courses": metrics["course_count"],
+        "total_students": metrics["student_count"],
+        "pending_earnings": metrics["pending"],
+        "received_earnings": metrics["received"],
     }
     return render(request, "teacher/teacher_dashboard.html", context)
 
 @login_required
 def edit_teacher_profile(request):
+    if not hasattr(request.user, "teacher_profile"):
+        return page_not_found(request)
     teacher = request.user.teacher_profile  # because of OneToOneField in Teacher
 
     if request.method == "POST":
@@ -243,8 +240,10 @@ def add_course(request):
 
 @login_required
 def my_courses(request):
+    if not hasattr(request.user, "teacher_profile"):
+        return page_not_found(request)
     teacher = request.user.teacher_profile  # Get teacher profile from logged-in user
-    courses = Course.objects.filter(teacher=teacher).order_by('-id')  # Fetch courses by this teacher
+    courses = Course.objects.filter(teacher=teacher).select_related('course_category', 'level').order_by('-id')  # Fetch courses by this teacher
 
     context = {
         'courses': courses,
@@ -253,6 +252,8 @@ def my_courses(request):
 
 @login_required
 def edit_course(request, course_id):
+    if not hasattr(request.user, "teacher_profile"):
+        return page_not_found(request)
     teacher = request.user.teacher_profile
 
     try:
@@ -355,15 +356,16 @@ def edit_course(request, course_id):
         course.price = price
         course.discount = discount
 
-        #Delete old image if a new one is uploaded
+        old_image = None
         if course_image:
-            if course.course_image and course.course_image.name:  # existing file
-                old_path = os.path.join(settings.MEDIA_ROOT, course.course_image.name)
-                if os.path.exists(old_path):
-                    os.remove(old_path)
+            old_image = course.course_image.name if course.course_image else None
             course.course_image = course_image
 
         course.save()
+        #Release the old image once the new one is saved: drops one alias of
+        #its blob, and the bytes only go with the last reference
+        if old_image and old_image != course.course_image.name:
+            default_storage.delete(old_image)
         messages.success(request, 'Course updated successfully.')
         return redirect('my_coursess')
 
@@ -418,6 +420,30 @@ def add_lesson(request):
     courses = Course.objects.filter(teacher=teacher)
     return render(request, 'teacher/add_lesson.html', {'courses': courses})
 
+def video_details_errors(title, time_duration):
+    errors = []
+    if title and not TITLE_REGEX.match(title):
+        errors.append("Title contains invalid characters.")
+    if time_duration:
+        if not TIME_REGEX.match(time_duration):
+            errors.append("Time duration must be a valid number (e.g., 5, 10.5).")
+        else:
+            try:
+                minutes = float(time_duration)
+                if minutes <= 0:
+                    errors.append("Time duration must be greater than 0 minutes.")
+            except ValueError:
+                errors.append("Enter a valid numeric time duration.")
+    return errors
+
+def video_file_errors(filename, size):
+    vid_ext = filename.split('.')[-1].lower()
+    if vid_ext not in VIDEO_EXTS:
+        return ["Video file must be in MP4, MKV, WEBM, or MOV format."]
+    if size > MAX_VIDEO_BYTES:
+        return ["Video file is too large (max 500 MB)."]
+    return []
+
 @login_required
 def add_video(request):
     try:
@@ -452,8 +478,6 @@ def add_video(request):
             errors.append("Please select a lesson.")
         if not title:
             errors.append("Please enter a video title.")
-        if not time_duration:
-            errors.append("Please enter the time duration in minutes.")
         if not video_file:
             errors.append("Please upload a video file.")
         if not thumbnail:
@@ -463,18 +487,7 @@ def add_video(request):
         # Format and type validation
         # ------------------------------
 
-        if title and not TITLE_REGEX.match(title):
-            errors.append("Title contains invalid characters.")
-        if time_duration:
-            if not TIME_REGEX.match(time_duration):
-                errors.append("Time duration must be a valid number (e.g., 5, 10.5).")
-            else:
-                try:
-                    minutes = float(time_duration)
-                    if minutes <= 0:
-                        errors.append("Time duration must be greater than 0 minutes.")
-                except ValueError:
-                    errors.append("Enter a valid numeric time duration.")
+        errors += video_details_errors(title, time_duration)
 
         # ------------------------------
         # Thumbnail validation (optional)
@@ -490,11 +503,13 @@ def add_video(request):
         # Video file validation
         # ------------------------------
         if video_file:
-            vid_ext = video_file.name.split('.')[-1].lower()
-            if vid_ext not in VIDEO_EXTS:
-                errors.append("Video file must be in MP4, MKV, WEBM, or MOV format.")
-            elif video_file.size > MAX_VIDEO_BYTES:
-                errors.append("Video file is too large (max 500 MB).")
+            errors += video_file_errors(video_file.name, video_file.size)
+
+        # Duration/resolution are read from the file headers; the typed
+        # duration is only needed when the container can't be parsed
+        media_info = probe_video(video_file) if video_file and not errors else None
+        if media_info is None and not time_duration:
+            errors.append("Please enter the time duration in minutes.")
 
         # ------------------------------
         # If validation fails → show errors
@@ -548,7 +563,7 @@ def add_video(request):
         # ------------------------------
         # Create video record
         # ------------------------------
-        Video.objects.create(
+        video = Video(
             course=course,
             lesson=lesson,
             serial_number=int(serial_number),
@@ -557,6 +572,9 @@ def add_video(request):
             thumbnail=thumbnail,
             video_file=video_file,
         )
+        if media_info:
+            video.apply_media_info(media_info)
+        video.save()
 
         messages.success(request, "Video added successfully.")
         return redirect('teacher_dashboard')
@@ -571,11 +589,117 @@ def add_video(request):
     }
     return render(request, 'teacher/add_video.html', context)
 
+# ------------------------------
+# Resumable video upload API (app/uploads.py), used by add_video.html:
+#   POST   upload/video/                       -> start, returns upload_id + chunk_size
+#   PUT    upload/video/<id>/chunk/<index>/    -> raw chunk body, X-Chunk-Sha256 header
+#   GET    upload/video/<id>/                  -> received chunk indexes (to resume)
+#   DELETE upload/video/<id>/                  -> abort
+#   POST   upload/video/<id>/finish/           -> thumbnail, creates the Video
+# ------------------------------
+def _teacher_upload(request, upload_id):
+    # by teacher__user so a chunk PUT doesn't also load the teacher profile
+    return VideoUpload.objects.filter(id=upload_id, teacher__user=request.user).select_related('lesson__course').first()
+
+@login_required
+def video_upload_start(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': "POST required."}, status=405)
+    teacher = getattr(request.user, "teacher_profile", None)
+    if teacher is None:
+        return JsonResponse({'error': "Only teachers can upload videos."}, status=403)
+
+    lesson_id = request.POST.get('lesson', '').strip()
+    serial_number = request.POST.get('serial_number', '').strip()
+    title = request.POST.get('title', '').strip()
+    time_duration = request.POST.get('time_duration', '').strip() or None
+    filename = request.POST.get('filename', '').strip()
+    size = request.POST.get('size', '').strip()
+
+    errors = []
+    if not lesson_id:
+        errors.append("Please select a lesson.")
+    if not title:
+        errors.append("Please enter a video title.")
+    if not filename or not size.isdigit() or int(size) == 0:
+        errors.append("Please upload a video file.")
+    if not serial_number.isdigit():
+        errors.append("Invalid serial number.")
+    errors += video_details_errors(title, time_duration)
+    if filename and size.isdigit():
+        errors += video_file_errors(filename, int(size))
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    lesson = Lesson.objects.filter(id=lesson_id, course__teacher=teacher).select_related('course__teacher__user').first()
+    if lesson is None:
+        return JsonResponse({'errors': ["Invalid lesson selected."]}, status=400)
+    if Video.objects.filter(lesson=lesson, serial_number=serial_number).exists():
+        return JsonResponse({'errors': ["A video with this serial number already exists in the selected lesson."]}, status=400)
+
+    upload = start_upload(
+        teacher, lesson, int(serial_number), title,
+        int(float(time_duration)) if time_duration else None, filename, int(size)
+    )
+    return JsonResponse(upload_status(upload), status=201)
+
+@login_required
+def video_upload_chunk(request, upload_id, index):
+    if request.method != 'PUT':
+        return JsonResponse({'error': "PUT required."}, status=405)
+    upload = _teacher_upload(request, upload_id)
+    if upload is None:
+        return JsonResponse({'error': "Upload not found."}, status=404)
+    try:
+        write_chunk(upload, index, request, request.headers.get('X-Chunk-Sha256', ''))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return JsonResponse({'index': index, 'received': True})
+
+@login_required
+def video_upload_detail(request, upload_id):
+    upload = _teacher_upload(request, upload_id)
+    if upload is None:
+        return JsonResponse({'error': "Upload not found."}, status=404)
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        return JsonResponse({'aborted': True})
+    return JsonResponse(upload_status(upload))
+
+@login_required
+def video_upload_finish(request, upload_id):
+    if request.method != 'POST':
+        return JsonResponse({'error': "POST required."}, status=405)
+    upload = _teacher_upload(request, upload_id)
+    if upload is None:
+        return JsonResponse({'error': "Upload not found."}, status=404)
+
+    thumbnail = request.FILES.get('thumbnail')
+    if not thumbnail:
+        return JsonResponse({'error': "Please upload a Thumbnail Image."}, status=400)
+    thumb_ext = thumbnail.name.split('.')[-1].lower()
+    if thumb_ext not in THUMB_EXTS:
+        return JsonResponse({'error': "Thumbnail must be an image (JPG, JPEG, PNG, WEBP)."}, status=400)
+    if thumbnail.size > MAX_THUMB_BYTES:
+        return JsonResponse({'error': "Thumbnail file is too large (max 2 MB)."}, status=400)
+
+    time_duration = request.POST.get('time_duration', '').strip() or None
+    errors = video_details_errors('', time_duration)
+    if errors:
+        return JsonResponse({'error': errors[0]}, status=400)
+
+    try:
+        video = finish_upload(upload, thumbnail, int(float(time_duration)) if time_duration else None)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+
+    messages.success(request, "Video added successfully.")
+    return JsonResponse({'video_id': video.id, 'redirect': reverse('teacher_dashboard')}, status=201)
+
 @login_required
 def get_lessons_ajax(request, course_id):
-    teacher = request.user
     # Check that the course belongs to the teacher before returning lessons
-    lessons = Lesson.objects.filter(course_id=course_id, course__teacher=teacher).values('id', 'name')
+    lessons = Lesson.objects.filter(course_id=course_id, course__teacher__user=request.user).values('id', 'name')
     lessons_list = list(lessons)
     return JsonResponse({'lessons': lessons_list})
 
@@ -641,24 +765,22 @@ def teacher_earnings(request):
     teacher = request.user.teacher_profile
     filter_type = request.GET.get("filter", "all")  # default to "all"
 
-    earnings = TeacherEarning.objects.filter(teacher=teacher).select_related('course', 'payment')
+    earnings = TeacherEarning.objects.filter(teacher=teacher).select_related('course', 'payment__student__user')
 
     if filter_type == "received":
         earnings = earnings.filter(is_paid=True)
     elif filter_type == "pending":
         earnings = earnings.filter(is_paid=False)
 
-    # Aggregate total received and pending
-    received_total = TeacherEarning.objects.filter(teacher=teacher, is_paid=True).aggregate(total=Sum("amount"))["total"] or 0
-    pending_total = TeacherEarning.objects.filter(teacher=teacher, is_paid=False).aggregate(total=Sum("amount"))["total"] or 0
-    total_earnings = received_total + pending_total
+    # Totals received and pending (cached with the dashboard numbers)
+    metrics = get_teacher_metrics(teacher.id)
 
     context = {
         "earnings": earnings.order_by('-id'),
         "filter_type": filter_type,
-        "received_total": received_total,
-        "pending_total": pending_total,
-        "total_earnings": total_earnings,
+        "received_total": metrics["received"],
+        "pending_total": metrics["pending"],
+        "total_earnings": metrics["total"],
     }
 
     return render(request, "teacher/teacher_earnings.html", context)
\ No newline at end of file
@@ -26,7 +26,7 @@ urlpatterns = [
     path('404', views.page_not_found, name='page_not_found'),
     path('', views.home, name='home'),
     path('courses/all', views.courses_all, name='all_courses'),
-    # path('filter-data/', views.courses_filter_data, name='courses_filter_data'),
+    path('filter-data/', views.courses_filter_data, name='courses_filter_data'),
     path('search', views.search, name='search'),
     path('courses/<slug:slug>', views.course_details, name='course_details'),
     path('contact', views.contactUs, name='contact'),
@@ -43,6 +43,10 @@ urlpatterns = [
     path('edit-course/<int:course_id>/', teacher_view.edit_course, name='edit_course'),
     path('add-lesson/', teacher_view.add_lesson, name='add_lesson'),
     path('add-video/', teacher_view.add_video, name='add_video'),
+    path('upload/video/', teacher_view.video_upload_start, name='video_upload_start'),
+    path('upload/video/<uuid:upload_id>/', teacher_view.video_upload_detail, name='video_upload_detail'),
+    path('upload/video/<uuid:upload_id>/chunk/<int:index>/', teacher_view.video_upload_chunk, name='video_upload_chunk'),
+    path('upload/video/<uuid:upload_id>/finish/', teacher_view.video_upload_finish, name='video_upload_finish'),
     path('ajax/get-lessons/<int:course_id>/', teacher_view.get_lessons_ajax, name='get_lessons_ajax'),
     path('ajax/get-next-serial/', teacher_view.get_next_serial_number, name='get_next_serial_number'),
     path('teacher/enrolled-students/', teacher_view.enrolled_students, name='enrolled_students'),
@@ -67,6 +71,12 @@ urlpatterns = [
     path('checkout/<slug:slug>', views.checkout, name='checkout'),
     path('my-courses', views.my_courses, name='my_courses'),
     path('verify_payment', views.verify_payment, name='verify_payment'),
+    path('payments/webhook', views.payment_webhook, name='payment_webhook'),
     path('courses/watch-course/<slug:slug>', views.watch_course, name='watch_course'),
+    path('videos/<int:video_id>/stream', views.stream_video, name='stream_video'),
+    path('videos/<int:video_id>/hls/<str:path>', views.stream_hls, name='stream_hls'),
+    path('videos/<int:video_id>/signed/<str:token>/<path:name>', views.stream_signed, name='stream_signed'),
+    path('media/auth', views.media_auth, name='media_auth'),
+    path('img/<int:width>/<str:fmt>/<path:name>', views.image_rendition, name='image_rendition'),
 
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,18 +1,31 @@
 from time import time
 from app.models import *
+from app.catalog import keyset_page, with_card_stats, parse_filters, apply_filters, facet_counts
+from app.search import search_courses
+from app.page_cache import cache_anonymous_page
+from app.curriculum import get_curriculum, find_video
+from app.streaming import stream_grant, serve_media_file
+from app.transcode_queue import HLS_FILE_REGEX, hls_dir_name
+from app.media_tokens import check_token, sign_curriculum
+from app.resumes import PdfUploadHandler
+from app.payments import settle_payment
+from app.gateway import GatewayUnavailable, get_gateway
+from app.webhooks import record_event, signature_valid
+from app.renditions import FORMATS as RENDITION_FORMATS, generate_renditions, is_fresh, is_known_image, rendition_name, rendition_widths
+from django.core.exceptions import SuspiciousFileOperation
 from django.utils import timezone
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect, render
-from django.db.models import Sum
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseNotFound, JsonResponse
+from django.urls import Resolver404, resolve
+from urllib.parse import unquote, urlsplit
+from django.template.loader import render_to_string
 from django.conf import settings
-import razorpay
-from django.views.decorators.csrf import csrf_exempt
-from decimal import Decimal
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.db import transaction
 import re
 
-client = razorpay.Client(auth=(settings.KEY_ID, settings.KEY_SECRET))
-
 NAME_REGEX = re.compile(r'^[A-Za-z0-9\s]+$')          # letters, numbers, spaces
 EMAIL_REGEX = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
 MOBILE_REGEX = re.compile(r'^[0-9]{10}$')             # exactly 10 digits
@@ -23,58 +36,65 @@ CITY_REGEX = re.compile(r'^[A-Za-z\s]+$')
 STATE_REGEX = re.compile(r'^[A-Za-z\s]+$')
 POSTAL_CODE_REGEX = re.compile(r'^[0-9]{6}$')
 
-# 🔹 Helper function to avoid repeating the same code
-def get_common_context():
-    category = Categories.objects.all().order_by('id')
-    courses = Course.objects.all().order_by('id')
-    return {
-        'category': category,
-        'courses': courses,
-    }
-
+# Header categories/courses come from the `navigation` context processor (cached)
 def base(request):
-    context = get_common_context()
-    return render(request, 'base.html', context)
+    return render(request, 'base.html')
 
+@cache_anonymous_page('home')
 def home(request):
-    context = get_common_context()
-    context['category'] = Categories.objects.all().order_by('id')[0:5]  # limit 5
-    context['courses'] = Course.objects.all().order_by('id')[0:5]      # limit 5
+    context = {
+        'category': Categories.objects.all().order_by('id')[0:5],  # limit 5
+        'courses': with_card_stats(Course.objects.all()).order_by('id')[0:5],  # limit 5
+    }
 
     return render(request, "main/index.html", context)
 
+@cache_anonymous_page('courses_all')
 def courses_all(request):
-    context = get_common_context()
+    # Keyset pagination: ?after=<id> / ?before=<id>, counts annotated per card
+    context = keyset_page(
+        with_card_stats(Course.objects.all()),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
     context['levels'] = Level.objects.all().order_by('id')
     return render(request, "main/courses_all.html", context)
 
+def courses_filter_data(request):
+    filters = parse_filters(request.GET)
+    page = keyset_page(
+        with_card_stats(apply_filters(Course.objects.all(), filters)),
+        after=request.GET.get('after'),
+    )
+    facets, total = facet_counts(filters)
+    html = render_to_string('ajax/course.html', {'courses': page['courses']}, request=request)
+    return JsonResponse({
+        'data': html,
+        'facets': facets,
+        'count': total,
+        'next_cursor': page['next_cursor'],
+    })
+
+@cache_anonymous_page('contact')
 def contactUs(request):
-    context = get_common_context()
-    return render(request, "main/contact_us.html", context)
+    return render(request, "main/contact_us.html")
 
+@cache_anonymous_page('about')
 def aboutUs(request):
-    context = get_common_context()
-    return render(request, "main/about_us.html", context)
+    return render(request, "main/about_us.html")
 
 def search(request):
-    context = get_common_context()
-    search_item = request.GET['search']
-    context['courses'] = Course.objects.filter(title__icontains = search_item)
-    # print(courses)
-    # context = {
-    #     'courses': courses,
-    # }
+    query = request.GET.get('search', '').strip()
+    context = search_courses(query, page=request.GET.get('page'))
+    context['category'] = Categories.objects.all().order_by('id')
+    context['query'] = query
     return render(request, "search/search.html", context)
 
 @login_required
 def course_details(request, slug):
-    context = get_common_context()
-
-    course = Course.objects.prefetch_related("lesson_set__video_set").filter(slug=slug).first()
+    course = Course.objects.select_related("stats", "teacher__user", "course_category", "level", "language").filter(slug=slug).first()
     if not course:
-        return render(request, 'error/404.html', context, status=404)
-
-    time_duration = Video.objects.filter(course__slug=slug).aggregate(sum=Sum('time_duration'))
+        return render(request, 'error/404.html', status=404)
 
     # Get student profile
     try:
@@ -88,24 +108,21 @@ def course_details(request, slug):
     if is_enrolled:
         messages.info(request, "You are already enrolled in this course.")
 
-    context.update({
+    context = {
         'course': course,
-        'lessons': course.lesson_set.all().order_by("id"),
-        'time_duration': time_duration,
+        'curriculum': get_curriculum(course.id),
         'is_enrolled': is_enrolled,
-    })
+    }
     return render(request, "course/course_details.html", context)
 
 def page_not_found(request):
-    context = get_common_context()
-    return render(request, 'error/404.html', context)
+    return render(request, 'error/404.html')
 
 @login_required
 def checkout(request, slug):
     course = Course.objects.filter(slug=slug).first()
     if not course:
-        context = get_common_context()
-        return render(request, 'error/404.html', context, status=404)
+        return render(request, 'error/404.html', status=404)
 
     action = request.GET.get('action')
     context = {'course': course, 'order': None}
@@ -149,10 +166,8 @@ def checkout(request, slug):
         phone = request.POST.get('phone')
         email = request.POST.get('email')
 
-        amount = course.price
-        discount = (amount * course.discount) / 100
-        order_amount = amount - discount
-        raz_order_amount = int(order_amount * 100)
+        order_amount = course.sale_price
+        raz_order_amount = int(order_amount * 100)  # paise
 
 
         if not first_name or not last_name or not country_code or not address_1 or not city or not state or not zip_code or not phone:
@@ -184,12 +199,16 @@ def checkout(request, slug):
             return redirect('checkout',slug=course.slug)
 
         receipt = f"ELMS-{int(time())}"
-        order = client.order.create({
-            'receipt': receipt,
-            'notes': {"name": f"{first_name} {last_name}"},
-            'amount': raz_order_amount,
-            'currency': 'INR',
-        })
+        try:
+            order = get_gateway().create_order({
+                'receipt': receipt,
+                'notes': {"name": f"{first_name} {last_name}"},
+                'amount': raz_order_amount,
+                'currency': 'INR',
+            })
+        except GatewayUnavailable:
+            messages.error(request, 'Payments are temporarily unavailable. Please try again in a few minutes.')
+            return redirect('checkout', slug=course.slug)
 
         Payment.objects.create(
             student=student,
@@ -212,11 +231,10 @@ def my_courses(request):
         messages.error(request, "You must be logged in as a student to view your courses.")
         return redirect('doLogin')
 
-    enrollments = Enrollment.objects.filter(student=student).select_related('course')
+    enrollments = Enrollment.objects.filter(student=student).select_related('course__teacher__user', 'course__course_category')
     courses = [enrollment.course for enrollment in enrollments]
 
-    context = get_common_context()
-    context['courses'] = courses
+    context = {'courses': courses}
 
     return render(request, 'course/my_course.html', context)
 
@@ -225,43 +243,16 @@ def verify_payment(request):
     if request.method == 'POST':
         data = request.POST
         try:
-            client.utility.verify_payment_signature({
+            get_gateway().verify_payment_signature({
                 'razorpay_order_id': data.get('razorpay_order_id'),
                 'razorpay_payment_id': data.get('razorpay_payment_id'),
                 'razorpay_signature': data.get('razorpay_signature'),
             })
 
-            payment = Payment.objects.filter(order_id=data.get('razorpay_order_id')).first()
+            # Idempotent: a replayed callback for a settled order writes nothing
+            payment, _ = settle_payment(data.get('razorpay_order_id'), data.get('razorpay_payment_id'))
             if not payment:
-                context = get_common_context()
-                return render(request, 'error/404.html', context, status=404)
-
-            payment.transaction_id = data.get('razorpay_payment_id')
-            payment.status = 'successful'
-            payment.save()
-
-            Enrollment.objects.get_or_create(
-                student=payment.student,
-                course=payment.course,
-                payment=payment
-            )
-            teacher_amount = (Decimal('0.8') * payment.amount_paid).quantize(Decimal('0.01'))
-            admin_amount = (Decimal('0.2') * payment.amount_paid).quantize(Decimal('0.01'))
-            # Save teacher earning
-            TeacherEarning.objects.create(
-                teacher=payment.course.teacher,
-                course=payment.course,
-                payment=payment,
-                amount=teacher_amount,
-                is_paid=False  # initially False
-            )
-
-            # Save admin earning
-            AdminEarning.objects.create(
-                course=payment.course,
-                payment=payment,
-                commission_amount=admin_amount
-            )
+                return render(request, 'error/404.html', status=404)
 
             return render(request, 'verify_payment/success.html', {'payment': payment})
 
@@ -271,38 +262,122 @@ def verify_payment(request):
 
     return render(request, 'verify_payment/fail.html')
 
+@csrf_exempt
+def payment_webhook(request):
+    # Signed by the gateway, not the browser. Only queue the event here; the
+    # payment_webhook_worker command settles it, so gateway retries during a
+    # sale cost one INSERT each instead of a web worker's full settlement.
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    body = request.body
+    if not signature_valid(body, request.headers.get('X-Razorpay-Signature', '')):
+        return HttpResponseForbidden()
+    try:
+        record_event(body, request.headers.get('X-Razorpay-Event-Id'))
+    except UnicodeDecodeError:
+        return HttpResponseBadRequest()
+    return HttpResponse()
+
 @login_required
 def watch_course(request, slug):
     lecture_id = request.GET.get("lecture")
-    course = Course.objects.filter(slug=slug).first()
+    course = Course.objects.select_related("course_category").filter(slug=slug).first()
 
     if not course:
         return render(request, "error/404.html")
 
-    # Check enrollment
+    # Check enrollment (teachers and admins have no student profile)
+    student = getattr(request.user, "student_profile", None)
     try:
-        enrollment = Enrollment.objects.get(student=request.user.student_profile, course=course)
+        enrollment = Enrollment.objects.get(student=student, course=course)
     except Enrollment.DoesNotExist:
         messages.error(request, "You are not enrolled in this course.")
         return redirect("course_details", slug=slug)
 
-    # Get selected video or first available
-    if lecture_id:
-        video = Video.objects.filter(id=lecture_id, lesson__course=course).first()
-    else:
-        video = Video.objects.filter(course=course).order_by("serial_number").first()
-
-    if not video:
-        video = None
+    # Selected video (or the first one) comes from the cached curriculum tree;
+    # its URLs are signed for this user, so playback needs no further checks
+    curriculum = sign_curriculum(get_curriculum(course.id), request.user.id)
+    video = find_video(curriculum, lecture_id)
 
-    context = get_common_context()
-    context.update({
+    context = {
         "course": course,
+        "curriculum": curriculum,
         "video": video,
-    })
+    }
     return render(request, "course/watch_course.html", context)
 
+@login_required
+def stream_video(request, video_id):
+    name = stream_grant(request.user, video_id)
+    if not name:
+        return HttpResponseNotFound()
+
+    response = serve_media_file(request, name)
+    if response is None:
+        return HttpResponseNotFound()
+    return response
+
+def image_rendition(request, width, fmt, name):
+    # Resized course images / thumbnails; generated on first request if missing
+    if width not in rendition_widths() or fmt not in RENDITION_FORMATS or '..' in name.split('/'):
+        return HttpResponseNotFound()
+    try:
+        if not is_fresh(name, width, fmt):
+            if not is_known_image(name):
+                return HttpResponseNotFound()
+            generate_renditions(name)
+    except (OSError, SuspiciousFileOperation):
+        return HttpResponseNotFound()
+
+    response = serve_media_file(request, rendition_name(name, width, fmt))
+    if response is None:
+        return HttpResponseNotFound()
+    response['Cache-Control'] = 'public, max-age=604800'
+    return response
+
+@login_required
+def stream_hls(request, video_id, path):
+    # Playlists and segments of the HLS ladder, behind the same access check
+    if not HLS_FILE_REGEX.match(path) or not stream_grant(request.user, video_id):
+        return HttpResponseNotFound()
+
+    response = serve_media_file(request, f"{hls_dir_name(video_id)}/{path}")
+    if response is None:
+        return HttpResponseNotFound()
+    return response
+
+def stream_signed(request, video_id, token, name):
+    # URLs issued by watch_course: the HMAC token is the whole access check,
+    # so range requests touch neither the session nor the database
+    if not check_token(token, video_id, name):
+        return HttpResponseForbidden()
+
+    response = serve_media_file(request, name)
+    if response is None:
+        return HttpResponseNotFound()
+    return response
+
+def media_auth(request):
+    # auth_request subrequest from nginx (or forward-auth in other proxies):
+    # 204 lets the front-end server send a signed file itself, 403 refuses it
+    try:
+        match = resolve(unquote(urlsplit(request.headers.get('X-Original-URI', '')).path))
+    except Resolver404:
+        return HttpResponseForbidden()
+    if match.url_name != 'stream_signed' or not check_token(**match.kwargs):
+        return HttpResponseForbidden()
+    return HttpResponse(status=204)
+
+@csrf_exempt
 def apply_as_teacher(request):
+    # The resume is checked while it streams in, so the handler has to be in
+    # place before anything (including the CSRF check) parses request.POST
+    resume_check = PdfUploadHandler(request)
+    request.upload_handlers.insert(0, resume_check)
+    return _apply_as_teacher(request, resume_check)
+
+@csrf_protect
+def _apply_as_teacher(request, resume_check):
     if request.method == 'POST':
         username = request.POST.get('username', '').strip()
         first_name = request.POST.get('first_name', '').strip()
@@ -361,7 +436,11 @@ def apply_as_teacher(request):
             messages.error(request, "This email has already been used to apply as a teacher.")
             return redirect('apply_as_teacher')
 
-        # Resume must be PDF
+        # Resume must be a PDF (signature and size checked during upload)
+        if resume_check.error:
+            messages.error(request, resume_check.error)
+            return redirect('apply_as_teacher')
+
         if not resume:
             messages.error(request, "Please upload your resume.")
             return redirect('apply_as_teacher')
@@ -370,17 +449,21 @@ def apply_as_teacher(request):
             messages.error(request, "Resume must be a PDF file.")
             return redirect('apply_as_teacher')
 
-        # Save application
-        TeacherApplication.objects.create(
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            contact_no=contact_no,
-            qualification=qualification,
-            experience=experience,
-            resume=resume
-        )
+        # Save application; the id is needed for the resume's folder, so the
+        # row comes first and the file goes straight to its final path.
+        # Page count and text are filled in later by `manage.py resume_worker`.
+        with transaction.atomic():
+            application = TeacherApplication.objects.create(
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                email=email,
+                contact_no=contact_no,
+                qualification=qualification,
+                experience=experience,
+                resume_size=resume.size,
+            )
+            application.resume.save(resume.name, resume)
 
         messages.success(request, "Your application has been submitted successfully.")
         return redirect('home')
@@ -34,7 +34,8 @@ class VideoInline(admin.TabularInline):
 # ----------------- COURSE -----------------
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ('title', 'teacher', 'price', 'course_category', 'level')
+    list_display = ('title', 'teacher', 'price', 'sale_price', 'course_category', 'level')
+    readonly_fields = ('sale_price',)  # derived from price/discount on save
     search_fields = ('title', 'teacher__user__username')
     list_filter = ('course_category', 'level')
     prepopulated_fields = {"slug": ("title",)}
@@ -88,3 +89,15 @@ class TeacherApplicationAdmin(admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'email', 'status', 'applied_on')
     search_fields = ('first_name', 'last_name', 'email', 'username')
     list_filter = ('status', 'applied_on')
+
+
+@admin.register(TranscodeJob)
+class TranscodeJobAdmin(admin.ModelAdmin):
+    list_display = ('video', 'status', 'attempts', 'locked_by', 'updated_at')
+    list_filter = ('status',)
+    readonly_fields = ('manifest_name', 'renditions', 'error', 'locked_by', 'locked_at')
+
+@admin.register(CourseStats)
+class CourseStatsAdmin(admin.ModelAdmin):
+    list_display = ('course', 'lesson_count', 'video_count', 'total_duration', 'enrollment_count', 'gross_revenue')
+    search_fields = ('course__title',)
@@ -0,0 +1,25 @@
+from django.core.cache import cache
+
+# Versioned cache namespaces: bumping a version orphans every key built with the
+# old one, so invalidation is a single INCR instead of a key scan.
+VERSION_KEY = "version:{name}"
+
+
+def get_version(name):
+    key = VERSION_KEY.format(name=name)
+    version = cache.get(key)
+    if version is None:
+        # add() so concurrent workers agree on the first version
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(name):
+    key = VERSION_KEY.format(name=name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # key expired or was never set
+        cache.set(key, 1, timeout=None)
+        return 1
@@ -0,0 +1,161 @@
+from decimal import Decimal, InvalidOperation
+from django.db.models import BooleanField, Case, Count, F, Value, When
+from django.db.models.functions import Coalesce
+from .models import Categories, Course, Language, Level
+
+CATALOG_PAGE_SIZE = 12
+
+
+def with_card_stats(queryset):
+    """
+    Annotate video_count, lesson_count and total_duration on each course (read
+    from the denormalized CourseStats row) and pull the teacher/category used by
+    the cards, so a page of cards is a single query.
+    """
+    return queryset.select_related('teacher__user', 'course_category').annotate(
+        video_count=Coalesce(F('stats__video_count'), 0),
+        lesson_count=Coalesce(F('stats__lesson_count'), 0),
+        total_duration=Coalesce(F('stats__total_duration'), 0),
+    )
+
+
+def _parse_cursor(value):
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, after=None, before=None, size=CATALOG_PAGE_SIZE):
+    """
+    Cursor pagination on Course.id. `after` walks forward, `before` walks back.
+    Only size + 1 rows are read, whatever the offset into the catalog.
+    """
+    after = _parse_cursor(after)
+    before = _parse_cursor(before)
+
+    if before is not None:
+        rows = list(queryset.filter(id__lt=before).order_by('-id')[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size][::-1]
+        has_next, has_prev = True, has_more
+    else:
+        if after is not None:
+            queryset = queryset.filter(id__gt=after)
+        rows = list(queryset.order_by('id')[:size + 1])
+        has_next = len(rows) > size
+        rows = rows[:size]
+        has_prev = after is not None
+
+    return {
+        'courses': rows,
+        'next_cursor': rows[-1].id if rows and has_next else None,
+        'prev_cursor': rows[0].id if rows and has_prev else None,
+    }
+
+
+# ------------------------------------------------------------------
+# Faceted filtering (category / level / language / price / discount)
+# ------------------------------------------------------------------
+FACET_FIELDS = {
+    'category': 'course_category_id',
+    'level': 'level_id',
+    'language': 'language_id',
+}
+
+
+def _id_list(values):
+    ids = []
+    for value in values:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def _decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        d = Decimal(value)
+    except InvalidOperation:
+        return None
+    # NaN / Infinity parse fine but aren't prices
+    return d if d.is_finite() else None
+
+
+def parse_filters(params):
+    """Read filters from a QueryDict: ?category=1&category=2&level=..&price_min=..&discount=1"""
+    filters = {dim: _id_list(params.getlist(dim)) for dim in FACET_FIELDS}
+    filters['price_min'] = _decimal(params.get('price_min'))
+    filters['price_max'] = _decimal(params.get('price_max'))
+    filters['discount'] = params.get('discount') in ('1', 'true', 'on')
+    return filters
+
+
+def _price_range(queryset, filters):
+    # effective (discounted) price, indexed on Course.sale_price
+    if filters['price_min'] is not None:
+        queryset = queryset.filter(sale_price__gte=filters['price_min'])
+    if filters['price_max'] is not None:
+        queryset = queryset.filter(sale_price__lte=filters['price_max'])
+    return queryset
+
+
+def apply_filters(queryset, filters):
+    queryset = _price_range(queryset, filters)
+    for dim, field in FACET_FIELDS.items():
+        if filters[dim]:
+            queryset = queryset.filter(**{f'{field}__in': filters[dim]})
+    if filters['discount']:
+        queryset = queryset.filter(discount__gt=0)
+    return queryset
+
+
+def _matches(dim, value, filters):
+    if dim == 'discount':
+        return value or not filters['discount']
+    return not filters[dim] or value in filters[dim]
+
+
+def facet_counts(filters):
+    """
+    Counts for every facet value from ONE grouped query.
+
+    Rows are grouped by (category, level, language, discounted) inside the price
+    range; each dimension is then rolled up in Python while applying the *other*
+    dimensions' filters, so a sidebar option shows how many results picking it
+    would give. Returns (facets, total matching courses).
+    """
+    rows = (
+        _price_range(Course.objects.order_by(), filters)
+        .annotate(discounted=Case(When(discount__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField()))
+        .values(*FACET_FIELDS.values(), 'discounted')
+        .annotate(n=Count('id'))
+    )
+    dims = list(FACET_FIELDS) + ['discount']
+    counts = {dim: {} for dim in dims}
+    total = 0
+    for row in rows:
+        key = {dim: row[field] for dim, field in FACET_FIELDS.items()}
+        key['discount'] = row['discounted']
+        hits = {dim: _matches(dim, key[dim], filters) for dim in dims}
+        if all(hits.values()):
+            total += row['n']
+        for dim in dims:
+            if all(hit for other, hit in hits.items() if other != dim):
+                counts[dim][key[dim]] = counts[dim].get(key[dim], 0) + row['n']
+
+    facets = {}
+    for dim, model in (('category', Categories), ('level', Level), ('language', Language)):
+        facets[dim] = [
+            {'id': pk, 'name': name, 'count': counts[dim].get(pk, 0), 'selected': pk in filters[dim]}
+            for pk, name in model.objects.order_by('id').values_list('id', 'name')
+        ]
+    facets['discount'] = {
+        'discounted': counts['discount'].get(True, 0),
+        'full_price': counts['discount'].get(False, 0),
+        'selected': filters['discount'],
+    }
+    return facets, total
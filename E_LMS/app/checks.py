@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Versioned invalidation and the page rebuild lock only work if every worker shares the cache."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if not backend.endswith('.LocMemCache'):
+        return []
+    return [Warning(
+        "The default cache is LocMemCache, which is private to each process: with more than one "
+        "worker, edits don't invalidate other workers' pages, navigation or curriculum, and every "
+        "worker rebuilds the same page.",
+        hint="Set REDIS_URL (or another shared backend in CACHES) or run a single worker process.",
+        id='app.W001',
+    )]
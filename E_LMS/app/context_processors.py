@@ -0,0 +1,13 @@
+from django.utils.functional import SimpleLazyObject
+from .navigation import get_navigation
+from .cache_versions import get_version
+from .page_cache import PAGE_VERSION
+
+
+def navigation(request):
+    # Lazy so pages that don't include the header never touch the cache
+    return {
+        'nav_categories': SimpleLazyObject(get_navigation),
+        # part of every {% cache %} fragment key, see templates/main/*.html
+        'page_version': SimpleLazyObject(lambda: get_version(PAGE_VERSION)),
+    }
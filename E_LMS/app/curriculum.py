@@ -0,0 +1,81 @@
+from django.core.cache import cache
+from django.urls import reverse
+from .models import Lesson, TranscodeJob, Video
+from .transcoding import MASTER_PLAYLIST
+from .cache_versions import get_version, bump_version
+
+CURRICULUM_KEY = "curriculum:{course_id}:v{version}"
+CURRICULUM_TIMEOUT = 60 * 60
+
+
+def _version_name(course_id):
+    return f"curriculum:{course_id}"
+
+
+def bump_curriculum_version(course_id):
+    if course_id:
+        bump_version(_version_name(course_id))
+
+
+def build_curriculum(course_id):
+    """
+    Ordered lesson -> video tree for one course in two queries, with totals
+    computed from the loaded rows. Plain dicts only, so the result is cacheable.
+    """
+    lessons = []
+    by_id = {}
+    for lesson in Lesson.objects.filter(course_id=course_id).order_by('id').values('id', 'name'):
+        lesson.update(videos=[], duration=0)
+        by_id[lesson['id']] = lesson
+        lessons.append(lesson)
+
+    videos = (
+        Video.objects.filter(lesson__course_id=course_id)
+        .order_by('serial_number', 'id')
+        .values('id', 'lesson_id', 'title', 'serial_number', 'time_duration', 'video_file', 'transcode__status')
+    )
+    video_count = total_duration = 0
+    for video in videos:
+        lesson = by_id.get(video.pop('lesson_id'))
+        if lesson is None:
+            continue
+        # Served through the enrollment-checked, range-aware stream_video view;
+        # watch_course swaps in signed URLs built from file_name
+        video['file_name'] = video.pop('video_file') or ''
+        video['url'] = reverse('stream_video', args=[video['id']]) if video['file_name'] else ''
+        # adaptive stream once the transcode worker has built the ladder
+        ready = video.pop('transcode__status') == TranscodeJob.READY
+        video['hls_url'] = reverse('stream_hls', args=[video['id'], MASTER_PLAYLIST]) if ready else ''
+        lesson['videos'].append(video)
+        lesson['duration'] += video['time_duration'] or 0
+        video_count += 1
+        total_duration += video['time_duration'] or 0
+
+    return {
+        'lessons': lessons,
+        'lesson_count': len(lessons),
+        'video_count': video_count,
+        'total_duration': total_duration,
+    }
+
+
+def get_curriculum(course_id):
+    key = CURRICULUM_KEY.format(course_id=course_id, version=get_version(_version_name(course_id)))
+    curriculum = cache.get(key)
+    if curriculum is None:
+        curriculum = build_curriculum(course_id)
+        cache.set(key, curriculum, CURRICULUM_TIMEOUT)
+    return curriculum
+
+
+def find_video(curriculum, video_id=None):
+    """The requested video from an already-loaded tree, or the first one."""
+    try:
+        video_id = int(video_id) if video_id else None
+    except (TypeError, ValueError):
+        video_id = None
+    for lesson in curriculum['lessons']:
+        for video in lesson['videos']:
+            if video_id is None or video['id'] == video_id:
+                return video
+    return None
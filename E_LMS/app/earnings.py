@@ -0,0 +1,123 @@
+"""
+DailyEarnings: sales pre-aggregated per day x course x teacher, so the admin
+earnings reports read a few rows per day instead of every payment. Kept
+current inside the settlement transaction (app/payments.py) and by
+mark_course_paid; `manage.py rebuild_earnings_rollups` recomputes it.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import AdminEarning, DailyEarnings, TeacherEarning
+from .teacher_metrics import bump_teacher_metrics
+
+ROLLUP_FIELDS = ('sales', 'gross', 'teacher_share', 'commission', 'teacher_paid')
+
+
+def rollup_day(moment):
+    """The report day a payment counts towards: its date in TIME_ZONE, as TruncDate gives it."""
+    return timezone.localdate(moment)
+
+
+def empty_rollup():
+    return {'sales': 0, **{field: Decimal('0.00') for field in ROLLUP_FIELDS[1:]}}
+
+
+def bump_rollups(deltas):
+    """
+    Add {(day, course_id, teacher_id): {field: delta}} to the rollups with F()
+    so concurrent settlements never lose an update; missing rows are created.
+    """
+    for (day, course_id, teacher_id), values in deltas.items():
+        values = {field: delta for field, delta in values.items() if delta}
+        if not values:
+            continue
+        rows = DailyEarnings.objects.filter(day=day, course_id=course_id, teacher_id=teacher_id)
+        if rows.update(**{field: F(field) + delta for field, delta in values.items()}):
+            continue
+        try:
+            with transaction.atomic():
+                DailyEarnings.objects.create(day=day, course_id=course_id, teacher_id=teacher_id, **values)
+        except IntegrityError:
+            # another settlement created the row first
+            rows.update(**{field: F(field) + delta for field, delta in values.items()})
+
+
+def mark_course_paid(course_id):
+    """Pay out every unpaid teacher earning of a course; returns how many were marked."""
+    with transaction.atomic():
+        # lock the rows on their own: FOR UPDATE can't go on the GROUP BY below
+        locked = list(
+            TeacherEarning.objects.select_for_update()
+            .filter(course_id=course_id, is_paid=False).values_list('pk', flat=True)
+        )
+        unpaid = TeacherEarning.objects.filter(pk__in=locked)
+        totals = list(
+            unpaid.order_by().values('teacher_id', day=TruncDate('payment__payment_date'))
+            .annotate(amount=Sum('amount'))
+        )
+        marked = unpaid.update(is_paid=True)
+        bump_rollups({
+            (row['day'], course_id, row['teacher_id']): {'teacher_paid': row['amount']} for row in totals
+        })
+        bump_teacher_metrics(*(row['teacher_id'] for row in totals))
+    return marked
+
+
+def compute_rollups():
+    """Every rollup row from the earnings tables, two grouped queries: {(day, course_id, teacher_id): {field: value}}."""
+    rollups = defaultdict(empty_rollup)
+    teacher_rows = (
+        TeacherEarning.objects.order_by()
+        .values('course_id', 'teacher_id', day=TruncDate('payment__payment_date'))
+        .annotate(sales=Count('id'), gross=Sum('payment__amount_paid'), teacher_share=Sum('amount'),
+                  teacher_paid=Sum('amount', filter=Q(is_paid=True)))
+    )
+    for row in teacher_rows:
+        rollups[row['day'], row['course_id'], row['teacher_id']].update(
+            {field: row[field] or 0 for field in ('sales', 'gross', 'teacher_share', 'teacher_paid')}
+        )
+    # the commission belongs with the course's teacher, as in settle_payments
+    admin_rows = (
+        AdminEarning.objects.order_by()
+        .values('course_id', teacher_id=F('course__teacher_id'), day=TruncDate('payment__payment_date'))
+        .annotate(commission=Sum('commission_amount'))
+    )
+    for row in admin_rows:
+        rollups[row['day'], row['course_id'], row['teacher_id']]['commission'] = row['commission'] or 0
+    return dict(rollups)
+
+
+def rebuild_rollups(dry_run=False):
+    """
+    Bring DailyEarnings in line with the earnings tables. Returns a list of
+    (day, course_id, teacher_id, field, stored, actual) for everything that drifted.
+    """
+    expected = compute_rollups()
+    stored = {
+        (row['day'], row['course_id'], row['teacher_id']): row
+        for row in DailyEarnings.objects.values('id', 'day', 'course_id', 'teacher_id', *ROLLUP_FIELDS)
+    }
+
+    drift, to_create, to_update = [], [], []
+    for key, values in expected.items():
+        current = stored.pop(key, None)
+        if current is None:
+            drift.append((*key, 'row', None, 'missing'))
+            to_create.append(DailyEarnings(day=key[0], course_id=key[1], teacher_id=key[2], **values))
+            continue
+        changed = [(f, current[f], values[f]) for f in ROLLUP_FIELDS if current[f] != values[f]]
+        if changed:
+            drift.extend((*key, f, old, new) for f, old, new in changed)
+            to_update.append(DailyEarnings(id=current['id'], **values))
+    # rows whose earnings are all gone
+    drift.extend((*key, 'row', 'stale', None) for key in stored)
+
+    if not dry_run:
+        with transaction.atomic():
+            DailyEarnings.objects.filter(id__in=[row['id'] for row in stored.values()]).delete()
+            DailyEarnings.objects.bulk_create(to_create, batch_size=500)
+            DailyEarnings.objects.bulk_update(to_update, ROLLUP_FIELDS, batch_size=500)
+    return drift
@@ -0,0 +1,208 @@
+"""
+Payment gateway adapter. Every call to Razorpay goes through one
+PaymentGateway per process, which
+
+- reuses keep-alive connections from a bounded pool (PAYMENT_GATEWAY_POOL_SIZE),
+- puts (connect, read) timeouts on every request (PAYMENT_GATEWAY_TIMEOUT),
+- retries only what is safe to repeat: connection failures, where nothing
+  was sent, and reads of idempotent requests (PAYMENT_GATEWAY_RETRIES),
+- stops calling a gateway that keeps failing (PAYMENT_GATEWAY_BREAKER),
+  so checkout fails fast instead of every worker waiting out the timeout,
+- keeps a latency histogram per operation and outcome.
+
+Point PAYMENT_GATEWAY_URL at `manage.py payment_gateway_stub` to run
+checkout against a local fake.
+"""
+import bisect
+import logging
+import threading
+import time
+import razorpay
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from razorpay.errors import BadRequestError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("app.gateway")
+
+# upper bounds in milliseconds; the last bucket is everything slower
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class GatewayUnavailable(Exception):
+    """The gateway timed out, errored, or the breaker is open: try again later."""
+
+
+class TimeoutSession(requests.Session):
+    """A Session that never waits forever: razorpay.Client passes no timeout of its own."""
+
+    def __init__(self, timeout, pool_size, retries):
+        super().__init__()
+        self.timeout = timeout
+        retry = Retry(total=retries, connect=retries, read=retries, status=0,
+                      allowed_methods=Retry.DEFAULT_ALLOWED_METHODS, backoff_factor=0.1)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class CircuitBreaker:
+    """
+    Closed until `failures` calls in a row fail; then open (calls are refused)
+    for `reset_after` seconds; then half-open, where one trial call decides
+    between closing again and another open period.
+    """
+
+    def __init__(self, failures=5, reset_after=30, clock=time.monotonic):
+        self.threshold = failures
+        self.reset_after = reset_after
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.clock() - self.opened_at >= self.reset_after else 'open'
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.trial = 0, None, False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.opened_at is None or self.trial:
+                    logger.warning("Payment gateway breaker open after %s failure(s)", self.failures)
+                self.opened_at, self.trial = self.clock(), False
+
+
+class LatencyHistogram:
+    """Bucketed call durations per (operation, outcome). Per process: each worker keeps its own."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, outcome, seconds):
+        index = bisect.bisect_left(self.buckets, seconds * 1000)
+        with self.lock:
+            counts = self.counts.setdefault((operation, outcome), [0] * (len(self.buckets) + 1))
+            counts[index] += 1
+
+    def percentile(self, operation, outcome, fraction):
+        """Upper bound (ms) of the bucket holding that fraction of calls; None past the last bound."""
+        counts = self.counts.get((operation, outcome))
+        if not counts:
+            return None
+        target, seen = fraction * sum(counts), 0
+        for bound, count in zip(self.buckets + (None,), counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def summary(self):
+        """{(operation, outcome): {'count', 'p50', 'p95', 'p99'}}; percentiles in ms."""
+        with self.lock:
+            keys = list(self.counts)
+        return {
+            key: {'count': sum(self.counts[key]),
+                  **{f'p{int(p * 100)}': self.percentile(*key, p) for p in (0.5, 0.95, 0.99)}}
+            for key in keys
+        }
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+class PaymentGateway:
+    def __init__(self, key_id, key_secret, base_url=None, timeout=(3.05, 10), pool_size=10, retries=1,
+                 breaker=(5, 30)):
+        self.session = TimeoutSession(timeout, pool_size, retries)
+        options = {'base_url': base_url} if base_url else {}
+        self.client = razorpay.Client(session=self.session, auth=(key_id, key_secret), **options)
+        self.breaker = CircuitBreaker(*breaker)
+        self.latency = LatencyHistogram()
+
+    def call(self, operation, function, *args, **kwargs):
+        if not self.breaker.allow():
+            self.latency.record(operation, 'refused', 0)
+            raise GatewayUnavailable(f"{operation}: circuit open")
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except BadRequestError:
+            # our request was wrong, the gateway itself is fine
+            self.breaker.success()
+            self.latency.record(operation, 'rejected', time.perf_counter() - started)
+            raise
+        except Exception as e:
+            elapsed = time.perf_counter() - started
+            self.breaker.failure()
+            self.latency.record(operation, 'error', elapsed)
+            logger.warning("Payment gateway %s failed after %.0f ms: %s", operation, elapsed * 1000, e)
+            raise GatewayUnavailable(f"{operation}: {e}") from e
+        self.breaker.success()
+        self.latency.record(operation, 'ok', time.perf_counter() - started)
+        return result
+
+    def create_order(self, data):
+        return self.call('order.create', self.client.order.create, data)
+
+    def fetch_order(self, order_id):
+        return self.call('order.fetch', self.client.order.fetch, order_id)
+
+    def verify_payment_signature(self, params):
+        """Local HMAC check, no request; raises razorpay.errors.SignatureVerificationError."""
+        return self.client.utility.verify_payment_signature(params)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = PaymentGateway(
+                    settings.KEY_ID, settings.KEY_SECRET,
+                    base_url=getattr(settings, 'PAYMENT_GATEWAY_URL', None),
+                    timeout=getattr(settings, 'PAYMENT_GATEWAY_TIMEOUT', (3.05, 10)),
+                    pool_size=getattr(settings, 'PAYMENT_GATEWAY_POOL_SIZE', 10),
+                    retries=getattr(settings, 'PAYMENT_GATEWAY_RETRIES', 1),
+                    breaker=getattr(settings, 'PAYMENT_GATEWAY_BREAKER', (5, 30)),
+                )
+    return _gateway
+
+
+@receiver(setting_changed)
+def reset_gateway(setting, **kwargs):
+    global _gateway
+    if setting.startswith('PAYMENT_GATEWAY') or setting in ('KEY_ID', 'KEY_SECRET'):
+        _gateway = None
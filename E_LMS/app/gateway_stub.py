@@ -0,0 +1,131 @@
+"""
+In-process fake of the part of the Razorpay API that checkout uses, for
+load-testing without the network (see `manage.py payment_gateway_stub`).
+
+    POST /v1/orders               create an order
+    GET  /v1/orders/<id>          fetch it
+    POST /v1/orders/<id>/pay      stub only: what the checkout widget hands back
+                                  after a payment, signed like the real one, ready
+                                  to be posted to verify_payment
+"""
+import base64
+import hashlib
+import hmac
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ORDER_PATH_REGEX = re.compile(r'^/v1/orders/(?P<order_id>order_[A-Za-z0-9]+)(?P<pay>/pay)?$')
+
+
+def payment_signature(key_secret, order_id, payment_id):
+    return hmac.new(key_secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'    # keep-alive, as the real API
+    server_version = 'GatewayStub'
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, status, code, description):
+        self.send_json(status, {'error': {'code': code, 'description': description}})
+
+    def authorized(self):
+        header = self.headers.get('Authorization', '')
+        try:
+            key_id = base64.b64decode(header.removeprefix('Basic ')).decode().split(':', 1)[0]
+        except ValueError:
+            return False
+        return key_id == self.server.key_id
+
+    def handle_request(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.server.latency:
+            time.sleep(self.server.latency * random.uniform(0.5, 1.5))
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            return self.send_error_json(500, 'SERVER_ERROR', 'Injected failure')
+        if not self.authorized():
+            return self.send_error_json(401, 'BAD_REQUEST_ERROR', 'Authentication failed')
+
+        path = self.path.split('?', 1)[0]
+        if method == 'POST' and path == '/v1/orders':
+            try:
+                data = json.loads(body or b'{}')
+                amount = int(data['amount'])
+            except (ValueError, KeyError, TypeError):
+                return self.send_error_json(400, 'BAD_REQUEST_ERROR', 'amount is required')
+            return self.send_json(200, self.server.create_order(amount, data))
+
+        match = ORDER_PATH_REGEX.match(path)
+        order = match and self.server.orders.get(match['order_id'])
+        if not order:
+            return self.send_error_json(400, 'BAD_REQUEST_ERROR', 'The id provided does not exist')
+        if method == 'GET' and not match['pay']:
+            return self.send_json(200, order)
+        if method == 'POST' and match['pay']:
+            return self.send_json(200, self.server.pay_order(order))
+        self.send_error_json(400, 'BAD_REQUEST_ERROR', 'The requested URL was not found on the server.')
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+
+class StubGateway(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, key_id, key_secret, latency=0, fail_rate=0, verbose=False):
+        super().__init__(address, StubGatewayHandler)
+        self.key_id, self.key_secret = key_id, key_secret
+        self.latency, self.fail_rate, self.verbose = latency, fail_rate, verbose
+        self.orders = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def create_order(self, amount, data):
+        order = {
+            'id': f"order_{secrets.token_hex(7)}", 'entity': 'order', 'amount': amount, 'amount_paid': 0,
+            'amount_due': amount, 'currency': data.get('currency', 'INR'), 'receipt': data.get('receipt'),
+            'status': 'created', 'attempts': 0, 'notes': data.get('notes') or [], 'created_at': int(time.time()),
+        }
+        with self.lock:
+            self.orders[order['id']] = order
+        return order
+
+    def pay_order(self, order):
+        payment_id = f"pay_{secrets.token_hex(7)}"
+        with self.lock:
+            order.update(status='paid', attempts=order['attempts'] + 1, amount_paid=order['amount'], amount_due=0)
+        return {
+            'razorpay_order_id': order['id'], 'razorpay_payment_id': payment_id,
+            'razorpay_signature': payment_signature(self.key_secret, order['id'], payment_id),
+        }
+
+    def start(self):
+        """Serve from a daemon thread (tests, benchmarks); returns the thread."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,74 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from app.cache_versions import bump_version
+from app.curriculum import bump_curriculum_version
+from app.media_probe import probe_video
+from app.models import Video
+from app.page_cache import PAGE_VERSION
+from app.stats import rebuild_course_stats
+
+MEDIA_FIELDS = ['duration_seconds', 'width', 'height', 'bitrate']
+
+
+def _probe(row):
+    video_id, name = row
+    try:
+        return video_id, probe_video(default_storage.path(name))
+    except (OSError, NotImplementedError):
+        return video_id, None
+
+
+class Command(BaseCommand):
+    help = "Read duration/resolution/bitrate from the headers of existing video files."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Re-probe videos that already have metadata.")
+        parser.add_argument('--set-duration', action='store_true',
+                            help="Also overwrite the typed time_duration (minutes) with the real length.")
+        parser.add_argument('--workers', type=int, default=min(8, (os.cpu_count() or 1) * 2))
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        videos = Video.objects.exclude(video_file='').exclude(video_file__isnull=True)
+        if not options['all']:
+            videos = videos.filter(duration_seconds__isnull=True)
+        rows = list(videos.values_list('id', 'video_file'))
+        if not rows:
+            self.stdout.write(self.style.SUCCESS("No videos to probe."))
+            return
+
+        fields = MEDIA_FIELDS + (['time_duration'] if options['set_duration'] else [])
+        started = time.monotonic()
+        updated, unreadable, batch = 0, 0, []
+        # Header parsing is a handful of seeks per file, so threads keep the disk busy
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            for video_id, info in pool.map(_probe, rows):
+                if info is None:
+                    unreadable += 1
+                    continue
+                video = Video(id=video_id)
+                video.apply_media_info(info)
+                batch.append(video)
+                if len(batch) >= options['batch_size']:
+                    Video.objects.bulk_update(batch, fields)
+                    updated += len(batch)
+                    batch = []
+        if batch:
+            Video.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        if options['set_duration'] and updated:
+            # bulk_update skips the signals that keep these in step with time_duration
+            course_ids = set(Video.objects.filter(id__in=[r[0] for r in rows]).values_list('course_id', flat=True))
+            rebuild_course_stats(course_ids)
+            for course_id in course_ids:
+                bump_curriculum_version(course_id)
+            bump_version(PAGE_VERSION)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} video(s) in {elapsed:.2f}s."))
+        if unreadable:
+            self.stdout.write(self.style.WARNING(f"{unreadable} file(s) missing or not a readable MP4/WebM."))
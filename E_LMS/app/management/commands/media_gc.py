@@ -0,0 +1,179 @@
+import os
+import posixpath
+import re
+import time
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models
+from django.utils import timezone
+from app.models import ImageRendition, MediaBlob, Video, VideoUpload
+from app.storage import BLOB_ROOT
+from app.transcode_queue import HLS_ROOT
+from app.uploads import PART_SUFFIX, abort_upload
+
+DEFAULT_ROOTS = ('Media', 'media', 'videos', 'joiningapplications', HLS_ROOT, BLOB_ROOT)
+RENDITION_REGEX = re.compile(r'__w\d+\.(webp|jpg)$')
+# files looked up against the database per batch, so memory doesn't grow with the media tree
+GC_BATCH_SIZE = 500
+
+
+def normalize(name):
+    return posixpath.normpath(name.replace('\\', '/'))
+
+
+def walk_files(top):
+    """Every regular file under `top`, one os.scandir at a time (no symlinks followed)."""
+    pending = [top]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+class Command(BaseCommand):
+    help = "Find media files no FileField/ImageField references any more, and delete them (or list them with --dry-run)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be deleted, delete nothing.")
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help="Leave files modified more recently than this (uploads still being saved).")
+        parser.add_argument('--upload-days', type=float, default=7,
+                            help="Abort resumable uploads with no chunk received for this many days.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        started = time.monotonic()
+
+        stale_uploads = VideoUpload.objects.filter(updated_at__lt=timezone.now() - timedelta(days=options['upload_days']))
+        if dry_run:
+            self.stdout.write(f"{stale_uploads.count()} abandoned upload(s) would be aborted.")
+        else:
+            aborted = 0
+            for upload in stale_uploads.iterator():
+                abort_upload(upload)
+                aborted += 1
+            self.stdout.write(f"Aborted {aborted} abandoned upload(s).")
+
+        self.file_fields = [
+            (model, field.attname)
+            for model in apps.get_models()
+            for field in model._meta.concrete_fields
+            if isinstance(field, models.FileField)
+        ]
+        cutoff = time.time() - options['grace_hours'] * 3600
+        found, found_bytes, touched_dirs = 0, 0, set()
+        roots = getattr(settings, 'MEDIA_GC_ROOTS', DEFAULT_ROOTS)
+        for root in roots:
+            for batch in self.batches(walk_files(default_storage.path(root))):
+                referenced = self.referenced_names(batch)
+                for name, entry in batch.items():
+                    if name in referenced:
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    found += 1
+                    found_bytes += stat.st_size
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f"  {name}")
+                    if not dry_run:
+                        self.remove(name, entry.path)
+                        touched_dirs.add(os.path.dirname(entry.path))
+
+        if not dry_run:
+            self.prune_empty_dirs(touched_dirs, [default_storage.path(root) for root in roots])
+
+        verb = "Would delete" if dry_run else "Deleted"
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {found} unreferenced file(s), {found_bytes / (1024 * 1024):.1f} MB, in {elapsed:.2f}s."
+        ))
+
+    @staticmethod
+    def batches(entries):
+        """{name: DirEntry} dicts of up to GC_BATCH_SIZE files, names relative to MEDIA_ROOT."""
+        location = default_storage.location
+        batch = {}
+        for entry in entries:
+            batch[normalize(os.path.relpath(entry.path, location))] = entry
+            if len(batch) >= GC_BATCH_SIZE:
+                yield batch
+                batch = {}
+        if batch:
+            yield batch
+
+    def field_references(self, names):
+        """The subset of `names` some FileField/ImageField in the project holds."""
+        found = set()
+        if names:
+            for model, attname in self.file_fields:
+                rows = model._default_manager.filter(**{f'{attname}__in': names}).values_list(attname, flat=True)
+                found.update(rows)
+        return found
+
+    def referenced_names(self, names):
+        """
+        The subset of `names` still in use: held by a FileField, derived from
+        one (renditions), part of a resumable upload, a blob with a MediaBlob
+        row, or HLS output of an existing video. Names are matched as stored.
+        """
+        referenced, plain, blobs, hls = set(), set(), {}, {}
+        for name in names:
+            parts = name.split('/')
+            if parts[0] == BLOB_ROOT:
+                # blobs/tmp/* are saves in progress (or crashed): covered by the grace period
+                if parts[1] != 'tmp':
+                    blobs.setdefault(parts[-1], []).append(name)
+            elif parts[0] == HLS_ROOT and len(parts) > 2:
+                # hls/<video id>/...; 'hls/<id>.tmp/' is a transcode in progress
+                if parts[1].isdigit():
+                    hls.setdefault(int(parts[1]), []).append(name)
+            else:
+                plain.add(name)
+
+        for sha256 in MediaBlob.objects.filter(sha256__in=list(blobs)).values_list('sha256', flat=True):
+            referenced.update(blobs[sha256])
+        for video_id in Video.objects.filter(id__in=list(hls)).values_list('id', flat=True):
+            referenced.update(hls[video_id])
+        referenced.update(self.field_references(plain))
+
+        # the empty placeholder holding an upload's final name, and the file being assembled
+        finals = plain | {name[:-len(PART_SUFFIX)] for name in plain if name.endswith(PART_SUFFIX)}
+        for name in VideoUpload.objects.filter(file_name__in=finals).values_list('file_name', flat=True):
+            referenced.update({name, name + PART_SUFFIX} & plain)
+
+        renditions = list(ImageRendition.objects.filter(name__in=plain - referenced).values_list('source_name', 'name'))
+        sources = self.field_references({source for source, _ in renditions})
+        referenced.update(name for source, name in renditions if source in sources)
+        return referenced
+
+    def remove(self, name, path):
+        if name.startswith(BLOB_ROOT + '/'):
+            # a blob with no MediaBlob row: nothing to decrement
+            os.remove(path)
+            return
+        # drops a MediaAlias reference if the name is one, a plain delete otherwise
+        default_storage.delete(name)
+        if RENDITION_REGEX.search(name):
+            ImageRendition.objects.filter(name=name).delete()
+
+    @staticmethod
+    def prune_empty_dirs(dirs, roots):
+        stops = {os.path.abspath(root) for root in roots}
+        for directory in sorted(dirs, key=len, reverse=True):
+            directory = os.path.abspath(directory)
+            while directory not in stops and directory.startswith(tuple(stops)):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
@@ -0,0 +1,72 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from app.gateway import LATENCY_BUCKETS, GatewayUnavailable, PaymentGateway
+from app.gateway_stub import StubGateway
+
+
+class Command(BaseCommand):
+    help = ("Serve a local fake of the Razorpay order API (set PAYMENT_GATEWAY_URL to its address), "
+            "or with --bench drive the gateway adapter against it and print throughput and latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=0, help="Mean milliseconds the stub waits per request.")
+        parser.add_argument('--fail-rate', type=float, default=0, help="Fraction of requests answered with a 500.")
+        parser.add_argument('--bench', type=int, default=0, metavar='ORDERS',
+                            help="Create and pay this many orders through PaymentGateway, then exit.")
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def handle(self, *args, **options):
+        server = StubGateway(
+            (options['host'], options['port']), settings.KEY_ID, settings.KEY_SECRET,
+            latency=options['latency'] / 1000, fail_rate=options['fail_rate'], verbose=options['verbosity'] >= 2,
+        )
+        if not options['bench']:
+            self.stdout.write(f"Payment gateway stub on {server.url} (PAYMENT_GATEWAY_URL = '{server.url}')")
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                server.server_close()
+            return
+
+        server.start()
+        try:
+            self.bench(server, options['bench'], options['concurrency'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def bench(self, server, orders, concurrency):
+        gateway = PaymentGateway(
+            settings.KEY_ID, settings.KEY_SECRET, base_url=server.url,
+            timeout=getattr(settings, 'PAYMENT_GATEWAY_TIMEOUT', (3.05, 10)), pool_size=concurrency,
+            retries=getattr(settings, 'PAYMENT_GATEWAY_RETRIES', 1),
+            breaker=getattr(settings, 'PAYMENT_GATEWAY_BREAKER', (5, 30)),
+        )
+
+        def checkout(n):
+            try:
+                order = gateway.create_order({'amount': 99900, 'currency': 'INR', 'receipt': f"bench-{n}"})
+                params = gateway.call('order.pay', gateway.client.post, f"/v1/orders/{order['id']}/pay", {})
+                gateway.verify_payment_signature(params)
+                return True
+            except GatewayUnavailable:
+                return False
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            succeeded = sum(pool.map(checkout, range(orders)))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"{succeeded}/{orders} checkouts in {elapsed:.2f}s ({orders / elapsed:.0f}/s), "
+                          f"breaker {gateway.breaker.state}")
+        for (operation, outcome), stats in sorted(gateway.latency.summary().items()):
+            percentiles = ", ".join(
+                f"{p} <={stats[p]} ms" if stats[p] else f"{p} >{LATENCY_BUCKETS[-1]} ms" for p in ('p50', 'p95', 'p99')
+            )
+            self.stdout.write(f"  {operation:<12} {outcome:<8} {stats['count']:>6}  {percentiles}")
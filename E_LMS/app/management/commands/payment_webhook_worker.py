@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from app.webhooks import drain_inbox
+
+
+class Command(BaseCommand):
+    help = "Apply queued payment webhooks (the PaymentEvent inbox) in batches: settle paid orders, enroll students."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks for new events.")
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--once', action='store_true', help="Exit when the inbox is empty.")
+
+    def handle(self, *args, **options):
+        events = settled = 0
+        while True:
+            processed, paid = drain_inbox(options['batch_size'])
+            events += processed
+            settled += paid
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {events} event(s), settled {settled} payment(s)."))
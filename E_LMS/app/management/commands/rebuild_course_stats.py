@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from app.stats import rebuild_course_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute CourseStats from lessons, videos, enrollments and payments, reporting any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drift, don't write.")
+        parser.add_argument('--course', type=int, action='append', dest='courses', help="Limit to a course id (repeatable).")
+
+    def handle(self, *args, **options):
+        drift = rebuild_course_stats(options['courses'], dry_run=options['dry_run'])
+        for course_id, field, stored, actual in drift:
+            self.stdout.write(f"course {course_id}: {field} stored={stored} actual={actual}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("CourseStats is in sync."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} drifted value(s) found (dry run, nothing written)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} drifted value(s)."))
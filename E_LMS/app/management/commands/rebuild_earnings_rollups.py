@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from app.earnings import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute DailyEarnings from teacher and admin earnings, reporting any drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Only report drift, don't write.")
+
+    def handle(self, *args, **options):
+        drift = rebuild_rollups(dry_run=options['dry_run'])
+        for day, course_id, teacher_id, field, stored, actual in drift:
+            self.stdout.write(f"{day} course {course_id} teacher {teacher_id}: {field} stored={stored} actual={actual}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("DailyEarnings is in sync."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} drifted value(s) found (dry run, nothing written)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} drifted value(s)."))
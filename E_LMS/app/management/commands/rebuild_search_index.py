@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from app.search import rebuild_index, fts_available
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text course search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            self.stdout.write(self.style.WARNING("Full-text search needs SQLite FTS5; nothing to rebuild."))
+            return
+        started = time.monotonic()
+        total = rebuild_index(batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} courses in {elapsed:.2f}s."))
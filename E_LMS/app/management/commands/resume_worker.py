@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from app.resumes import process_pending_resumes
+
+
+class Command(BaseCommand):
+    help = "Extract page count and text from uploaded teacher application resumes, for the admin previews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=10.0, help="Seconds between checks for new resumes.")
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--once', action='store_true', help="Exit when nothing is pending.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            done = process_pending_resumes(options['batch_size'])
+            total += done
+            if done:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} resume(s)."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from app.transcode_queue import TranscodeWorker, enqueue_transcode
+from app.models import Video
+
+
+class Command(BaseCommand):
+    help = "Run the HLS transcoding worker: claims queued TranscodeJobs and encodes them on a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help="Pool size; 0 runs jobs inline.")
+        parser.add_argument('--poll', type=float, default=5.0, help="Seconds between queue polls.")
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty.")
+        parser.add_argument('--enqueue-missing', action='store_true',
+                            help="First queue every video with a file but no transcode job.")
+
+    def handle(self, *args, **options):
+        if options['enqueue_missing']:
+            missing = Video.objects.exclude(video_file='').exclude(video_file__isnull=True).filter(transcode__isnull=True)
+            count = 0
+            for video_id, name in missing.values_list('id', 'video_file').iterator():
+                enqueue_transcode(video_id, name)
+                count += 1
+            self.stdout.write(f"Queued {count} video(s).")
+
+        worker = TranscodeWorker(processes=options['processes'], poll_interval=options['poll'])
+        try:
+            done = worker.run(once=options['once'])
+        except RuntimeError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} job(s)."))
@@ -0,0 +1,204 @@
+import os
+import struct
+from collections import namedtuple
+
+# duration in seconds (float), width/height in pixels, bitrate in bits/second
+VideoInfo = namedtuple('VideoInfo', 'duration width height bitrate')
+
+# Never read more than this from the front of a file looking for WebM headers,
+# and never read more than this of any single MP4 header box.
+MAX_SCAN_BYTES = 4 * 1024 * 1024
+MAX_BOX_READ = 64 * 1024
+
+# MP4 boxes we descend into to reach mvhd/tkhd; everything else is seeked over
+MP4_CONTAINERS = {b'moov', b'trak'}
+
+# EBML ids (marker bits kept, as in the Matroska spec)
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+DURATION = 0x4489
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+TRACK_VIDEO = 0xE0
+PIXEL_WIDTH = 0xB0
+PIXEL_HEIGHT = 0xBA
+CLUSTER = 0x1F43B675
+EBML_CONTAINERS = {SEGMENT, INFO, TRACKS, TRACK_ENTRY, TRACK_VIDEO}
+
+
+def probe_video(source):
+    """
+    Read duration/resolution/bitrate from the container headers of an MP4/MOV
+    or WebM/Matroska file without reading the media data. `source` is a path
+    or a seekable binary file object (its position is restored). Returns a
+    VideoInfo, or None when the format isn't recognised or has no duration.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return _probe(f)
+    position = source.tell()
+    try:
+        source.seek(0)
+        return _probe(source)
+    finally:
+        source.seek(position)
+
+
+def _probe(f):
+    size = f.seek(0, os.SEEK_END)
+    f.seek(0)
+    head = f.read(12)
+    f.seek(0)
+    try:
+        if len(head) >= 8 and head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+            info = _probe_mp4(f, size)
+        elif head[:4] == struct.pack('>I', EBML_HEADER):
+            info = _probe_ebml(f, size)
+        else:
+            return None
+    except (struct.error, ValueError, OSError):
+        return None
+    if info is None:
+        return None
+
+    duration, width, height = info
+    if not duration or duration <= 0:
+        return None
+    return VideoInfo(duration, width or None, height or None, int(size * 8 / duration))
+
+
+# ---------------------------------------------------------------- MP4 / MOV
+
+def _mp4_boxes(f, start, end):
+    """Yield (type, payload_offset, payload_end) for boxes between start and end."""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        box_size, box_type = struct.unpack('>I4s', header)
+        payload = offset + 8
+        if box_size == 1:
+            box_size = struct.unpack('>Q', f.read(8))[0]
+            payload += 8
+        elif box_size == 0:
+            box_size = end - offset
+        if box_size < payload - offset:
+            return
+        yield box_type, payload, min(offset + box_size, end)
+        offset += box_size
+
+
+def _read_box(f, payload, box_end):
+    f.seek(payload)
+    return f.read(min(box_end - payload, MAX_BOX_READ))
+
+
+def _probe_mp4(f, size):
+    duration = width = height = None
+    stack = [(0, size)]
+    while stack:
+        start, end = stack.pop()
+        for box_type, payload, box_end in _mp4_boxes(f, start, end):
+            if box_type in MP4_CONTAINERS:
+                stack.append((payload, box_end))
+            elif box_type == b'mvhd':
+                duration = _parse_mvhd(_read_box(f, payload, box_end))
+            elif box_type == b'tkhd' and not width:
+                width, height = _parse_tkhd(_read_box(f, payload, box_end))
+    if duration is None:
+        return None
+    return duration, width, height
+
+
+def _parse_mvhd(data):
+    # version 1 has 64-bit creation/modification times and duration
+    version = data[0] if data else None
+    if len(data) < (32 if version == 1 else 20):
+        raise ValueError("truncated mvhd box")
+    if version == 1:
+        timescale, duration = struct.unpack('>IQ', data[20:32])
+    else:
+        timescale, duration = struct.unpack('>II', data[12:20])
+    return duration / timescale if timescale else None
+
+
+def _parse_tkhd(data):
+    # width/height are the last two 16.16 fixed-point fields; audio tracks have 0
+    body = 96 if data[:1] == b'\x01' else 84
+    if len(data) < body:
+        raise ValueError("truncated tkhd box")
+    width, height = struct.unpack('>II', data[body - 8:body])
+    return width >> 16, height >> 16
+
+
+# ----------------------------------------------------------- WebM / Matroska
+
+def _read_vint(f, keep_marker):
+    first = f.read(1)
+    if not first:
+        raise ValueError("unexpected end of file")
+    byte = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not byte & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("invalid EBML vint")
+    value = byte if keep_marker else byte & (mask - 1)
+    all_ones = (byte & (mask - 1)) == mask - 1
+    for b in f.read(length - 1):
+        value = (value << 8) | b
+        all_ones = all_ones and b == 0xFF
+    if not keep_marker and all_ones:
+        return None  # unknown size
+    return value
+
+
+def _read_uint(f, length):
+    return int.from_bytes(f.read(length), 'big')
+
+
+def _probe_ebml(f, size):
+    limit = min(size, MAX_SCAN_BYTES)
+    timecode_scale, duration, width, height = 1000000, None, None, None
+    have_tracks = False
+    offset = 0
+    while offset < limit:
+        f.seek(offset)
+        element_id = _read_vint(f, keep_marker=True)
+        element_size = _read_vint(f, keep_marker=False)
+        payload = f.tell()
+        element_end = size if element_size is None else payload + element_size
+
+        if element_id == CLUSTER:
+            break  # media data; muxers write Info and Tracks before it
+        if element_id in EBML_CONTAINERS:
+            if element_id == TRACKS:
+                have_tracks = True
+            offset = payload
+            continue
+        if element_size is None:
+            # only master elements may be unknown-size; a leaf would run to EOF
+            raise ValueError("unknown-size EBML element")
+        if element_id in (TIMECODE_SCALE, DURATION, PIXEL_WIDTH, PIXEL_HEIGHT) and element_size > 8:
+            raise ValueError("oversized EBML number")
+        if element_id == TIMECODE_SCALE:
+            timecode_scale = _read_uint(f, element_size)
+        elif element_id == DURATION:
+            duration = struct.unpack('>f' if element_size == 4 else '>d', f.read(element_size))[0]
+        elif element_id == PIXEL_WIDTH and not width:
+            width = _read_uint(f, element_size)
+        elif element_id == PIXEL_HEIGHT and not height:
+            height = _read_uint(f, element_size)
+        if duration is not None and have_tracks and width and height:
+            break
+        offset = element_end
+
+    if duration is None:
+        return None
+    return duration * timecode_scale / 1e9, width, height
@@ -0,0 +1,81 @@
+import math
+import time
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from .transcode_queue import HLS_FILE_REGEX, hls_dir_name
+from .transcoding import MASTER_PLAYLIST
+
+SALT = 'app.media_tokens'
+EXPIRY_STEP = 15 * 60    # expiries are rounded up so a page reload reuses cached URLs
+
+
+def _secret():
+    return getattr(settings, 'MEDIA_TOKEN_SECRET', None) or settings.SECRET_KEY
+
+
+def token_scope(video_id, name):
+    """
+    What a signature covers: the exact file, or for the HLS ladder its whole
+    directory, since the player resolves rendition playlists and segments
+    relative to the master playlist URL. None if `name` is not allowed at all.
+    """
+    hls_prefix = hls_dir_name(video_id) + '/'
+    if name.startswith(hls_prefix):
+        return hls_prefix if HLS_FILE_REGEX.match(name[len(hls_prefix):]) else None
+    if '..' in name.split('/') or name.startswith('/'):
+        return None
+    return name
+
+
+def _signature(user_id, video_id, expires, scope):
+    value = f"{user_id}:{video_id}:{expires}:{scope}"
+    return salted_hmac(SALT, value, secret=_secret(), algorithm='sha256').hexdigest()[:32]
+
+
+def make_token(user_id, video_id, name, ttl=None):
+    ttl = ttl or getattr(settings, 'MEDIA_TOKEN_TTL', 6 * 60 * 60)
+    expires = math.ceil((time.time() + ttl) / EXPIRY_STEP) * EXPIRY_STEP
+    return f"{user_id}.{expires}.{_signature(user_id, video_id, expires, token_scope(video_id, name))}"
+
+
+def check_token(token, video_id, name):
+    """
+    User id the token was issued to if it is genuine, unexpired and covers
+    `name`, else None. Pure computation: no session, cache or database.
+    """
+    try:
+        user_id, expires, signature = token.split('.')
+        expires = int(expires)
+    except ValueError:
+        return None
+    scope = token_scope(video_id, name)
+    if scope is None or expires < time.time():
+        return None
+    if not constant_time_compare(signature, _signature(user_id, video_id, expires, scope)):
+        return None
+    return user_id
+
+
+def signed_url(user_id, video_id, name):
+    token = make_token(user_id, video_id, name)
+    return reverse('stream_signed', kwargs={'video_id': video_id, 'token': token, 'name': name})
+
+
+def sign_curriculum(curriculum, user_id):
+    """
+    Copy of a cached curriculum tree whose video/HLS URLs are signed for one
+    user, so playback after the page's single enrollment check needs no query.
+    """
+    lessons = []
+    for lesson in curriculum['lessons']:
+        videos = []
+        for video in lesson['videos']:
+            video = dict(video)
+            if video.get('file_name'):
+                video['url'] = signed_url(user_id, video['id'], video['file_name'])
+            if video['hls_url']:
+                video['hls_url'] = signed_url(user_id, video['id'], f"{hls_dir_name(video['id'])}/{MASTER_PLAYLIST}")
+            videos.append(video)
+        lessons.append(dict(lesson, videos=videos))
+    return dict(curriculum, lessons=lessons)
@@ -0,0 +1,178 @@
+import logging
+import mimetypes
+import os
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+logger = logging.getLogger("app.query_budget")
+
+# SQL normalisation so the same statement with different values shares a fingerprint
+_IN_LIST_REGEX = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_STRING_REGEX = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_REGEX = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE_REGEX = re.compile(r'\s+')
+
+# 'theme.min.1a2b3c4d5e6f.css': names ManifestStaticFilesStorage fingerprinted
+_HASHED_NAME_REGEX = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(sql):
+    sql = _IN_LIST_REGEX.sub('(%s, ...)', sql)
+    sql = _STRING_REGEX.sub('?', sql)
+    sql = _NUMBER_REGEX.sub('?', sql)
+    return _SPACE_REGEX.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() hook: counts, times and fingerprints queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n > 1]
+
+
+def query_budget_for(request):
+    """
+    Budget from settings.QUERY_BUDGETS, looked up by URL name and method
+    ('apply_as_teacher:POST'), then URL name alone (e.g. 'home'), falling
+    back to QUERY_BUDGET_DEFAULT.
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    match = getattr(request, 'resolver_match', None)
+    if match is not None:
+        for key in (f'{match.url_name}:{request.method}', match.url_name):
+            if key in budgets:
+                return budgets[key]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+
+
+class QueryBudgetMiddleware:
+    """
+    Count SQL queries, DB time and duplicate statements for every request,
+    expose them in a Server-Timing header and log requests over their budget.
+    Works with DEBUG off because it uses execute_wrapper, not connection.queries.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', True)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        response['Server-Timing'] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries", '
+            f'app;dur={total * 1000:.1f}'
+        )
+
+        budget = query_budget_for(request)
+        if budget is not None and recorder.count > budget:
+            duplicates = recorder.duplicates()[:5]
+            logger.warning(
+                "Query budget exceeded on %s %s: %d queries (budget %d), %.1f ms in DB%s",
+                request.method, request.path, recorder.count, budget, recorder.duration * 1000,
+                "".join(f"\n  x{n}: {fp}" for fp, n in duplicates),
+            )
+        return response
+
+
+def accepted_encodings(header):
+    """Codings from an Accept-Encoding header, minus any sent with q=0."""
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip().partition('=')[2] if params.strip().startswith('q=') else '1'
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.strip().lower())
+        except ValueError:
+            continue
+    return accepted
+
+
+def serve_static(request, name):
+    """
+    A file from STATIC_ROOT, or its precompressed .br/.gz sibling when the
+    client accepts it. Fingerprinted names are cached for a year as immutable;
+    anything else must be revalidated. None if there is no such file.
+    """
+    if not settings.STATIC_ROOT or '..' in name.split('/') or name.startswith('/'):
+        return None
+    path = os.path.join(settings.STATIC_ROOT, name)
+    if not os.path.isfile(path):
+        return None
+
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    encoding = None
+    for coding, suffix in STATIC_ENCODINGS:
+        if coding in accepted and os.path.isfile(path + suffix):
+            encoding, path = coding, path + suffix
+            break
+
+    stat = os.stat(path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if _HASHED_NAME_REGEX.search(name):
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=0, must-revalidate'
+    return response
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Answer STATIC_URL requests from the collected files (see app/static_pipeline.py)
+    before sessions, auth or the URL resolver run. Behind nginx, gzip_static /
+    brotli_static on the same directory do this job and requests never get here.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'STATIC_SERVE_PRECOMPRESSED', True)
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/') if settings.STATIC_URL else None
+
+    def __call__(self, request):
+        if self.enabled and self.prefix and request.method in ('GET', 'HEAD') \
+                and request.path_info.startswith(self.prefix):
+            response = serve_static(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
@@ -9,6 +9,11 @@ class Migration(migrations.Migration):
         ('app', '0001_initial'),
     ]
 
+    # AUTH_USER_MODEL lives in this app, so admin's FK to it needs the table first
+    run_before = [
+        ('admin', '0001_initial'),
+    ]
+
     operations = [
         migrations.CreateModel(
             name='Users',
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# FTS5 virtual table backing /search (rowid == Course.id). SQLite only; other
+# databases fall back to a LIKE scan in app.search.
+
+
+def create_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS app_course_search USING fts5("
+        "title, descriptions, category, teacher, curriculum, "
+        "tokenize='porter unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS app_course_search")
+
+
+def populate_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "INSERT INTO app_course_search (rowid, title, descriptions, category, teacher, curriculum) "
+        "SELECT c.id, c.title, c.descriptions, COALESCE(cat.name, ''), "
+        "TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '') || ' ' || u.username), "
+        "COALESCE((SELECT GROUP_CONCAT(l.name, ' ') FROM app_lesson l WHERE l.course_id = c.id), '') || ' ' || "
+        "COALESCE((SELECT GROUP_CONCAT(v.title, ' ') FROM app_video v WHERE v.course_id = c.id), '') "
+        "FROM app_course c "
+        "LEFT JOIN app_categories cat ON cat.id = c.course_category_id "
+        "JOIN app_teacher t ON t.id = c.teacher_id "
+        "JOIN app_users u ON u.id = t.user_id"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0023_teacher_contact_no'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+        migrations.RunPython(populate_search_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_course_stats(apps, schema_editor):
+    Course = apps.get_model('app', 'Course')
+    CourseStats = apps.get_model('app', 'CourseStats')
+    stats = {cid: {} for cid in Course.objects.values_list('id', flat=True)}
+
+    def merge(model, filters=None, **aggregates):
+        rows = model.objects.filter(**(filters or {})).order_by().values('course_id').annotate(**aggregates)
+        for row in rows:
+            if row['course_id'] in stats:
+                stats[row['course_id']].update({f: row[f] or 0 for f in aggregates})
+
+    merge(apps.get_model('app', 'Lesson'), lesson_count=Count('id'))
+    merge(apps.get_model('app', 'Video'), video_count=Count('id'), total_duration=Sum('time_duration'))
+    merge(apps.get_model('app', 'Enrollment'), enrollment_count=Count('id'))
+    merge(apps.get_model('app', 'Payment'), {'status': 'successful'}, gross_revenue=Sum('amount_paid'))
+    CourseStats.objects.bulk_create(
+        [CourseStats(course_id=cid, **values) for cid, values in stats.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0024_course_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseStats',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='app.course')),
+                ('lesson_count', models.IntegerField(default=0)),
+                ('video_count', models.IntegerField(default=0)),
+                ('total_duration', models.IntegerField(default=0)),
+                ('enrollment_count', models.IntegerField(default=0)),
+                ('gross_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.RunPython(populate_course_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import migrations, models
+
+
+def fill_sale_price(apps, schema_editor):
+    Course = apps.get_model('app', 'Course')
+    courses = list(Course.objects.only('id', 'price', 'discount'))
+    for course in courses:
+        price = course.price or Decimal('0')
+        discount = course.discount or Decimal('0')
+        course.sale_price = (price - price * discount / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    Course.objects.bulk_update(courses, ['sale_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0025_coursestats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='sale_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_sale_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0029_transcodejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(db_index=True, max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('format', models.CharField(max_length=10)),
+                ('name', models.CharField(max_length=255)),
+                ('source_mtime', models.FloatField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('source_name', 'width', 'format')},
+            },
+        ),
+    ]
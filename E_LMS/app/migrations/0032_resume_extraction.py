@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0031_media_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacherapplication',
+            name='resume_pages',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherapplication',
+            name='resume_size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='teacherapplication',
+            name='resume_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='teacherapplication',
+            name='resume_text',
+            field=models.TextField(blank=True),
+        ),
+    ]
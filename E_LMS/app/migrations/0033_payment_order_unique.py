@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0032_resume_extraction'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='order_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:25
+
+import django.db.models.deletion
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_daily_earnings(apps, schema_editor):
+    TeacherEarning = apps.get_model('app', 'TeacherEarning')
+    AdminEarning = apps.get_model('app', 'AdminEarning')
+    DailyEarnings = apps.get_model('app', 'DailyEarnings')
+    rollups = defaultdict(dict)
+
+    teacher_rows = (
+        TeacherEarning.objects.order_by()
+        .values('course_id', 'teacher_id', day=TruncDate('payment__payment_date'))
+        .annotate(sales=Count('id'), gross=Sum('payment__amount_paid'), teacher_share=Sum('amount'),
+                  teacher_paid=Sum('amount', filter=Q(is_paid=True)))
+    )
+    for row in teacher_rows:
+        rollups[row['day'], row['course_id'], row['teacher_id']].update(
+            {f: row[f] or 0 for f in ('sales', 'gross', 'teacher_share', 'teacher_paid')}
+        )
+    admin_rows = (
+        AdminEarning.objects.order_by()
+        .values('course_id', teacher_id=F('course__teacher_id'), day=TruncDate('payment__payment_date'))
+        .annotate(commission=Sum('commission_amount'))
+    )
+    for row in admin_rows:
+        rollups[row['day'], row['course_id'], row['teacher_id']]['commission'] = row['commission'] or 0
+
+    DailyEarnings.objects.bulk_create(
+        [DailyEarnings(day=day, course_id=course_id, teacher_id=teacher_id, **values)
+         for (day, course_id, teacher_id), values in rollups.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0034_payment_event_inbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEarnings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('sales', models.PositiveIntegerField(default=0)),
+                ('gross', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('teacher_share', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('commission', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('teacher_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_earnings', to='app.course')),
+                ('teacher', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_earnings', to='app.teacher')),
+            ],
+            options={
+                'unique_together': {('day', 'course', 'teacher')},
+            },
+        ),
+        migrations.RunPython(populate_daily_earnings, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,10 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.text import slugify
 from django.db.models.signals import pre_save
+from decimal import Decimal, ROUND_HALF_UP
+import math
 import os
+import uuid
 
 class Categories(models.Model):
     name = models.CharField(max_length=200)
@@ -83,6 +86,8 @@ class Course(models.Model):
     slug = models.SlugField(default='',max_length=500, null=True,blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     discount = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, default=0)
+    # price after discount, kept in sync by pre_save_post_receiver; what cards show and checkout charges
+    sale_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, db_index=True)
 
 
     def __str__(self):
@@ -103,9 +108,15 @@ def create_slug(instance, new_slug=None):
         return create_slug(instance, new_slug=new_slug)
     return slug
 
+def compute_sale_price(price, discount):
+    price = Decimal(str(price or 0))
+    discount = Decimal(str(discount or 0))
+    return (price - price * discount / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
 def pre_save_post_receiver(sender, instance, *args, **kwargs):
     if not instance.slug:
         instance.slug = create_slug(instance)
+    instance.sale_price = compute_sale_price(instance.price, instance.discount)
 
 pre_save.connect(pre_save_post_receiver, Course)
 
@@ -140,10 +151,115 @@ class Video(models.Model):
     title = models.CharField(max_length=200)
     video_file = models.FileField(upload_to=video_upload_path, null=True, blank=True)
     time_duration = models.IntegerField(null=True)
+    # read from the container headers (app/media_probe.py)
+    duration_seconds = models.FloatField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.serial_number}. {self.title}"
 
+    def apply_media_info(self, info):
+        """Store probed metadata; time_duration (minutes) follows the real length."""
+        self.duration_seconds = info.duration
+        self.width = info.width
+        self.height = info.height
+        self.bitrate = info.bitrate
+        self.time_duration = max(math.ceil(info.duration / 60), 1)
+
+class TranscodeJob(models.Model):
+    """
+    Persistent queue entry turning a Video into an HLS bitrate ladder
+    (app/transcoding.py). Workers claim pending rows with a conditional
+    UPDATE; `locked_at` is a lease so a crashed worker's job is picked up again.
+    """
+    PENDING, RUNNING, READY, FAILED = "pending", "running", "ready", "failed"
+    STATUS_CHOICES = ((PENDING, "Pending"), (RUNNING, "Running"), (READY, "Ready"), (FAILED, "Failed"))
+
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name="transcode")
+    source_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    manifest_name = models.CharField(max_length=255, blank=True)
+    renditions = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.video_id} - {self.status}"
+
+class ImageRendition(models.Model):
+    """A resized WebP/JPEG copy of a course image or thumbnail, stored next to the original (app/renditions.py)."""
+    source_name = models.CharField(max_length=255, db_index=True)
+    width = models.PositiveIntegerField()
+    format = models.CharField(max_length=10)
+    name = models.CharField(max_length=255)
+    source_mtime = models.FloatField()
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("source_name", "width", "format")
+
+    def __str__(self):
+        return self.name
+
+class MediaBlob(models.Model):
+    """One stored file body, kept once under its SHA-256 (app/storage.py); `refcount` counts its MediaAlias names."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.sha256[:12]} x{self.refcount}"
+
+class MediaAlias(models.Model):
+    """A storage name (what a FileField holds) that is a hard link to a MediaBlob."""
+    name = models.CharField(max_length=255, unique=True)
+    blob = models.ForeignKey(MediaBlob, on_delete=models.PROTECT, related_name="aliases")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+class VideoUpload(models.Model):
+    """
+    A resumable lecture upload in progress (see app/uploads.py). Chunks are
+    written straight into `file_name` + '.part' in media storage; finalizing
+    renames it into place and creates the Video row.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name="video_uploads")
+    lesson = models.ForeignKey(Lesson, on_delete=models.CASCADE, related_name="video_uploads")
+    serial_number = models.IntegerField()
+    title = models.CharField(max_length=200)
+    time_duration = models.IntegerField(null=True)
+    file_name = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.title} ({self.file_name})"
+
+class VideoUploadChunk(models.Model):
+    upload = models.ForeignKey(VideoUpload, on_delete=models.CASCADE, related_name="chunks")
+    index = models.IntegerField()
+    size = models.IntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ("upload", "index")
+
+    def __str__(self):
+        return f"{self.upload_id} #{self.index}"
+
 class Payment(models.Model):
     STATUS_CHOICES = (("successful", "Successful"), ("failed", "Failed"))
 
@@ -153,7 +269,8 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='failed')
     payment_date = models.DateTimeField(auto_now_add=True)
     transaction_id = models.CharField(max_length=255, blank=True, null=True)
-    order_id = models.CharField(max_length=255, blank=True, null=True)
+    # unique: a gateway order settles exactly one payment (see app.payments)
+    order_id = models.CharField(max_length=255, blank=True, null=True, unique=True)
 
     def __str__(self):
         return f"{self.student.user.username} - {self.course.title} - {self.status}"
@@ -185,6 +302,45 @@ class AdminEarning(models.Model):
     def __str__(self):
         return f"Admin Commission {self.commission_amount} from {self.course.title}"
 
+class DailyEarnings(models.Model):
+    """
+    Sales of one course on one day, for the earnings reports (app/earnings.py).
+    Updated in the settlement transaction; `manage.py rebuild_earnings_rollups`
+    recomputes it from TeacherEarning/AdminEarning.
+    """
+    day = models.DateField()
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name="daily_earnings")
+    teacher = models.ForeignKey(Teacher, on_delete=models.CASCADE, related_name="daily_earnings")
+    sales = models.PositiveIntegerField(default=0)
+    gross = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    teacher_share = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    commission = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    teacher_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ("day", "course", "teacher")
+
+    @property
+    def teacher_unpaid(self):
+        return self.teacher_share - self.teacher_paid
+
+    def __str__(self):
+        return f"{self.day} {self.course_id}/{self.teacher_id}: {self.gross}"
+
+class PaymentEvent(models.Model):
+    """
+    Inbox of signed gateway webhooks, stored as received by payment_webhook
+    and applied in batches by `manage.py payment_webhook_worker` (app/webhooks.py).
+    """
+    event_id = models.CharField(max_length=64, unique=True)
+    body = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    error = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.event_id} ({'processed' if self.processed_at else 'pending'})"
+
 def resume_upload_path(instance, filename):
     # Clean name
     name_slug = slugify(f"{instance.first_name}_{instance.last_name}")
@@ -199,6 +355,9 @@ class TeacherApplication(models.Model):
         ('accepted', 'Accepted'),
         ('rejected', 'Rejected'),
     )
+    RESUME_PENDING, RESUME_READY, RESUME_FAILED = "pending", "ready", "failed"
+    RESUME_STATUS_CHOICES = ((RESUME_PENDING, "Pending"), (RESUME_READY, "Ready"), (RESUME_FAILED, "Failed"))
+
     username = models.CharField(max_length=100)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
@@ -209,6 +368,24 @@ class TeacherApplication(models.Model):
     resume = models.FileField(upload_to=resume_upload_path)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     applied_on = models.DateTimeField(auto_now_add=True)
+    # filled in from the PDF by `manage.py resume_worker` (app/resumes.py)
+    resume_size = models.PositiveIntegerField(null=True, blank=True)
+    resume_status = models.CharField(max_length=10, choices=RESUME_STATUS_CHOICES, default=RESUME_PENDING, db_index=True)
+    resume_pages = models.PositiveIntegerField(null=True, blank=True)
+    resume_text = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.first_name} {self.last_name} - {self.status}"
+
+class CourseStats(models.Model):
+    # Denormalized per-course counters, kept current by signals in app/signals.py
+    # (and by bulk payment settlement, app/payments.py) and rebuilt by `manage.py rebuild_course_stats`.
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, related_name="stats", primary_key=True)
+    lesson_count = models.IntegerField(default=0)
+    video_count = models.IntegerField(default=0)
+    total_duration = models.IntegerField(default=0)
+    enrollment_count = models.IntegerField(default=0)
+    gross_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
     def __str__(self):
-        return f"{self.first_name} {self.last_name} - {self.status}"
\ No newline at end of file
+        return f"Stats: {self.course.title}"
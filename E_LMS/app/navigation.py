@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from .models import Categories, Course
+from .cache_versions import get_version, bump_version
+
+NAV_TREE_KEY = "nav:tree:v{version}"
+
+
+def bump_nav_version():
+    return bump_version('nav')
+
+
+def build_navigation():
+    """
+    Category -> course links tree used by the header, built with two queries.
+    Only plain dicts are stored so the cached value never touches the ORM again.
+    """
+    tree = []
+    by_category = {}
+    for cat in Categories.objects.order_by('id').values('id', 'name', 'icon'):
+        cat['courses'] = []
+        by_category[cat['id']] = cat
+        tree.append(cat)
+
+    courses = Course.objects.order_by('id').values_list('course_category_id', 'title', 'slug')
+    for category_id, title, slug in courses:
+        cat = by_category.get(category_id)
+        if cat is None or not slug:
+            continue
+        cat['courses'].append({
+            'title': title,
+            'url': reverse("course_details", kwargs={"slug": slug}),
+        })
+    return tree
+
+
+def get_navigation():
+    key = NAV_TREE_KEY.format(version=get_version('nav'))
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_navigation()
+        # also bounds how stale a worker with its own (LocMem) cache can get
+        cache.set(key, tree, getattr(settings, 'NAV_CACHE_TIMEOUT', 60 * 5))
+    return tree
@@ -0,0 +1,99 @@
+import hashlib
+import re
+import time
+from functools import wraps
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from .cache_versions import get_version
+
+PAGE_VERSION = 'pages'           # bumped by Course/Categories/Lesson/Video signals
+PAGE_TIMEOUT = 60 * 10
+LOCK_TIMEOUT = 30                # a crashed rebuild frees the lock after this
+WAIT_STEP, WAIT_TOTAL = 0.05, 2.0
+
+# Pages carry the login/register modals, so the per-visitor CSRF token is
+# swapped for a placeholder before storing and filled in again when served.
+CSRF_INPUT_REGEX = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_PLACEHOLDER = b'__csrf_token__'
+
+
+def get_or_build(base_key, version, builder, timeout=PAGE_TIMEOUT):
+    """
+    Versioned get-or-set with a stampede guard. Only the worker holding the
+    lock rebuilds after an invalidation; everyone else serves the last good
+    value (any version) or, if there is none yet, waits briefly for it.
+    """
+    key = f"{base_key}:v{version}"
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    latest_key = f"{base_key}:latest"
+    lock_key = f"{base_key}:lock"
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = builder()
+            if value is not None:
+                cache.set_many({key: value, latest_key: value}, timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    stale = cache.get(latest_key)
+    if stale is not None:
+        return stale
+
+    waited = 0.0
+    while waited < WAIT_TOTAL:
+        time.sleep(WAIT_STEP)
+        waited += WAIT_STEP
+        value = cache.get(key)
+        if value is not None:
+            return value
+    # The lock holder is slow or gone: build for this request without storing
+    return builder()
+
+
+def _cacheable_request(request):
+    if request.method != 'GET' or request.user.is_authenticated:
+        return False
+    # Flash messages are rendered into the page, so those responses are per-visitor
+    return not len(get_messages(request))
+
+
+def cache_anonymous_page(name, timeout=PAGE_TIMEOUT):
+    """
+    Cache the whole response for anonymous GETs, keyed by path + query string
+    and the current page version.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            rendered = {}
+
+            def build():
+                response = rendered['response'] = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return None
+                content = CSRF_INPUT_REGEX.sub(rb'\1' + CSRF_PLACEHOLDER + rb'\2', response.content)
+                return {'content': content, 'content_type': response['Content-Type']}
+
+            path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            page = get_or_build(f"page:{name}:{path_hash}", get_version(PAGE_VERSION), build, timeout)
+            if page is None:
+                # Not cacheable (error/redirect): hand back what the view produced
+                return rendered.get('response') or view(request, *args, **kwargs)
+
+            content = page['content']
+            if CSRF_PLACEHOLDER in content:
+                content = content.replace(CSRF_PLACEHOLDER, get_token(request).encode())
+            response = HttpResponse(content, content_type=page['content_type'])
+            response['Vary'] = 'Cookie'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,103 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from .earnings import bump_rollups, empty_rollup, rollup_day
+from .models import AdminEarning, Enrollment, Payment, TeacherEarning
+from .stats import bump_course_stats
+from .teacher_metrics import bump_teacher_metrics
+
+TEACHER_SHARE = Decimal('0.8')
+CENT = Decimal('0.01')
+
+
+def split_amount(amount):
+    """(teacher amount, admin commission) for a payment; the two always add up to `amount`."""
+    teacher_amount = (TEACHER_SHARE * amount).quantize(CENT)
+    return teacher_amount, amount - teacher_amount
+
+
+def settle_payments(settlements):
+    """
+    Settle many orders at once: {order_id: gateway payment id}. In one
+    transaction, under a lock on the payment rows, every payment not yet
+    successful is marked so, its student enrolled and both earnings booked,
+    each table written with a single bulk statement. Orders that are unknown
+    or already settled are skipped. Returns the payments settled now.
+
+    The bulk writes bypass the model signals, so the CourseStats counters
+    they would have bumped are bumped here, with the DailyEarnings rollups;
+    the teachers' cached dashboard metrics are dropped on commit.
+    """
+    settlements = {order_id: payment_id for order_id, payment_id in settlements.items() if order_id}
+    if not settlements:
+        return []
+
+    with transaction.atomic():
+        payments = list(
+            Payment.objects.select_for_update().select_related('course')
+            .filter(order_id__in=settlements).exclude(status='successful').order_by('id')
+        )
+        if not payments:
+            return []
+        for payment in payments:
+            payment.transaction_id = settlements[payment.order_id]
+            payment.status = 'successful'
+        Payment.objects.bulk_update(payments, ['transaction_id', 'status'])
+
+        enrolled = set(
+            Enrollment.objects.filter(student_id__in={p.student_id for p in payments},
+                                      course_id__in={p.course_id for p in payments})
+            .values_list('student_id', 'course_id')
+        )
+        enrollments, teacher_earnings, admin_earnings = [], [], []
+        deltas = defaultdict(lambda: {'gross_revenue': Decimal('0'), 'enrollment_count': 0})
+        rollups = defaultdict(empty_rollup)
+        for payment in payments:
+            deltas[payment.course_id]['gross_revenue'] += payment.amount_paid
+            if (payment.student_id, payment.course_id) not in enrolled:
+                enrolled.add((payment.student_id, payment.course_id))
+                enrollments.append(Enrollment(student_id=payment.student_id, course_id=payment.course_id, payment=payment))
+                deltas[payment.course_id]['enrollment_count'] += 1
+            teacher_amount, admin_amount = split_amount(payment.amount_paid)
+            teacher_earnings.append(TeacherEarning(
+                teacher_id=payment.course.teacher_id, course_id=payment.course_id, payment=payment,
+                amount=teacher_amount, is_paid=False,
+            ))
+            admin_earnings.append(AdminEarning(course_id=payment.course_id, payment=payment, commission_amount=admin_amount))
+            rollup = rollups[rollup_day(payment.payment_date), payment.course_id, payment.course.teacher_id]
+            rollup['sales'] += 1
+            rollup['gross'] += payment.amount_paid
+            rollup['teacher_share'] += teacher_amount
+            rollup['commission'] += admin_amount
+
+        Enrollment.objects.bulk_create(enrollments)
+        TeacherEarning.objects.bulk_create(teacher_earnings)
+        AdminEarning.objects.bulk_create(admin_earnings)
+        for course_id, course_deltas in deltas.items():
+            bump_course_stats(course_id, **course_deltas)
+        bump_rollups(rollups)
+        bump_teacher_metrics(*(payment.course.teacher_id for payment in payments))
+    return payments
+
+
+def settle_payment(order_id, transaction_id):
+    """
+    Settle one order (the verify_payment callback). Returns (payment, settled):
+    settled is False when the order was already settled (a replayed or
+    duplicated callback), in which case nothing is written. payment is None
+    for an unknown order.
+    """
+    if not order_id:
+        return None, False
+    payments = Payment.objects.select_related('course').filter(order_id=order_id)
+
+    # Replays are the common duplicate: answer them without opening a write transaction
+    payment = payments.first()
+    if payment is None or payment.status == 'successful':
+        return payment, False
+
+    settled = settle_payments({order_id: transaction_id})
+    if not settled:
+        # settled by a concurrent callback (or the webhook worker) while we waited for the lock
+        return payments.first(), False
+    return settled[0], True
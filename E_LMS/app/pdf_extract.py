@@ -0,0 +1,61 @@
+"""
+Page count and plain text of a PDF, for resume previews. Text needs pypdf;
+without it only the page count is read, from the page tree in the file.
+Scanned, encrypted or damaged PDFs just get a page count and no text.
+"""
+import io
+import re
+from collections import namedtuple
+
+try:
+    import pypdf
+except ImportError:  # page count only
+    pypdf = None
+
+PDF_MAGIC = b'%PDF-'
+TEXT_LIMIT = 20000
+MAX_PAGES_WALKED = 50
+
+PdfInfo = namedtuple('PdfInfo', 'pages text')
+
+OBJECT_REGEX = re.compile(rb'\d+\s+\d+\s+obj\b(.*?)\bendobj', re.DOTALL)
+PAGES_TYPE_REGEX = re.compile(rb'/Type\s*/Pages\b')
+PAGE_TYPE_REGEX = re.compile(rb'/Type\s*/Page\b(?!s)')
+COUNT_REGEX = re.compile(rb'/Count\s+(\d+)')
+
+
+def is_pdf(head):
+    return head.startswith(PDF_MAGIC)
+
+
+def page_count(data):
+    """
+    The root /Pages node's /Count (the largest: inner nodes count only their
+    own subtree), else the number of /Page objects. Page trees packed into
+    compressed object streams aren't visible here and count as 0.
+    """
+    counts, pages = [], 0
+    for body in OBJECT_REGEX.findall(data):
+        if PAGES_TYPE_REGEX.search(body):
+            count = COUNT_REGEX.search(body)
+            if count:
+                counts.append(int(count.group(1)))
+        elif PAGE_TYPE_REGEX.search(body):
+            pages += 1
+    return max(counts) if counts else pages
+
+
+def read_pdf(path):
+    """PdfInfo for a file, or None if it isn't a PDF at all."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not is_pdf(data):
+        return None
+    if pypdf is not None:
+        try:
+            reader = pypdf.PdfReader(io.BytesIO(data))
+            text = '\n'.join((page.extract_text() or '') for page in reader.pages[:MAX_PAGES_WALKED])
+            return PdfInfo(len(reader.pages), text.strip()[:TEXT_LIMIT])
+        except Exception:
+            pass  # encrypted or damaged: pypdf raises all sorts here
+    return PdfInfo(page_count(data), '')
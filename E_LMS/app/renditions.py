@@ -0,0 +1,101 @@
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image, ImageOps
+from .models import Course, ImageRendition, Video
+
+DEFAULT_WIDTHS = (320, 640, 960)
+# format -> (file extension, Pillow save options)
+FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_widths():
+    return tuple(getattr(settings, 'IMAGE_RENDITION_WIDTHS', DEFAULT_WIDTHS))
+
+
+def rendition_name(source_name, width, fmt):
+    """'Media/course_image/x.png' -> 'Media/course_image/x__w640.webp' (next to the original)."""
+    root, _ext = os.path.splitext(source_name)
+    return f"{root}__w{width}.{FORMATS[fmt][0]}"
+
+
+def rendition_url(source_name, width, fmt):
+    return reverse('image_rendition', kwargs={'width': width, 'fmt': fmt, 'name': source_name})
+
+
+def is_fresh(source_name, width, fmt):
+    """Rendition file exists and is not older than its original: two stat calls, no query."""
+    try:
+        source_mtime = os.stat(default_storage.path(source_name)).st_mtime
+        return os.stat(default_storage.path(rendition_name(source_name, width, fmt))).st_mtime >= source_mtime
+    except (OSError, NotImplementedError):
+        return False
+
+
+def is_known_image(source_name):
+    return (
+        Course.objects.filter(course_image=source_name).exists()
+        or Video.objects.filter(thumbnail=source_name).exists()
+    )
+
+
+def generate_renditions(source_name):
+    """
+    Decode the original once and write every width x format. Widths larger
+    than the original are written at the original size (never upscaled), so
+    each srcset URL always resolves. Returns the number of files written.
+    """
+    source_path = default_storage.path(source_name)
+    source_mtime = os.stat(source_path).st_mtime
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    rows = []
+    for width in rendition_widths():
+        resized = image.copy()
+        if resized.width > width:
+            resized.thumbnail((width, width * 10), Image.LANCZOS)
+        for fmt, (ext, options) in FORMATS.items():
+            out = resized
+            if fmt == 'jpeg' and out.mode not in ('RGB', 'L'):
+                out = out.convert('RGB')
+            name = rendition_name(source_name, width, fmt)
+            path = default_storage.path(name)
+            # a temp file of our own: another request may be generating the same rendition
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f"{os.path.basename(path)}.", suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    out.save(f, format=fmt.upper(), **options)
+                os.chmod(tmp_path, default_storage.file_permissions_mode or 0o644)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+            rows.append(ImageRendition(
+                source_name=source_name, width=width, format=fmt, name=name,
+                source_mtime=source_mtime, size=os.path.getsize(path),
+            ))
+
+    # a concurrent generator may have inserted the same rows after our delete;
+    # theirs describe the same files, so keep whichever landed first
+    with transaction.atomic():
+        ImageRendition.objects.filter(source_name=source_name).delete()
+        ImageRendition.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows)
+
+
+def ensure_renditions(source_name):
+    """Generate if any rendition is missing or stale; used on upload and by the lazy view."""
+    if not source_name:
+        return False
+    if all(is_fresh(source_name, w, f) for w in rendition_widths() for f in FORMATS):
+        return False
+    generate_renditions(source_name)
+    return True
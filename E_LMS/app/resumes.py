@@ -0,0 +1,94 @@
+import logging
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+from .models import TeacherApplication
+from .pdf_extract import PDF_MAGIC, is_pdf, read_pdf
+
+logger = logging.getLogger("app.resumes")
+
+
+def resume_max_size():
+    return getattr(settings, 'RESUME_MAX_SIZE', 5 * 1024 * 1024)
+
+
+class PdfUploadHandler(FileUploadHandler):
+    """
+    Checks one upload field while the request body is still being parsed:
+    the first bytes must be a PDF signature and the running total must stay
+    under RESUME_MAX_SIZE. On either failure the file is dropped (SkipFile)
+    before the rest of it is buffered or written anywhere, and `error` says why.
+    Insert it first in request.upload_handlers, before request.POST is read.
+    """
+
+    def __init__(self, request=None, field_name='resume', max_size=None):
+        super().__init__(request)
+        self.field_name = field_name
+        self.max_size = max_size or resume_max_size()
+        self.error = None
+        self.checking = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.checking = field_name == self.field_name
+        self.head = b''
+        self.received = 0
+        if self.checking and content_length and content_length > self.max_size:
+            self.reject_size()
+
+    def reject_size(self):
+        self.error = f"Resume must be smaller than {filesizeformat(self.max_size)}."
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.checking:
+            return raw_data
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject_size()
+        if len(self.head) < len(PDF_MAGIC):
+            self.head += raw_data[:len(PDF_MAGIC) - len(self.head)]
+            if len(self.head) == len(PDF_MAGIC) and not is_pdf(self.head):
+                self.error = "Resume must be a PDF file."
+                raise SkipFile()
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.checking and not is_pdf(self.head):
+            # shorter than the signature itself
+            self.error = "Resume must be a PDF file."
+        return None
+
+
+def extract_resume(application):
+    """
+    Read page count and text from the stored PDF into the application row.
+    Any failure marks the row failed, so resume_worker never picks it again.
+    """
+    try:
+        info = read_pdf(default_storage.path(application.resume.name))
+    except Exception:
+        logger.warning("Resume of application %s unreadable", application.id, exc_info=True)
+        info = None
+    if info is None:
+        TeacherApplication.objects.filter(pk=application.pk).update(resume_status=TeacherApplication.RESUME_FAILED)
+        return False
+    TeacherApplication.objects.filter(pk=application.pk).update(
+        resume_status=TeacherApplication.RESUME_READY, resume_pages=info.pages, resume_text=info.text,
+    )
+    return True
+
+
+def process_pending_resumes(limit=50):
+    """
+    Extract up to `limit` pending resumes; returns how many were handled.
+    Extraction is idempotent, so a second worker only repeats work.
+    """
+    pending = (TeacherApplication.objects.filter(resume_status=TeacherApplication.RESUME_PENDING)
+               .exclude(resume='').only('id', 'resume').order_by('id')[:limit])
+    done = 0
+    for application in pending:
+        extract_resume(application)
+        done += 1
+    return done
@@ -0,0 +1,150 @@
+import re
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from .models import Course, Lesson, Video
+from .catalog import with_card_stats
+
+SEARCH_TABLE = "app_course_search"
+SEARCH_PAGE_SIZE = 12
+# bm25 column weights: title, descriptions, category, teacher, curriculum
+BM25_WEIGHTS = "10.0, 2.0, 4.0, 4.0, 1.0"
+# Control characters can't come from user text, so they are safe snippet markers
+_MARK_START, _MARK_END = "\x02", "\x03"
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+_INSERT_SQL = (
+    f"INSERT INTO {SEARCH_TABLE} (rowid, title, descriptions, category, teacher, curriculum) "
+    f"VALUES (%s, %s, %s, %s, %s, %s)"
+)
+
+
+def fts_available():
+    return connection.vendor == "sqlite"
+
+
+def _documents(course_ids=None):
+    """
+    Yield (id, title, descriptions, category, teacher, curriculum) rows using
+    three queries for any number of courses.
+    """
+    courses = Course.objects.order_by('id')
+    lessons = Lesson.objects.order_by('id')
+    videos = Video.objects.order_by('serial_number', 'id')
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+        lessons = lessons.filter(course_id__in=course_ids)
+        videos = videos.filter(course_id__in=course_ids)
+
+    curriculum = {}
+    for course_id, name in lessons.values_list('course_id', 'name').iterator():
+        curriculum.setdefault(course_id, []).append(name)
+    for course_id, title in videos.values_list('course_id', 'title').iterator():
+        curriculum.setdefault(course_id, []).append(title)
+
+    rows = courses.values_list(
+        'id', 'title', 'descriptions', 'course_category__name',
+        'teacher__user__first_name', 'teacher__user__last_name', 'teacher__user__username',
+    )
+    for cid, title, descriptions, category, first, last, username in rows.iterator():
+        teacher = " ".join(part for part in (first, last, username) if part)
+        yield (cid, title, descriptions, category or "", teacher, " ".join(curriculum.get(cid, [])))
+
+
+def index_courses(course_ids):
+    if not fts_available() or not course_ids:
+        return
+    course_ids = list(course_ids)
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(cid,) for cid in course_ids])
+        cursor.executemany(_INSERT_SQL, list(_documents(course_ids)))
+
+
+def remove_courses(course_ids):
+    if not fts_available() or not course_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(cid,) for cid in course_ids])
+
+
+def rebuild_index(batch_size=500):
+    """Drop every row and re-insert the whole catalog in batches. Returns the row count."""
+    if not fts_available():
+        return 0
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        batch = []
+        for doc in _documents():
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                cursor.executemany(_INSERT_SQL, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(_INSERT_SQL, batch)
+            total += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def build_match_query(text):
+    """
+    Turn free user input into a safe FTS5 expression: every word is quoted
+    (so operators and punctuation are never interpreted) and the last word
+    is a prefix match to support search-as-you-type.
+    """
+    tokens = TOKEN_REGEX.findall(text or "")
+    if not tokens:
+        return ""
+    terms = ['"%s"' % t for t in tokens[:-1]]
+    terms.append('"%s"*' % tokens[-1])
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def search_courses(text, page=1, size=SEARCH_PAGE_SIZE):
+    """
+    BM25-ranked course search. Returns {'courses', 'page', 'has_next', 'has_prev'};
+    every course carries a `search_snippet` with <mark> highlighted terms.
+    """
+    try:
+        page = max(int(page), 1)
+    except (TypeError, ValueError):
+        page = 1
+    result = {'courses': [], 'page': page, 'has_next': False, 'has_prev': page > 1}
+
+    match = build_match_query(text)
+    if not match:
+        return result
+
+    if not fts_available():
+        # Non-SQLite databases: plain title/description scan, unranked
+        qs = with_card_stats(Course.objects.filter(Q(title__icontains=text) | Q(descriptions__icontains=text)))
+        rows = list(qs.order_by('id')[(page - 1) * size:page * size + 1])
+        for course in rows:
+            course.search_snippet = escape(course.descriptions[:160])
+        result['has_next'] = len(rows) > size
+        result['courses'] = rows[:size]
+        return result
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, snippet({SEARCH_TABLE}, -1, %s, %s, '…', 16) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            f"ORDER BY bm25({SEARCH_TABLE}, {BM25_WEIGHTS}) LIMIT %s OFFSET %s",
+            [_MARK_START, _MARK_END, match, size + 1, (page - 1) * size],
+        )
+        hits = cursor.fetchall()
+
+    result['has_next'] = len(hits) > size
+    hits = hits[:size]
+    courses = with_card_stats(Course.objects.filter(id__in=[h[0] for h in hits])).in_bulk()
+    for course_id, snippet in hits:
+        course = courses.get(course_id)
+        if course is not None:
+            course.search_snippet = _highlight(snippet)
+            result['courses'].append(course)
+    return result
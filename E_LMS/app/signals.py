@@ -1,7 +1,18 @@
 # app/signals.py
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Users, Student, Teacher, AdminProfile
+from .models import Users, Student, Teacher, AdminProfile, Course, Categories, Lesson, Video, \
+    CourseStats, Enrollment, Payment
+from .navigation import bump_nav_version
+from .cache_versions import bump_version
+from .page_cache import PAGE_VERSION
+from .search import index_courses, remove_courses
+from .stats import bump_course_stats, as_int, as_decimal
+from .curriculum import bump_curriculum_version
+from .teacher_metrics import bump_teacher_metrics
+from .transcode_queue import enqueue_transcode
+from .renditions import ensure_renditions
 
 @receiver(post_save, sender=Users)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -21,3 +32,160 @@ def save_user_profile(sender, instance, **kwargs):
         instance.teacher_profile.save()
     elif instance.role == "admin" and hasattr(instance, "admin_profile"):
         instance.admin_profile.save()
+
+# Navigation cache: any course/category change invalidates the header tree
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def invalidate_navigation(sender, **kwargs):
+    bump_nav_version()
+
+# Cached anonymous pages and card fragments also show per-course video counts
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def invalidate_pages(sender, **kwargs):
+    bump_version(PAGE_VERSION)
+
+# Full-text search index: same database, so updates share the caller's transaction
+@receiver(post_save, sender=Course)
+def index_course(sender, instance, **kwargs):
+    index_courses([instance.id])
+
+@receiver(post_delete, sender=Course)
+def unindex_course(sender, instance, **kwargs):
+    remove_courses([instance.id])
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def reindex_curriculum(sender, instance, **kwargs):
+    index_courses([instance.course_id])
+
+@receiver(post_save, sender=Categories)
+def reindex_category(sender, instance, created, **kwargs):
+    if not created:
+        index_courses(Course.objects.filter(course_category=instance).values_list('id', flat=True))
+
+# CourseStats counters
+@receiver(post_save, sender=Course)
+def create_course_stats(sender, instance, created, **kwargs):
+    if created:
+        CourseStats.objects.get_or_create(course=instance)
+
+# Teacher dashboard numbers (app/teacher_metrics.py) include the course count
+@receiver(post_save, sender=Course)
+def course_added(sender, instance, created, **kwargs):
+    if created:
+        bump_teacher_metrics(instance.teacher_id)
+
+@receiver(post_delete, sender=Course)
+def course_removed(sender, instance, **kwargs):
+    bump_teacher_metrics(instance.teacher_id)
+
+@receiver(post_save, sender=Lesson)
+def lesson_added(sender, instance, created, **kwargs):
+    if created:
+        bump_course_stats(instance.course_id, lesson_count=1)
+
+@receiver(post_delete, sender=Lesson)
+def lesson_removed(sender, instance, **kwargs):
+    bump_course_stats(instance.course_id, seed=False, lesson_count=-1)
+
+@receiver(pre_save, sender=Video)
+def remember_video(sender, instance, **kwargs):
+    # Old course/duration, so an edit can be applied as a delta
+    instance._stats_before = None
+    if instance.pk:
+        instance._stats_before = Video.objects.filter(pk=instance.pk).values_list('course_id', 'time_duration').first()
+
+@receiver(post_save, sender=Video)
+def video_saved(sender, instance, created, **kwargs):
+    duration = as_int(instance.time_duration)
+    before = getattr(instance, '_stats_before', None)
+    if created or before is None:
+        bump_course_stats(instance.course_id, video_count=1, total_duration=duration)
+        return
+    old_course_id, old_duration = before
+    if old_course_id != instance.course_id:
+        bump_course_stats(old_course_id, video_count=-1, total_duration=-as_int(old_duration))
+        bump_course_stats(instance.course_id, video_count=1, total_duration=duration)
+    else:
+        bump_course_stats(instance.course_id, total_duration=duration - as_int(old_duration))
+
+@receiver(post_delete, sender=Video)
+def video_removed(sender, instance, **kwargs):
+    bump_course_stats(instance.course_id, seed=False, video_count=-1, total_duration=-as_int(instance.time_duration))
+
+@receiver(post_save, sender=Enrollment)
+def enrollment_added(sender, instance, created, **kwargs):
+    if created:
+        bump_course_stats(instance.course_id, enrollment_count=1)
+
+@receiver(post_delete, sender=Enrollment)
+def enrollment_removed(sender, instance, **kwargs):
+    bump_course_stats(instance.course_id, seed=False, enrollment_count=-1)
+
+@receiver(pre_save, sender=Payment)
+def remember_payment(sender, instance, **kwargs):
+    instance._stats_before = None
+    if instance.pk:
+        instance._stats_before = Payment.objects.filter(pk=instance.pk).values_list('status', 'amount_paid').first()
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    # Only successful payments count towards revenue
+    before = getattr(instance, '_stats_before', None)
+    was_counted = before is not None and before[0] == 'successful'
+    old_amount = as_decimal(before[1]) if was_counted else 0
+    new_amount = as_decimal(instance.amount_paid) if instance.status == 'successful' else 0
+    bump_course_stats(instance.course_id, gross_revenue=new_amount - old_amount)
+
+@receiver(post_delete, sender=Payment)
+def payment_removed(sender, instance, **kwargs):
+    if instance.status == 'successful':
+        bump_course_stats(instance.course_id, seed=False, gross_revenue=-as_decimal(instance.amount_paid))
+
+# Curriculum tree cache (course_details / watch_course)
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+@receiver(post_save, sender=Video)
+@receiver(post_delete, sender=Video)
+def invalidate_curriculum(sender, instance, **kwargs):
+    bump_curriculum_version(instance.course_id)
+    before = getattr(instance, '_stats_before', None)
+    if before and before[0] != instance.course_id:
+        bump_curriculum_version(before[0])
+
+# HLS ladder: (re)queue a transcode whenever a video gets a new file
+@receiver(post_save, sender=Video)
+def queue_transcode(sender, instance, **kwargs):
+    if instance.video_file:
+        video_id, name = instance.pk, instance.video_file.name
+        transaction.on_commit(lambda: enqueue_transcode(video_id, name))
+
+# Image renditions for srcset, built once the upload is committed
+def _renditions_on_commit(name):
+    def build():
+        try:
+            ensure_renditions(name)
+        except OSError:
+            pass  # missing/unreadable file: the lazy view retries on first request
+    transaction.on_commit(build)
+
+@receiver(post_save, sender=Course)
+def course_image_renditions(sender, instance, **kwargs):
+    if instance.course_image:
+        _renditions_on_commit(instance.course_image.name)
+
+@receiver(post_save, sender=Video)
+def thumbnail_renditions(sender, instance, **kwargs):
+    if instance.thumbnail:
+        _renditions_on_commit(instance.thumbnail.name)
@@ -0,0 +1,132 @@
+"""
+Static build step, run by `manage.py collectstatic`: the per-page script and
+style lists are concatenated into STATIC_BUNDLES, every file is fingerprinted
+(ManifestStaticFilesStorage) and text assets get .br/.gz siblings that
+PrecompressedStaticMiddleware (app/middleware.py) or nginx's gzip_static /
+brotli_static can send as they are.
+"""
+import gzip
+import posixpath
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:  # .gz siblings only
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # bundles are concatenated without minifying non-.min sources
+    rjsmin = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml', '.ttf', '.eot', '.otf', '.ico')
+MIN_COMPRESS_SIZE = 1024
+SOURCE_MAP_REGEX = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.MULTILINE)
+CSS_URL_REGEX = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+# strings are matched first so comments and spacing inside them are left alone
+CSS_TOKEN_REGEX = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|\s*([{};,>])\s*|\s+''', re.DOTALL)
+
+
+def static_bundles():
+    return getattr(settings, 'STATIC_BUNDLES', {})
+
+
+def minify_css(css):
+    """Drop comments and collapse whitespace; no rewriting that could change meaning."""
+    def replace(match):
+        string, comment, punctuation = match.groups()
+        if string:
+            return string
+        if comment:
+            return ''
+        return punctuation or ' '
+    return CSS_TOKEN_REGEX.sub(replace, css).strip()
+
+
+def minify_js(js):
+    return rjsmin.jsmin(js) if rjsmin else js
+
+
+def rebase_css_urls(css, source, bundle):
+    """Rewrite relative url()s of `source` so they still resolve from the bundle's directory."""
+    source_dir, bundle_dir = posixpath.dirname(source), posixpath.dirname(bundle)
+
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', '#', '/')) or '://' in url:
+            return match.group(0)
+        # keep '?#iefix'-style suffixes as they are
+        split = re.search(r'[?#]', url)
+        path, suffix = (url[:split.start()], url[split.start():]) if split else (url, '')
+        target = posixpath.normpath(posixpath.join(source_dir, path))
+        return f'url({quote}{posixpath.relpath(target, bundle_dir)}{suffix}{quote})'
+    return CSS_URL_REGEX.sub(replace, css)
+
+
+def build_bundle(storage, bundle, sources):
+    parts = []
+    for source in sources:
+        with storage.open(source) as f:
+            text = SOURCE_MAP_REGEX.sub('', f.read().decode('utf-8'))
+        if bundle.endswith('.css'):
+            text = rebase_css_urls(text, source, bundle)
+            parts.append(text if source.endswith('.min.css') else minify_css(text))
+        else:
+            parts.append(text if source.endswith('.min.js') else minify_js(text))
+    # ';' guards against sources that end without one
+    separator = '\n' if bundle.endswith('.css') else '\n;\n'
+    content = separator.join(part.strip() for part in parts) + '\n'
+    if storage.exists(bundle):
+        storage.delete(bundle)
+    storage.save(bundle, ContentFile(content.encode('utf-8')))
+
+
+def write_compressed(storage, name):
+    """`name`.gz and, with the brotli package, `name`.br, when they're worth it."""
+    if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+        return 0
+    with storage.open(name) as f:
+        data = f.read()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return 0
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    written = 0
+    for suffix, compressed in variants:
+        # not worth a second file (and a decode on the client) below ~5% savings
+        if len(compressed) < len(data) * 0.95:
+            if storage.exists(name + suffix):
+                storage.delete(name + suffix)
+            storage.save(name + suffix, ContentFile(compressed))
+            written += 1
+    return written
+
+
+class BundledManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that builds STATIC_BUNDLES before hashing and
+    precompresses the hashed files after. Until collectstatic has written a
+    manifest (development, tests) URLs are the plain, unhashed names.
+    """
+
+    def url(self, name, force=False):
+        if not self.hashed_files and not force:
+            return FileSystemStorage.url(self, name)
+        return super().url(name, force)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for bundle, sources in static_bundles().items():
+                build_bundle(self, bundle, sources)
+                paths[bundle] = (self, bundle)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        if not dry_run:
+            for name in sorted(set(self.hashed_files.values())):
+                write_compressed(self, name)
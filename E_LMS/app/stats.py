@@ -0,0 +1,97 @@
+from decimal import Decimal
+from django.db.models import Count, F, Sum
+from .models import Course, CourseStats, Enrollment, Lesson, Payment, Video
+
+STAT_FIELDS = ('lesson_count', 'video_count', 'total_duration', 'enrollment_count', 'gross_revenue')
+
+
+def as_int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def as_decimal(value):
+    return Decimal(str(value or 0))
+
+
+def bump_course_stats(course_id, seed=True, **deltas):
+    """
+    Apply counter deltas with F() so concurrent writers never lose an update.
+    With seed=False a missing row is left missing: post_delete handlers pass
+    it, since during a cascading course delete the CourseStats row is already
+    gone and re-creating it would point at the course being deleted.
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not course_id or not deltas:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if not CourseStats.objects.filter(course_id=course_id).update(**updates) and seed:
+        # First touch for a course that predates the table: seed it from the source rows
+        if Course.objects.filter(id=course_id).exists():
+            rebuild_course_stats([course_id])
+
+
+def compute_course_stats(course_ids=None):
+    """
+    Recompute every counter from the source tables with one grouped query per
+    table. Returns {course_id: {field: value}}.
+    """
+    courses = Course.objects.all()
+    lessons = Lesson.objects.all()
+    videos = Video.objects.all()
+    enrollments = Enrollment.objects.all()
+    payments = Payment.objects.filter(status='successful')
+    if course_ids is not None:
+        courses = courses.filter(id__in=course_ids)
+        lessons = lessons.filter(course_id__in=course_ids)
+        videos = videos.filter(course_id__in=course_ids)
+        enrollments = enrollments.filter(course_id__in=course_ids)
+        payments = payments.filter(course_id__in=course_ids)
+
+    stats = {
+        cid: {'lesson_count': 0, 'video_count': 0, 'total_duration': 0, 'enrollment_count': 0, 'gross_revenue': Decimal('0.00')}
+        for cid in courses.values_list('id', flat=True)
+    }
+
+    def merge(queryset, **aggregates):
+        for row in queryset.order_by().values('course_id').annotate(**aggregates):
+            if row['course_id'] in stats:
+                for field in aggregates:
+                    stats[row['course_id']][field] = row[field] or 0
+
+    merge(lessons, lesson_count=Count('id'))
+    merge(videos, video_count=Count('id'), total_duration=Sum('time_duration'))
+    merge(enrollments, enrollment_count=Count('id'))
+    merge(payments, gross_revenue=Sum('amount_paid'))
+    return stats
+
+
+def rebuild_course_stats(course_ids=None, dry_run=False):
+    """
+    Bring CourseStats in line with the source tables. Returns a list of
+    (course_id, field, stored, actual) tuples for every counter that drifted.
+    """
+    expected = compute_course_stats(course_ids)
+    stored = {
+        row['course_id']: row
+        for row in CourseStats.objects.filter(course_id__in=expected.keys()).values('course_id', *STAT_FIELDS)
+    }
+
+    drift, to_create, to_update = [], [], []
+    for course_id, values in expected.items():
+        current = stored.get(course_id)
+        if current is None:
+            drift.append((course_id, 'row', None, 'missing'))
+            to_create.append(CourseStats(course_id=course_id, **values))
+            continue
+        changed = [(f, current[f], values[f]) for f in STAT_FIELDS if current[f] != values[f]]
+        if changed:
+            drift.extend((course_id, f, old, new) for f, old, new in changed)
+            to_update.append(CourseStats(course_id=course_id, **values))
+
+    if not dry_run:
+        CourseStats.objects.bulk_create(to_create, batch_size=500, ignore_conflicts=True)
+        CourseStats.objects.bulk_update(to_update, STAT_FIELDS, batch_size=500)
+    return drift
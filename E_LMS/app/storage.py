@@ -0,0 +1,218 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import MediaAlias, MediaBlob
+
+BLOB_ROOT = 'blobs'
+READ_BUFFER = 1024 * 1024
+# os.link errors meaning "no hard link here" (another filesystem, or one
+# without them, or the link limit), rather than a real I/O problem
+LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+
+def blob_name(digest):
+    """'3fa9...' -> 'blobs/3f/a9/3fa9...' (two fan-out levels keep directories small)."""
+    return f'{BLOB_ROOT}/{digest[:2]}/{digest[2:4]}/{digest}'
+
+
+def link_or_copy(source, target, exclusive=True):
+    """
+    os.link(source, target), or a copy where the filesystem can't hard link.
+    An exclusive copy fails with FileExistsError like os.link; otherwise the
+    copy is written aside and renamed over `target`, so it never shows half
+    written (for blobs, whose racing writers all hold the same bytes).
+    """
+    try:
+        os.link(source, target)
+        return
+    except OSError as e:
+        if e.errno not in LINK_UNSUPPORTED:
+            raise
+    if exclusive:
+        with open(source, 'rb') as src, open(target, 'xb') as dst:
+            try:
+                shutil.copyfileobj(src, dst, READ_BUFFER)
+            except BaseException:
+                os.remove(target)
+                raise
+        return
+    if os.path.exists(target):
+        raise FileExistsError(errno.EEXIST, "File exists", target)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+    try:
+        with os.fdopen(fd, 'wb') as dst, open(source, 'rb') as src:
+            shutil.copyfileobj(src, dst, READ_BUFFER)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while data := f.read(READ_BUFFER):
+            digest.update(data)
+            size += len(data)
+    return digest.hexdigest(), size
+
+
+class DedupFileSystemStorage(FileSystemStorage):
+    """
+    Content-addressed FileSystemStorage. A saved file is hashed while it is
+    written and kept once, under blob_name(sha256); the name the field asked
+    for (e.g. from video_upload_path) is a hard link to that blob. path(),
+    X-Accel-Redirect and ffmpeg therefore see an ordinary file, and storing
+    the same bytes under a second name only adds a directory entry.
+
+    MediaBlob.refcount counts the MediaAlias names of each blob; delete()
+    drops one alias and removes the blob with its last one. Names with no
+    MediaAlias row (files from before this storage) are deleted as usual.
+    """
+
+    def _save(self, name, content):
+        tmp_path, digest, size = self._write_temp(content.chunks())
+        try:
+            return self._link(name, tmp_path, digest, size)
+        finally:
+            os.remove(tmp_path)
+
+    def _write_temp(self, chunks):
+        tmp_dir = self.path(f'{BLOB_ROOT}/tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(tmp_path, self.file_permissions_mode)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest(), size
+
+    def _link(self, name, source_path, digest, size):
+        """
+        Make `name` a hard link to the blob, creating the blob from
+        `source_path` if this content is new. The reference is counted first,
+        so a concurrent delete() of the last alias cannot remove the blob
+        between our check and our link; if linking fails it is given back.
+        Where hard links aren't possible the blob and the name are copies.
+        """
+        blob_id = self._add_reference(digest, size)
+        try:
+            name = self._link_name(name, source_path, self.path(blob_name(digest)))
+        except BaseException:
+            self._release_blob(blob_id)
+            raise
+        try:
+            self._add_alias(name, blob_id)
+        except BaseException:
+            os.remove(self.path(name))
+            self._release_blob(blob_id)
+            raise
+        return name
+
+    def _link_name(self, name, source_path, blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        while True:
+            try:
+                link_or_copy(source_path, blob_path, exclusive=False)
+            except FileExistsError:
+                pass
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            try:
+                link_or_copy(blob_path, full_path)
+                return name
+            except FileExistsError:
+                name = self.get_available_name(name)
+            except FileNotFoundError:
+                # blob file removed by a delete() that committed before our reference
+                continue
+
+    def _add_reference(self, digest, size):
+        blobs = MediaBlob.objects.filter(sha256=digest)
+        if not blobs.update(refcount=F('refcount') + 1):
+            try:
+                with transaction.atomic():
+                    return MediaBlob.objects.create(sha256=digest, size=size, refcount=1).pk
+            except IntegrityError:
+                # a concurrent save of the same content created it first
+                blobs.update(refcount=F('refcount') + 1)
+        return blobs.values_list('pk', flat=True).get()
+
+    def _add_alias(self, name, blob_id):
+        try:
+            with transaction.atomic():
+                MediaAlias.objects.create(name=name, blob_id=blob_id)
+            return
+        except IntegrityError:
+            pass
+        with transaction.atomic():
+            # a row whose file was removed by hand: the name now points at new content
+            stale = MediaAlias.objects.select_for_update().get(name=name)
+            old_blob_id = stale.blob_id
+            stale.blob_id = blob_id
+            stale.save(update_fields=['blob'])
+        self._release_blob(old_blob_id)
+
+    def _release_blob(self, blob_id):
+        with transaction.atomic():
+            MediaBlob.objects.filter(pk=blob_id).update(refcount=F('refcount') - 1)
+            orphan = MediaBlob.objects.filter(pk=blob_id, refcount=0).values_list('sha256', flat=True).first()
+            if orphan:
+                MediaBlob.objects.filter(pk=blob_id, refcount=0).delete()
+        if orphan:
+            try:
+                os.remove(self.path(blob_name(orphan)))
+            except FileNotFoundError:
+                pass
+
+    def adopt(self, name):
+        """
+        Bring a file written straight to `self.path(name)` (the chunked upload
+        rename) under content addressing: hash it and either make it the blob
+        or swap it for a link to an identical existing one.
+        """
+        full_path = self.path(name)
+        digest, size = file_sha256(full_path)
+        if MediaAlias.objects.filter(name=name, blob__sha256=digest).exists():
+            return name
+        tmp_path = f'{full_path}.adopt'
+        os.replace(full_path, tmp_path)
+        try:
+            name = self._link(name, tmp_path, digest, size)
+        except BaseException:
+            os.replace(tmp_path, full_path)
+            raise
+        os.remove(tmp_path)
+        return name
+
+    def delete(self, name):
+        if not name:
+            raise ValueError("The name must be given to delete().")
+        with transaction.atomic():
+            alias = MediaAlias.objects.select_for_update().filter(name=name).first()
+            if alias is not None:
+                alias.delete()
+        if alias is None:
+            return super().delete(name)
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+        self._release_blob(alias.blob_id)
@@ -0,0 +1,157 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from .models import Video
+
+GRANT_KEY = "stream:grant:{user_id}:{video_id}"
+GRANT_TIMEOUT = 60 * 10          # a player issues many range requests per video
+
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def stream_grant(user, video_id):
+    """
+    Storage name of the video if `user` may watch it, else None. The check
+    (enrolled student, owning teacher or admin) is one query and its result is
+    cached briefly so seeking does not hit the database again.
+    """
+    key = GRANT_KEY.format(user_id=user.id, video_id=video_id)
+    name = cache.get(key)
+    if name is not None:
+        return name
+
+    videos = Video.objects.filter(id=video_id).exclude(video_file='').exclude(video_file__isnull=True)
+    if getattr(user, 'role', None) != 'admin':
+        videos = videos.filter(Q(course__enrollments__student__user=user) | Q(course__teacher__user=user))
+    name = videos.values_list('video_file', flat=True).first()
+    # Refusals aren't cached: a student who pays now must get in immediately
+    if name:
+        cache.set(key, name, GRANT_TIMEOUT)
+    return name
+
+
+def file_etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the whole
+    file (no/unsupported header, or several ranges), or False if unsatisfiable.
+    """
+    match = RANGE_REGEX.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def file_chunks(path, start, length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _offload_response(name, content_type):
+    """Let nginx (X-Accel-Redirect) or Apache (X-Sendfile) send the bytes, ranges included."""
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', None)
+    response = HttpResponse(content_type=content_type)
+    if backend == 'nginx':
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+    else:
+        response['X-Sendfile'] = default_storage.path(name)
+    return response
+
+
+def serve_media_file(request, name):
+    """
+    Serve a stored file with ETag/Last-Modified, conditional GETs and single
+    HTTP Range requests (206). With MEDIA_SENDFILE_BACKEND set the transfer is
+    handed to the web server; otherwise it is streamed in chunks from Python.
+    """
+    try:
+        path = default_storage.path(name)
+        stat = os.stat(path)
+    except (NotImplementedError, OSError):
+        return None
+
+    etag = file_etag(stat)
+    last_modified = http_date(stat.st_mtime)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if getattr(settings, 'MEDIA_SENDFILE_BACKEND', None):
+            response = _offload_response(name, content_type)
+        else:
+            response = _streaming_response(request, path, stat.st_size, content_type, etag, stat.st_mtime)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Accept-Ranges'] = 'bytes'
+    # Enrollment-gated content: browsers may keep it, shared caches may not
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+def _streaming_response(request, path, size, content_type, etag, mtime):
+    chunk_size = getattr(settings, 'MEDIA_STREAM_CHUNK_SIZE', 64 * 1024)
+    byte_range = None
+    if _if_range_matches(request, etag, mtime):
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+
+    length = end - start + 1 if size else 0
+    response = StreamingHttpResponse(
+        file_chunks(path, start, length, chunk_size) if request.method != 'HEAD' else iter(()),
+        status=status, content_type=content_type,
+    )
+    response['Content-Length'] = str(length)
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
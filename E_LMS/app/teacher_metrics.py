@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from .cache_versions import get_version, bump_version
+from .models import Course, CourseStats, Teacher
+
+METRICS_KEY = "teacher_metrics:{teacher_id}:v{version}"
+
+
+def _version_name(teacher_id):
+    return f"teacher_metrics:{teacher_id}"
+
+
+def bump_teacher_metrics(*teacher_ids):
+    """Invalidate once the current transaction commits, so no reader re-caches the old numbers."""
+    def bump():
+        for teacher_id in set(teacher_ids):
+            if teacher_id:
+                bump_version(_version_name(teacher_id))
+    transaction.on_commit(bump)
+
+
+def compute_teacher_metrics(teacher_id):
+    """
+    Every teacher dashboard number in one query: earnings by conditional
+    aggregation over the teacher's TeacherEarning rows, course and student
+    counts as scalar subqueries (joining them would multiply the sums).
+    """
+    courses = Course.objects.filter(teacher_id=OuterRef('pk')).order_by().values('teacher_id')
+    students = CourseStats.objects.filter(course__teacher_id=OuterRef('pk')).order_by().values('course__teacher_id')
+    row = (
+        Teacher.objects.filter(pk=teacher_id)
+        .annotate(
+            course_count=Subquery(courses.annotate(n=Count('pk')).values('n'), output_field=IntegerField()),
+            student_count=Subquery(students.annotate(n=Sum('enrollment_count')).values('n'), output_field=IntegerField()),
+            sales=Count('earnings'),
+            pending=Sum('earnings__amount', filter=Q(earnings__is_paid=False)),
+            received=Sum('earnings__amount', filter=Q(earnings__is_paid=True)),
+        )
+        .values('course_count', 'student_count', 'sales', 'pending', 'received')
+        .first()
+    ) or {}
+    metrics = {field: row.get(field) or 0 for field in ('course_count', 'student_count', 'sales', 'pending', 'received')}
+    metrics['total'] = metrics['pending'] + metrics['received']
+    return metrics
+
+
+def get_teacher_metrics(teacher_id):
+    """
+    {'course_count', 'student_count', 'sales', 'pending', 'received', 'total'}
+    for one teacher, cached for TEACHER_METRICS_TIMEOUT seconds and dropped
+    as soon as one of their payments settles or is paid out. Student counts
+    from free enrollments catch up when the entry times out.
+    """
+    key = METRICS_KEY.format(teacher_id=teacher_id, version=get_version(_version_name(teacher_id)))
+    metrics = cache.get(key)
+    if metrics is None:
+        metrics = compute_teacher_metrics(teacher_id)
+        cache.set(key, metrics, getattr(settings, 'TEACHER_METRICS_TIMEOUT', 5 * 60))
+    return metrics
@@ -1,14 +1,13 @@
 from django import template
-import math
+from django.utils.html import format_html
+from app.models import compute_sale_price
+from app.renditions import rendition_url, rendition_widths
 register = template.Library()
 
 @register.simple_tag
 def discount_calculation(price, discount):
-    if discount is None or discount is 0:
-        return price
-    #sellprice = price
-    sellprice = price - (price * discount / 100)
-    return math.ceil(sellprice)
+    # Prefer the stored Course.sale_price; this is for values not read from a Course row
+    return compute_sale_price(price, discount)
 
 @register.filter
 def duration_format(value):
@@ -25,3 +24,23 @@ def duration_format(value):
         return f"{minutes}:{seconds:02d}"
     except (TypeError, ValueError):
         return "0:00"
+
+@register.simple_tag
+def responsive_image(image, alt="", css_class="", sizes="(max-width: 576px) 100vw, 360px"):
+    """
+    <picture> with WebP and JPEG srcsets of a course image/thumbnail, so small
+    cards download a small rendition. URLs are built without any query;
+    renditions missing on disk are generated on first request.
+    """
+    name = getattr(image, 'name', image)
+    if not name:
+        return ""
+    widths = rendition_widths()
+    webp = ", ".join(f"{rendition_url(name, w, 'webp')} {w}w" for w in widths)
+    jpeg = ", ".join(f"{rendition_url(name, w, 'jpeg')} {w}w" for w in widths)
+    fallback = rendition_url(name, widths[len(widths) // 2], 'jpeg')
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img class="{}" src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        webp, sizes, css_class, fallback, jpeg, sizes, alt,
+    )
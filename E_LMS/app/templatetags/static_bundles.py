@@ -0,0 +1,21 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+from app.static_pipeline import static_bundles
+register = template.Library()
+
+@register.simple_tag
+def bundle(name):
+    """
+    Tags for one STATIC_BUNDLES entry: the single fingerprinted bundle once
+    collectstatic has built it, the individual source files otherwise
+    (development, where runserver serves them from STATICFILES_DIRS).
+    """
+    if not settings.DEBUG and name in getattr(staticfiles_storage, 'hashed_files', {}):
+        urls = [static(name)]
+    else:
+        urls = [static(source) for source in static_bundles()[name]]
+    tag = '<link rel="stylesheet" href="{}">' if name.endswith('.css') else '<script src="{}"></script>'
+    return format_html_join('\n    ', tag, ((url,) for url in urls))
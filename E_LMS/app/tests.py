@@ -1,3 +1,1671 @@
-from django.test import TestCase
+import errno
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import zlib
+import time
+from unittest import mock
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models.query import QuerySet
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .models import *
+from . import pdf_extract
+from .media_probe import probe_video
+from .middleware import QueryRecorder, fingerprint
+from .catalog import keyset_page, with_card_stats
+from .curriculum import get_curriculum
+from .templatetags.course_tags import discount_calculation, responsive_image
+from .renditions import generate_renditions
+from .search import rebuild_index, search_courses
+from PIL import Image
+from .media_tokens import check_token, make_token
+from .stats import rebuild_course_stats
+from .checks import check_shared_cache
+from .navigation import get_navigation
+from .page_cache import CSRF_INPUT_REGEX, CSRF_PLACEHOLDER, get_or_build
+from .storage import blob_name
+from .gateway import CircuitBreaker, get_gateway
+from .gateway_stub import StubGateway
+from .webhooks import webhook_signature
+from .earnings import mark_course_paid, rebuild_rollups
+from .teacher_metrics import get_teacher_metrics
+from .transcode_queue import TranscodeWorker, enqueue_transcode, ladder_for
+from .uploads import UploadError, finish_upload
 
 # Create your tests here.
+
+PASSWORD = "pass1234"
+COURSE_IMAGE = "Media/course_image/python_basic.png"
+NO_UPLOAD = "00000000-0000-0000-0000-000000000000"
+
+
+def seed(batch, teacher, student, courses=3, lessons=2, videos=2, students=3):
+    """
+    One batch of catalog + sales data. Every batch adds courses for the main
+    teacher that the main student is enrolled in, plus other teachers/students,
+    so any per-row query in a page shows up as growth between batches.
+    """
+    category = Categories.objects.create(name=f"Category {batch}", icon="fa fa-code")
+    level = Level.objects.create(name=f"Level {batch}")
+    language = Language.objects.create(name=f"Language {batch}")
+    other_teacher = Users.objects.create_user(
+        username=f"teacher{batch}", email=f"teacher{batch}@example.com", password=PASSWORD, role="teacher"
+    ).teacher_profile
+    buyers = [student] + [
+        Users.objects.create_user(
+            username=f"student{batch}_{n}", email=f"student{batch}_{n}@example.com", password=PASSWORD, role="student"
+        ).student_profile
+        for n in range(students)
+    ]
+
+    created = []
+    for c in range(courses):
+        for owner in (teacher, other_teacher):
+            course = Course.objects.create(
+                teacher=owner,
+                title=f"Course {batch} {c} {owner.id}",
+                descriptions="A representative course description for the catalog.",
+                course_category=category,
+                level=level,
+                language=language,
+                price=Decimal("999.00"),
+                discount=Decimal("10.00"),
+                course_image=COURSE_IMAGE,
+            )
+            created.append(course)
+            for l in range(lessons):
+                lesson = Lesson.objects.create(course=course, teacher=owner, name=f"Lesson {l}")
+                for v in range(videos):
+                    Video.objects.create(
+                        course=course, lesson=lesson, serial_number=v + 1, title=f"Video {l} {v}",
+                        time_duration=5, video_file=f"videos/{course.id}_{l}_{v}.mp4",
+                    )
+            for buyer in buyers:
+                payment = Payment.objects.create(
+                    student=buyer, course=course, amount_paid=course.sale_price, status="successful",
+                    order_id=f"order_{course.id}_{buyer.id}", transaction_id=f"pay_{course.id}_{buyer.id}",
+                )
+                Enrollment.objects.create(student=buyer, course=course, payment=payment)
+                TeacherEarning.objects.create(
+                    teacher=owner, course=course, payment=payment, amount=payment.amount_paid * Decimal("0.8")
+                )
+                AdminEarning.objects.create(course=course, payment=payment, commission_amount=payment.amount_paid * Decimal("0.2"))
+
+    TeacherApplication.objects.create(
+        username=f"applicant{batch}", first_name="App", last_name="Licant", email=f"applicant{batch}@example.com",
+        contact_no="9999999999", qualification="MSc", experience=3, resume="joiningapplications/resume.pdf",
+    )
+    return created
+
+
+# (url name, kwargs, query string). Each route must stay within its
+# settings.QUERY_BUDGETS entry, the same table the middleware warns from in
+# production, and must not grow after doubling the data.
+ROUTES = [
+    ("base", {}, ""),
+    ("page_not_found", {}, ""),
+    ("home", {}, ""),
+    ("all_courses", {}, ""),
+    ("courses_filter_data", {}, ""),
+    ("search", {}, "search=course"),
+    ("course_details", {"slug": "course"}, ""),
+    ("contact", {}, ""),
+    ("about", {}, ""),
+    ("register", {}, ""),
+    ("doLogin", {}, ""),
+    ("teacher_dashboard", {}, ""),
+    ("edit_teacher_profile", {}, ""),
+    ("add_course", {}, ""),
+    ("my_coursess", {}, ""),
+    ("edit_course", {"course_id": "course"}, ""),
+    ("add_lesson", {}, ""),
+    ("add_video", {}, "course=course"),
+    ("video_upload_start", {}, ""),
+    ("video_upload_detail", {"upload_id": NO_UPLOAD}, ""),
+    ("video_upload_chunk", {"upload_id": NO_UPLOAD, "index": 0}, ""),
+    ("video_upload_finish", {"upload_id": NO_UPLOAD}, ""),
+    ("get_lessons_ajax", {"course_id": "course"}, ""),
+    ("get_next_serial_number", {}, "lesson_id=lesson"),
+    ("enrolled_students", {}, ""),
+    ("teacher_earnings", {}, ""),
+    ("admin_dashboard", {}, ""),
+    ("edit_profile", {}, ""),
+    ("admin_courses", {}, ""),
+    ("admin_students", {}, ""),
+    ("admin_teachers", {}, ""),
+    ("admin_earnings", {}, ""),
+    ("admin_payments", {}, ""),
+    ("pay_teacher_earning", {"course_id": "course"}, ""),
+    ("apply_as_teacher", {}, ""),
+    ("admin_joining_applications", {}, ""),
+    ("update_application_status", {"app_id": "application", "status": "reject"}, ""),
+    ("logout", {}, ""),
+    ("profile", {}, ""),
+    ("profile_update", {}, ""),
+    ("checkout", {"slug": "course"}, ""),
+    ("my_courses", {}, ""),
+    ("verify_payment", {}, ""),
+    ("payment_webhook", {}, ""),
+    ("watch_course", {"slug": "course"}, ""),
+    ("stream_video", {"video_id": "video"}, ""),
+    ("stream_hls", {"video_id": "video", "path": "master.m3u8"}, ""),
+    ("stream_signed", {"video_id": "video", "token": "1.0.invalid", "name": "videos/missing.mp4"}, ""),
+    ("media_auth", {}, ""),
+    ("image_rendition", {"width": 320, "fmt": "webp", "name": "Media/course_image/missing.png"}, ""),
+]
+
+ROLES = ("anonymous", "student", "teacher", "admin")
+
+
+@override_settings(
+    ALLOWED_HOSTS=["testserver"],
+    PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"],
+)
+class QueryCountRegressionTests(TestCase):
+    """
+    Request every named route as every kind of user and assert the number of
+    SQL queries stays under its budget and does not grow with row count.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(
+            username="mainteacher", email="mainteacher@example.com", password=PASSWORD, role="teacher"
+        ).teacher_profile
+        cls.student = Users.objects.create_user(
+            username="mainstudent", email="mainstudent@example.com", password=PASSWORD, role="student"
+        ).student_profile
+        cls.admin_user = Users.objects.create_user(
+            username="mainadmin", email="mainadmin@example.com", password=PASSWORD, role="admin"
+        )
+        seed(0, cls.teacher, cls.student)
+
+    def setUp(self):
+        cache.clear()
+        course = Course.objects.filter(teacher=self.teacher).order_by('id').first()
+        self.objects = {
+            "course": course,
+            "lesson": course.lesson_set.order_by('id').first(),
+            "video": course.video_set.order_by('id').first(),
+            "application": TeacherApplication.objects.order_by('id').first(),
+        }
+        self.users = {
+            "anonymous": None,
+            "student": self.student.user,
+            "teacher": self.teacher.user,
+            "admin": self.admin_user,
+        }
+
+    def url_for(self, name, kwargs, query):
+        resolved = {}
+        for key, value in kwargs.items():
+            obj = self.objects.get(value) if isinstance(value, str) else None
+            if obj is None:
+                resolved[key] = value
+            else:
+                resolved[key] = obj.slug if key == "slug" else obj.id
+        url = reverse(name, kwargs=resolved)
+        for placeholder, obj in self.objects.items():
+            query = query.replace(f"={placeholder}", f"={obj.id}")
+        return f"{url}?{query}" if query else url
+
+    def count_queries(self, role, url):
+        # Cold cache, and roll back anything the view writes so runs are comparable
+        client = Client(raise_request_exception=False)
+        if self.users[role] is not None:
+            # fresh session every time, 'logout' would end a shared one
+            client.force_login(self.users[role])
+        cache.clear()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            transaction.set_rollback(True)
+        return len(queries), response.status_code
+
+    def measure_all(self):
+        counts = {}
+        for name, kwargs, query in ROUTES:
+            url = self.url_for(name, kwargs, query)
+            for role in ROLES:
+                counts[(name, role)] = self.count_queries(role, url)
+        return counts
+
+    def test_every_route_is_covered(self):
+        from E_LMS.urls import urlpatterns
+        named = {p.name for p in urlpatterns if getattr(p, "name", None)}
+        self.assertEqual(named - {name for name, *_ in ROUTES}, set())
+        self.assertEqual(named - set(settings.QUERY_BUDGETS), set())
+
+    def test_query_counts_stay_within_budget_and_flat(self):
+        small = self.measure_all()
+        seed(1, self.teacher, self.student)
+        large = self.measure_all()
+
+        budgets = settings.QUERY_BUDGETS
+        for (name, role), (count, status) in small.items():
+            large_count, _ = large[(name, role)]
+            with self.subTest(route=name, role=role):
+                self.assertLess(status, 500, f"{name} as {role} failed")
+                self.assertLessEqual(count, budgets[name], f"{name} as {role}: {count} queries (status {status})")
+                self.assertLessEqual(
+                    large_count, count,
+                    f"{name} as {role}: {count} -> {large_count} queries after adding rows",
+                )
+
+
+class QueryBudgetMiddlewareTests(TestCase):
+    """Server-Timing on every response; requests over their QUERY_BUDGETS entry are logged."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Categories.objects.create(name="Web")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_counts_the_requests_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("search"), {"search": "django"})
+        match = re.fullmatch(r'db;dur=\d+\.\d;desc="(\d+) queries", app;dur=\d+\.\d', response["Server-Timing"])
+        self.assertIsNotNone(match, response["Server-Timing"])
+        self.assertEqual(int(match.group(1)), len(queries))
+
+    def test_over_budget_requests_are_logged(self):
+        with self.settings(QUERY_BUDGETS={"search": 100, "search:POST": 0}):
+            with self.assertNoLogs("app.query_budget"):
+                self.client.get(reverse("search"), {"search": "django"})
+            with self.assertLogs("app.query_budget", "WARNING") as logs:
+                self.client.post(reverse("search"))
+        self.assertRegex(logs.output[0], r"Query budget exceeded on POST /search: \d+ queries \(budget 0\)")
+
+        # routes without an entry fall back to QUERY_BUDGET_DEFAULT
+        with self.settings(QUERY_BUDGETS={}, QUERY_BUDGET_DEFAULT=0):
+            with self.assertLogs("app.query_budget", "WARNING"):
+                self.client.get(reverse("search"), {"search": "django"})
+
+    def test_fingerprints_and_duplicates(self):
+        self.assertEqual(
+            fingerprint("SELECT  * FROM t WHERE id IN (%s, %s, %s) AND name = 'O''Brien' AND n > 10"),
+            "SELECT * FROM t WHERE id IN (%s, ...) AND name = ? AND n > ?",
+        )
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for pk in (1, 2, 2):
+                list(Categories.objects.filter(pk=pk))
+            Categories.objects.count()
+        self.assertEqual(recorder.count, 4)
+        self.assertEqual(len(recorder.duplicates()), 1)
+        self.assertEqual(recorder.duplicates()[0][1], 3)
+
+    @override_settings(QUERY_BUDGET_ENABLED=False)
+    def test_can_be_switched_off(self):
+        self.assertNotIn("Server-Timing", self.client.get(reverse("search")))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CatalogPaginationTests(TestCase):
+    """Keyset pages walk the catalog forward and back on Course.id, one query per page."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        seed(0, cls.teacher, cls.student, courses=3, lessons=1, videos=2, students=0)
+        cls.ids = list(Course.objects.order_by("id").values_list("id", flat=True))
+
+    def setUp(self):
+        cache.clear()
+
+    def page(self, **cursor):
+        page = keyset_page(Course.objects.all(), size=2, **cursor)
+        return [c.id for c in page["courses"]], page["prev_cursor"], page["next_cursor"]
+
+    def test_forward_and_back(self):
+        ids = self.ids
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(self.page(), (ids[0:2], None, ids[1]))
+        self.assertEqual(self.page(after=str(ids[1])), (ids[2:4], ids[2], ids[3]))
+        # exactly one page left: no next cursor
+        self.assertEqual(self.page(after=str(ids[3])), (ids[4:6], ids[4], None))
+        self.assertEqual(self.page(before=str(ids[4])), (ids[2:4], ids[2], ids[3]))
+        self.assertEqual(self.page(before=str(ids[2])), (ids[0:2], None, ids[1]))
+
+    def test_edges(self):
+        ids = self.ids
+        self.assertEqual(self.page(after=str(ids[-1])), ([], None, None))
+        self.assertEqual(self.page(before=str(ids[0])), ([], None, None))
+        # a cursor for a deleted course still lands between its neighbours
+        Course.objects.filter(id=ids[2]).delete()
+        self.assertEqual(self.page(after=str(ids[2])), (ids[3:5], ids[3], ids[4]))
+        for junk in ("", "abc", "1.5", None):
+            self.assertEqual(self.page(after=junk), (ids[0:2], None, ids[1]))
+            self.assertEqual(self.page(before=junk), (ids[0:2], None, ids[1]))
+
+    def test_cards_are_one_query(self):
+        with self.assertNumQueries(1):
+            page = keyset_page(with_card_stats(Course.objects.all()), size=2)
+            cards = [(c.teacher.user.username, c.course_category.name, c.lesson_count, c.video_count, c.total_duration)
+                     for c in page["courses"]]
+        self.assertEqual(cards, [("t", "Category 0", 1, 2, 10), ("teacher0", "Category 0", 1, 2, 10)])
+
+    def test_catalog_page_links(self):
+        response = self.client.get(reverse("all_courses"), {"after": self.ids[1]})
+        self.assertEqual([c.id for c in response.context["courses"]], self.ids[2:6])
+        response = self.client.get(reverse("courses_filter_data"), {"after": self.ids[3]})
+        self.assertEqual(response.json()["next_cursor"], None)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CatalogFilterTests(TestCase):
+    """courses_filter_data: facet counts that ignore their own dimension, and the sale price range."""
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.web, cls.data = Categories.objects.create(name="Web"), Categories.objects.create(name="Data")
+        cls.easy, cls.hard = Level.objects.create(name="Easy"), Level.objects.create(name="Hard")
+        language = Language.objects.create(name="English")
+        for title, category, level, price, discount in [
+            ("Web easy", cls.web, cls.easy, "100", "0"),
+            ("Web hard", cls.web, cls.hard, "200", "50"),     # sells at 100
+            ("Data easy", cls.data, cls.easy, "300", "0"),
+        ]:
+            Course.objects.create(
+                teacher=teacher, title=title, descriptions="d", course_category=category, level=level,
+                language=language, price=Decimal(price), discount=Decimal(discount), course_image=COURSE_IMAGE,
+            )
+
+    def filter(self, **params):
+        response = self.client.get(reverse("courses_filter_data"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def counts(self, facets, dim):
+        return {row["name"]: row["count"] for row in facets[dim]}
+
+    def test_each_facet_counts_the_other_filters(self):
+        result = self.filter(category=self.web.id)
+        self.assertEqual(result["count"], 2)
+        # picking a category doesn't hide the other categories' counts
+        self.assertEqual(self.counts(result["facets"], "category"), {"Web": 2, "Data": 1})
+        self.assertEqual(self.counts(result["facets"], "level"), {"Easy": 1, "Hard": 1})
+        self.assertEqual(result["facets"]["discount"], {"discounted": 1, "full_price": 1, "selected": False})
+        self.assertEqual([row["selected"] for row in result["facets"]["category"]], [True, False])
+
+        result = self.filter(category=[self.web.id, self.data.id], level=self.easy.id)
+        self.assertEqual(result["count"], 2)
+        self.assertEqual(self.counts(result["facets"], "category"), {"Web": 1, "Data": 1})
+        self.assertEqual(self.counts(result["facets"], "level"), {"Easy": 2, "Hard": 1})
+
+        result = self.filter(discount="1")
+        self.assertEqual(result["count"], 1)
+        self.assertEqual(self.counts(result["facets"], "category"), {"Web": 1, "Data": 0})
+        self.assertEqual(result["facets"]["discount"]["full_price"], 2)
+
+    def test_price_range_uses_the_sale_price(self):
+        result = self.filter(price_max="150")
+        self.assertEqual(result["count"], 2)
+        self.assertIn("Web hard", result["data"])
+        self.assertNotIn("Data easy", result["data"])
+        # the range narrows every facet, including the one being picked
+        self.assertEqual(self.counts(result["facets"], "category"), {"Web": 2, "Data": 0})
+        self.assertEqual(self.filter(price_min="100.01", price_max="300")["count"], 1)
+        self.assertEqual(self.filter(price_min="abc", category="x")["count"], 3)
+        for value in ("NaN", "-Infinity", "inf", "sNaN"):
+            self.assertEqual(self.filter(price_min=value, price_max=value)["count"], 3)
+
+
+class SalePriceTests(TestCase):
+    """Course.sale_price is the discounted price rounded half-up to paise, kept on every save."""
+
+    def test_rounding(self):
+        for price, discount, expected in [
+            (Decimal("999.00"), Decimal("10.00"), "899.10"),
+            (Decimal("999.99"), Decimal("12.5"), "874.99"),
+            (Decimal("0.25"), Decimal("50"), "0.13"),     # half-up, not banker's 0.12
+            (Decimal("10.05"), Decimal("50"), "5.03"),
+            (19.99, 10, "17.99"),                         # floats go through str()
+            (Decimal("500"), None, "500.00"),
+            (None, Decimal("10"), "0.00"),
+            (Decimal("100"), Decimal("100"), "0.00"),
+        ]:
+            with self.subTest(price=price, discount=discount):
+                self.assertEqual(str(compute_sale_price(price, discount)), expected)
+        self.assertEqual(discount_calculation(Decimal("0.25"), 50), Decimal("0.13"))
+
+    def test_kept_on_save(self):
+        teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        course = Course.objects.create(
+            teacher=teacher, title="Priced", descriptions="d", course_category=Categories.objects.create(name="C"),
+            level=Level.objects.create(name="L"), language=Language.objects.create(name="En"),
+            price=Decimal("10.05"), discount=Decimal("50"), course_image=COURSE_IMAGE,
+        )
+        self.assertEqual(Course.objects.get(pk=course.pk).sale_price, Decimal("5.03"))
+        course.discount = Decimal("0")
+        course.save()
+        self.assertEqual(Course.objects.get(pk=course.pk).sale_price, Decimal("10.05"))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class SearchIndexTests(TestCase):
+    """FTS5 search: bm25 ranking, highlighted snippets and an index kept in step by signals."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.category = Categories.objects.create(name="Programming")
+        cls.level = Level.objects.create(name="Beginner")
+        cls.language = Language.objects.create(name="English")
+
+    def course(self, title, descriptions="An ordinary course."):
+        return Course.objects.create(
+            teacher=self.teacher, title=title, descriptions=descriptions, course_category=self.category,
+            level=self.level, language=self.language, price=Decimal("100"), course_image=COURSE_IMAGE,
+        )
+
+    def titles(self, text, **kwargs):
+        return [c.title for c in search_courses(text, **kwargs)["courses"]]
+
+    def test_title_matches_rank_first_and_snippets_are_escaped(self):
+        self.course("Cooking basics", "Not a <b>Django</b> course, though Django is mentioned.")
+        self.course("Django for beginners")
+        self.assertEqual(self.titles("django"), ["Django for beginners", "Cooking basics"])
+        # the last word is a prefix match, operators are just words
+        self.assertEqual(self.titles("begin"), ["Django for beginners"])
+        self.assertEqual(self.titles('django OR "NEAR('), [])
+        self.assertEqual(self.titles("   "), [])
+
+        snippet = search_courses("mentioned")["courses"][0].search_snippet
+        self.assertIn("<mark>mentioned</mark>", snippet)
+        self.assertIn("&lt;b&gt;Django&lt;/b&gt;", snippet)
+
+    def test_pages(self):
+        for n in range(3):
+            self.course(f"Django part {n}")
+        first, last = search_courses("django", size=2), search_courses("django", page="2", size=2)
+        self.assertEqual((len(first["courses"]), first["has_next"], first["has_prev"]), (2, True, False))
+        self.assertEqual((len(last["courses"]), last["has_next"], last["has_prev"]), (1, False, True))
+
+    def test_index_follows_course_lesson_and_video_writes(self):
+        course = self.course("Statistics")
+        lesson = Lesson.objects.create(course=course, teacher=self.teacher, name="Regression")
+        self.assertEqual(self.titles("regression"), ["Statistics"])
+        video = Video.objects.create(course=course, lesson=lesson, serial_number=1, title="Bayesian priors",
+                                     time_duration=5, video_file="videos/priors.mp4")
+        self.assertEqual(self.titles("bayesian"), ["Statistics"])
+        video.delete()
+        self.assertEqual(self.titles("bayesian"), [])
+        lesson.delete()
+        self.assertEqual(self.titles("regression"), [])
+
+        course.title = "Probability"
+        course.save()
+        self.assertEqual(self.titles("statistics"), [])
+        self.category.name = "Mathematics"
+        self.category.save()
+        self.assertEqual(self.titles("mathematics"), ["Probability"])
+
+        course.delete()
+        self.assertEqual(self.titles("probability"), [])
+
+    def test_rebuild(self):
+        self.course("Django for beginners")
+        self.course("Flask for beginners")
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM app_course_search")
+        self.assertEqual(self.titles("beginners"), [])
+        self.assertEqual(rebuild_index(batch_size=1), 2)
+        self.assertEqual(sorted(self.titles("beginners")), ["Django for beginners", "Flask for beginners"])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class CourseStatsTests(TestCase):
+    """CourseStats counters follow lesson/video/enrollment writes and course deletion."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        cls.course, cls.other = seed(0, cls.teacher, cls.student, courses=1, students=1)
+
+    def test_counters_match_a_rebuild(self):
+        stats = CourseStats.objects.get(course=self.course)
+        self.assertEqual((stats.lesson_count, stats.video_count, stats.enrollment_count), (2, 4, 2))
+        self.assertEqual(rebuild_course_stats([self.course.id], dry_run=True), [])
+
+    def counters(self, course):
+        stats = CourseStats.objects.get(course=course)
+        return stats.lesson_count, stats.video_count, stats.total_duration, stats.enrollment_count, stats.gross_revenue
+
+    def test_each_write_applies_its_delta(self):
+        sale = self.course.sale_price
+        self.assertEqual(self.counters(self.course), (2, 4, 20, 2, 2 * sale))
+
+        video = Video.objects.filter(course=self.course).order_by("id").first()
+        video.time_duration = 12
+        video.save()
+        self.assertEqual(self.counters(self.course), (2, 4, 27, 2, 2 * sale))
+
+        # moving a video takes its duration along
+        video.course = self.other
+        video.save()
+        self.assertEqual(self.counters(self.course), (2, 3, 15, 2, 2 * sale))
+        self.assertEqual(self.counters(self.other)[1:3], (5, 32))
+
+        # a lesson's videos go with it
+        Lesson.objects.filter(course=self.course).order_by("id").last().delete()
+        self.assertEqual(self.counters(self.course), (1, 1, 5, 2, 2 * sale))
+
+        payment = Payment.objects.filter(course=self.course, status="successful").first()
+        payment.status = "failed"
+        payment.save()
+        self.assertEqual(self.counters(self.course)[4], sale)
+        payment.amount_paid = Decimal("10.00")
+        payment.status = "successful"
+        payment.save()
+        self.assertEqual(self.counters(self.course)[4], sale + Decimal("10.00"))
+        Enrollment.objects.filter(course=self.course).first().delete()
+        self.assertEqual(self.counters(self.course)[3], 1)
+
+        for course in (self.course, self.other):
+            self.assertEqual(rebuild_course_stats([course.id], dry_run=True), [])
+
+    def test_missing_row_is_seeded_from_the_source_tables(self):
+        CourseStats.objects.filter(course=self.course).delete()
+        Lesson.objects.create(course=self.course, teacher=self.teacher, name="Extra")
+        self.assertEqual(self.counters(self.course)[:3], (3, 4, 20))
+        # deletes don't reseed (a cascading course delete would point it at a dying course)
+        CourseStats.objects.filter(course=self.course).delete()
+        Lesson.objects.filter(name="Extra").delete()
+        self.assertFalse(CourseStats.objects.filter(course=self.course).exists())
+
+    def test_deleting_a_course_with_children_does_not_reseed_its_stats(self):
+        self.course.delete()
+        # SQLite only checks foreign keys at commit; ask for it now
+        connection.check_constraints()
+        self.assertFalse(CourseStats.objects.filter(course_id=self.course.id).exists())
+        self.assertEqual(rebuild_course_stats([self.other.id], dry_run=True), [])
+
+
+class NavigationCacheTests(TestCase):
+    """The cached header tree follows category and course writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        cls.course = seed(0, cls.teacher, cls.student, courses=1, lessons=0, students=0)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def nav(self):
+        return {cat["name"]: [c["title"] for c in cat["courses"]] for cat in get_navigation()}
+
+    def test_category_and_course_saves_invalidate(self):
+        self.assertIn(self.course.title, self.nav()["Category 0"])
+        with self.assertNumQueries(0):
+            self.nav()
+
+        self.course.title = "Renamed"
+        self.course.save()
+        self.assertIn("Renamed", self.nav()["Category 0"])
+
+        category = Categories.objects.create(name="New category")
+        self.assertEqual(self.nav()["New category"], [])
+        category.name = "Renamed category"
+        category.save()
+        self.assertIn("Renamed category", self.nav())
+
+        self.course.delete()
+        self.assertNotIn("Renamed", self.nav()["Category 0"])
+
+
+class CurriculumCacheTests(TestCase):
+    """The cached lesson/video tree is rebuilt after lesson and video writes, for that course only."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        cls.course, cls.other = seed(0, cls.teacher, cls.student, courses=1, lessons=2, videos=2, students=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, course):
+        return [[v["title"] for v in lesson["videos"]] for lesson in get_curriculum(course.id)["lessons"]]
+
+    def test_two_queries_then_cached(self):
+        with self.assertNumQueries(2):
+            curriculum = get_curriculum(self.course.id)
+        self.assertEqual((curriculum["lesson_count"], curriculum["video_count"], curriculum["total_duration"]), (2, 4, 20))
+        with self.assertNumQueries(0):
+            get_curriculum(self.course.id)
+
+    def test_writes_invalidate_their_course(self):
+        self.assertEqual(self.titles(self.course), [["Video 0 0", "Video 0 1"], ["Video 1 0", "Video 1 1"]])
+        self.titles(self.other)
+
+        video = Video.objects.filter(course=self.course).order_by("id").first()
+        video.title = "Welcome"
+        video.save()
+        self.assertEqual(self.titles(self.course)[0], ["Welcome", "Video 0 1"])
+        with self.assertNumQueries(0):
+            self.titles(self.other)
+
+        lesson = Lesson.objects.create(course=self.course, teacher=self.teacher, name="Extra")
+        self.assertEqual(self.titles(self.course)[2], [])
+        lesson.delete()
+        self.assertEqual(len(self.titles(self.course)), 2)
+
+        # a video moved to another course leaves the old course's tree too
+        video.course, video.lesson = self.other, self.other.lesson_set.order_by("id").first()
+        video.save()
+        self.assertEqual(self.titles(self.course)[0], ["Video 0 1"])
+        self.assertIn("Welcome", self.titles(self.other)[0])
+
+        video.delete()
+        self.assertNotIn("Welcome", self.titles(self.other)[0])
+
+
+class PageCacheTests(TestCase):
+    """Anonymous page cache: per-visitor CSRF tokens and one rebuild per invalidation."""
+
+    def setUp(self):
+        cache.clear()
+
+    def csrf_value(self, response):
+        match = CSRF_INPUT_REGEX.search(response.content)
+        self.assertIsNotNone(match, "page has no CSRF input")
+        return response.content[match.end(1):match.start(2)]
+
+    def test_cached_page_gets_the_visitors_csrf_token(self):
+        first, second = Client(enforce_csrf_checks=True), Client(enforce_csrf_checks=True)
+        first_token = self.csrf_value(first.get(reverse("contact")))
+        with CaptureQueriesContext(connection) as queries:
+            second_token = self.csrf_value(second.get(reverse("contact")))
+        self.assertEqual(len(queries), 0)  # served from the cache
+        self.assertNotIn(CSRF_PLACEHOLDER, first_token + second_token)
+        self.assertNotEqual(first_token, second_token)
+        # the token put into the cached copy is the one this visitor's cookie accepts
+        response = second.post(reverse("doLogin"), {"csrfmiddlewaretoken": second_token.decode(), "email": "x", "password": "y"})
+        self.assertNotEqual(response.status_code, 403)
+
+    def test_concurrent_misses_build_once(self):
+        builds = []
+
+        def build():
+            builds.append(threading.get_ident())
+            time.sleep(0.2)
+            return "page"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(get_or_build("page:t", 1, build))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(results, ["page"] * 4)
+
+    def test_stale_page_is_served_while_another_worker_rebuilds(self):
+        get_or_build("page:t", 1, lambda: "old")
+        cache.add("page:t:lock", 1)  # someone else is rebuilding version 2
+        self.assertEqual(get_or_build("page:t", 2, lambda: self.fail("rebuilt twice")), "old")
+
+    @override_settings(DEBUG=False)
+    def test_per_process_cache_is_reported(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            self.assertEqual([w.id for w in check_shared_cache(None)], ["app.W001"])
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class StreamVideoTests(TestCase):
+    """Range / conditional handling of the stream_video endpoint."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        cls.outsider = Users.objects.create_user(username="o", password=PASSWORD, role="student")
+        seed(0, cls.teacher, cls.student, courses=1, lessons=1, videos=1, students=0)
+        cls.video = Video.objects.filter(course__teacher=cls.teacher).first()
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_SENDFILE_BACKEND=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.body = bytes(range(256)) * 40
+        path = f"{self.media_root}/{self.video.video_file.name}"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.body)
+        self.url = reverse("stream_video", args=[self.video.id])
+        self.client.force_login(self.student.user)
+
+    def test_full_and_partial_content(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.body)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.body)}")
+        self.assertEqual(b"".join(response.streaming_content), self.body[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.body[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.body)}-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # stale If-Range falls back to the whole file
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_signed_urls_need_no_queries(self):
+        response = self.client.get(reverse("watch_course", args=[self.video.course.slug]))
+        signed = response.context["video"]["url"]
+        self.assertIn("/signed/", signed)
+
+        anonymous = Client()
+        with self.assertNumQueries(0):
+            response = anonymous.get(signed, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.body[:10])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(anonymous.get(reverse("media_auth"), HTTP_X_ORIGINAL_URI=signed).status_code, 204)
+
+        # the signature covers the file name, and nothing else is served with it
+        token = signed.split("/signed/")[1].split("/")[0]
+        other = reverse("stream_signed", kwargs={"video_id": self.video.id, "token": token, "name": COURSE_IMAGE})
+        self.assertEqual(anonymous.get(other).status_code, 403)
+        self.assertEqual(anonymous.get(reverse("media_auth"), HTTP_X_ORIGINAL_URI=other).status_code, 403)
+        self.assertEqual(anonymous.get(reverse("media_auth")).status_code, 403)
+
+    def test_signed_hls_and_expiry(self):
+        name = f"hls/{self.video.id}/master.m3u8"
+        token = make_token(self.student.user.id, self.video.id, name)
+        self.assertTrue(check_token(token, self.video.id, f"hls/{self.video.id}/720p_000.ts"))
+        self.assertFalse(check_token(token, self.video.id, f"hls/{self.video.id}/../{self.video.id + 1}/x.ts"))
+        self.assertFalse(check_token(token, self.video.id + 1, f"hls/{self.video.id + 1}/master.m3u8"))
+        self.assertFalse(check_token(make_token(self.student.user.id, self.video.id, name, ttl=-3600),
+                                     self.video.id, name))
+
+    def test_offload_and_access(self):
+        with override_settings(MEDIA_SENDFILE_BACKEND="nginx"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.video.video_file.name}")
+
+        self.client.force_login(self.outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], VIDEO_UPLOAD_CHUNK_SIZE=1000)
+class ResumableVideoUploadTests(TestCase):
+    """Chunked add_video upload: checksums, resume status and finalize."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        seed(0, cls.teacher, cls.student, courses=1, lessons=1, videos=0, students=0)
+        cls.lesson = Lesson.objects.filter(teacher=cls.teacher).first()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(self.teacher.user)
+        self.body = os.urandom(2500)
+
+    def start(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("video_upload_start"), {
+                "lesson": self.lesson.id, "serial_number": 1, "title": "Intro", "time_duration": "5",
+                "filename": "intro.mp4", "size": len(self.body),
+            })
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["video_upload_start:POST"])
+        return response.json()
+
+    def put_chunk(self, upload, index, data=None):
+        data = self.body[index * 1000:(index + 1) * 1000] if data is None else data
+        return self.client.put(
+            reverse("video_upload_chunk", args=[upload["upload_id"], index]), data,
+            content_type="application/octet-stream",
+            HTTP_X_CHUNK_SHA256=hashlib.sha256(self.body[index * 1000:(index + 1) * 1000]).hexdigest(),
+        )
+
+    def test_chunks_resume_and_finish(self):
+        upload = self.start()
+        self.assertEqual(upload["chunk_count"], 3)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.put_chunk(upload, 2).status_code, 200)
+        self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["video_upload_chunk:PUT"])
+        self.assertEqual(self.put_chunk(upload, 0, data=b"x" * 1000).status_code, 422)
+        status = self.client.get(reverse("video_upload_detail", args=[upload["upload_id"]])).json()
+        self.assertEqual(status["received"], [2])
+
+        finish_url = reverse("video_upload_finish", args=[upload["upload_id"]])
+        thumbnail = SimpleUploadedFile("thumb.png", b"png", content_type="image/png")
+        self.assertEqual(self.client.post(finish_url, {"thumbnail": thumbnail}).status_code, 409)
+
+        self.assertEqual(self.put_chunk(upload, 0).status_code, 200)
+        self.assertEqual(self.put_chunk(upload, 1).status_code, 200)
+        thumbnail = SimpleUploadedFile("thumb.png", b"png", content_type="image/png")
+        response = self.client.post(finish_url, {"thumbnail": thumbnail})
+        self.assertEqual(response.status_code, 201, response.content)
+
+        video = Video.objects.get(id=response.json()["video_id"])
+        with open(os.path.join(self.media_root, video.video_file.name), "rb") as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertFalse(VideoUpload.objects.exists())
+
+    def test_final_name_is_reserved_while_uploading(self):
+        upload = self.start()
+        name = VideoUpload.objects.get(id=upload["upload_id"]).file_name
+        # an add_video save racing the upload gets another name, and keeps it
+        other = default_storage.save(name, ContentFile(b"other lecture"))
+        self.assertNotEqual(other, name)
+
+        for index in range(3):
+            self.assertEqual(self.put_chunk(upload, index).status_code, 200)
+        thumbnail = SimpleUploadedFile("thumb.png", b"png", content_type="image/png")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("video_upload_finish", args=[upload["upload_id"]]), {"thumbnail": thumbnail})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["video_upload_finish:POST"])
+
+        self.assertEqual(Video.objects.get(id=response.json()["video_id"]).video_file.name, name)
+        with default_storage.open(other) as f:
+            self.assertEqual(f.read(), b"other lecture")
+
+    def test_only_one_finish_wins(self):
+        upload = self.start()
+        for index in range(3):
+            self.put_chunk(upload, index)
+        # both requests loaded the upload before either finished it
+        first, second = VideoUpload.objects.get(id=upload["upload_id"]), VideoUpload.objects.get(id=upload["upload_id"])
+        finish_upload(first, SimpleUploadedFile("thumb.png", b"png", content_type="image/png"))
+        with self.assertRaises(UploadError) as raised:
+            finish_upload(second, SimpleUploadedFile("thumb.png", b"png", content_type="image/png"))
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(Video.objects.count(), 1)
+
+    def test_failed_save_gives_the_file_back_to_the_upload(self):
+        upload = self.start()
+        for index in range(3):
+            self.put_chunk(upload, index)
+        row = VideoUpload.objects.get(id=upload["upload_id"])
+        with mock.patch.object(Video, "save", side_effect=IntegrityError("serial number taken")):
+            with self.assertRaises(IntegrityError):
+                finish_upload(row, SimpleUploadedFile("thumb.png", b"png", content_type="image/png"))
+        self.assertTrue(VideoUpload.objects.filter(id=row.id).exists())
+        with open(default_storage.path(row.file_name) + ".part", "rb") as f:
+            self.assertEqual(f.read(), self.body)
+        self.assertEqual(os.path.getsize(default_storage.path(row.file_name)), 0)
+
+        video = finish_upload(row, SimpleUploadedFile("thumb.png", b"png", content_type="image/png"))
+        with default_storage.open(video.video_file.name) as f:
+            self.assertEqual(f.read(), self.body)
+
+    def test_abort_releases_the_name(self):
+        upload = self.start()
+        name = VideoUpload.objects.get(id=upload["upload_id"]).file_name
+        self.assertTrue(default_storage.exists(name))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.delete(reverse("video_upload_detail", args=[upload["upload_id"]]))
+        self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["video_upload_detail:DELETE"])
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(os.path.exists(default_storage.path(name) + ".part"))
+
+    def test_only_the_owning_teacher_can_upload(self):
+        upload = self.start()
+        self.client.force_login(self.student.user)
+        self.assertEqual(self.put_chunk(upload, 0).status_code, 404)
+        self.assertEqual(self.client.post(reverse("video_upload_start"), {}).status_code, 403)
+
+
+def mp4_box(kind, payload):
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def make_mp4(seconds, width, height, media_bytes=4000):
+    """Minimal MP4 with the movie header after mdat, like an un-faststarted file."""
+    mvhd = struct.pack(">I4xI", 0, 0) + struct.pack(">II", 1000, int(seconds * 1000)) + bytes(80)
+    tkhd = bytes(76) + struct.pack(">II", width << 16, height << 16)
+    audio_tkhd = bytes(84)
+    moov = mp4_box(b"moov", mp4_box(b"mvhd", mvhd)
+                   + mp4_box(b"trak", mp4_box(b"tkhd", audio_tkhd))
+                   + mp4_box(b"trak", mp4_box(b"tkhd", tkhd)))
+    return mp4_box(b"ftyp", b"isom\0\0\0\0") + mp4_box(b"mdat", bytes(media_bytes)) + moov
+
+
+def ebml(element_id, payload):
+    return element_id + bytes([0x01]) + len(payload).to_bytes(7, "big") + payload
+
+
+def make_webm(seconds, width, height):
+    info = ebml(b"\x2a\xd7\xb1", (1000000).to_bytes(3, "big")) + ebml(b"\x44\x89", struct.pack(">d", seconds * 1000))
+    video = ebml(b"\xb0", width.to_bytes(2, "big")) + ebml(b"\xba", height.to_bytes(2, "big"))
+    tracks = ebml(b"\xae", ebml(b"\xe0", video))
+    segment = ebml(b"\x15\x49\xa9\x66", info) + ebml(b"\x16\x54\xae\x6b", tracks) + ebml(b"\x1f\x43\xb6\x75", bytes(4000))
+    return ebml(b"\x1a\x45\xdf\xa3", b"\x42\x82\x84webm") + ebml(b"\x18\x53\x80\x67", segment)
+
+
+class MediaProbeTests(TestCase):
+    """Header-only duration/resolution extraction."""
+
+    def test_mp4(self):
+        data = make_mp4(125.5, 1280, 720)
+        info = probe_video(io.BytesIO(data))
+        self.assertAlmostEqual(info.duration, 125.5)
+        self.assertEqual((info.width, info.height), (1280, 720))
+        self.assertEqual(info.bitrate, int(len(data) * 8 / 125.5))
+
+    def test_webm(self):
+        info = probe_video(io.BytesIO(make_webm(61.0, 640, 360)))
+        self.assertAlmostEqual(info.duration, 61.0)
+        self.assertEqual((info.width, info.height), (640, 360))
+
+    def test_unknown_or_truncated(self):
+        self.assertIsNone(probe_video(io.BytesIO(b"not a video at all")))
+        self.assertIsNone(probe_video(io.BytesIO(make_mp4(10, 1, 1)[:-20])))
+
+    def test_short_header_boxes(self):
+        ftyp = mp4_box(b"ftyp", b"isom\0\0\0\0")
+        self.assertIsNone(probe_video(io.BytesIO(ftyp + mp4_box(b"moov", mp4_box(b"mvhd", b"")))))
+        self.assertIsNone(probe_video(io.BytesIO(ftyp + mp4_box(b"moov", mp4_box(b"mvhd", b"\x01" + bytes(20))))))
+        mvhd = mp4_box(b"mvhd", struct.pack(">I4xI", 0, 0) + struct.pack(">II", 1000, 5000))
+        trak = mp4_box(b"trak", mp4_box(b"tkhd", b""))
+        self.assertIsNone(probe_video(io.BytesIO(ftyp + mp4_box(b"moov", mvhd + trak))))
+
+    def test_unknown_size_leaf_element(self):
+        # unknown-size Segment and Info are fine, an unknown-size Duration is not
+        segment = b"\x18\x53\x80\x67\xff" + b"\x15\x49\xa9\x66\xff" + b"\x44\x89\xff" + bytes(10000)
+        self.assertIsNone(probe_video(io.BytesIO(ebml(b"\x1a\x45\xdf\xa3", b"\x42\x82\x84webm") + segment)))
+
+    def test_backfill_command(self):
+        teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        seed(0, teacher, student, courses=1, lessons=1, videos=2, students=0)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        first, second = Video.objects.filter(course__teacher=teacher).order_by("id")[:2]
+        os.makedirs(os.path.join(media_root, "videos"))
+        with open(os.path.join(media_root, first.video_file.name), "wb") as f:
+            f.write(make_mp4(150, 1920, 1080))
+
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command("backfill_video_metadata", "--set-duration", "--workers", "2", stdout=io.StringIO())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.duration_seconds, first.width, first.height, first.time_duration), (150, 1920, 1080, 3))
+        self.assertIsNone(second.duration_seconds)
+        self.assertEqual(first.course.stats.total_duration, 3 + 5)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], TRANSCODE_MAX_ATTEMPTS=2)
+class TranscodeQueueTests(TestCase):
+    """Persistent HLS job queue with the stub encoder."""
+
+    stub = ("app.transcoding.StubBackend", {})
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        with self.captureOnCommitCallbacks(execute=True):
+            seed(0, self.teacher, self.student, courses=1, lessons=1, videos=1, students=0)
+        self.video = Video.objects.filter(course__teacher=self.teacher).first()
+
+    def write_source(self):
+        path = os.path.join(self.media_root, self.video.video_file.name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(make_mp4(30, 1280, 720))
+
+    def test_uploaded_videos_are_queued_and_served_as_hls(self):
+        self.assertEqual(TranscodeJob.objects.filter(status=TranscodeJob.PENDING).count(), 2)
+        self.write_source()
+        Video.objects.filter(pk=self.video.pk).update(height=720)
+        TranscodeJob.objects.exclude(video=self.video).delete()
+
+        self.assertEqual(TranscodeWorker(processes=0, backend=self.stub).run(once=True), 1)
+        job = TranscodeJob.objects.get(video=self.video)
+        self.assertEqual(job.status, TranscodeJob.READY)
+        self.assertEqual([r["height"] for r in job.renditions], [720, 480, 360])
+
+        video = get_curriculum(self.video.course_id)["lessons"][0]["videos"][0]
+        self.assertEqual(video["hls_url"], reverse("stream_hls", args=[self.video.id, "master.m3u8"]))
+
+        self.client.force_login(self.student.user)
+        response = self.client.get(video["hls_url"])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"RESOLUTION=1280x720", b"".join(response.streaming_content))
+        self.assertEqual(self.client.get(reverse("stream_hls", args=[self.video.id, "720p_000.ts"])).status_code, 200)
+
+    def test_rendition_sizes_follow_the_source_aspect(self):
+        self.write_source()
+        Video.objects.filter(pk=self.video.pk).update(width=960, height=720)
+        TranscodeJob.objects.exclude(video=self.video).delete()
+        TranscodeWorker(processes=0, backend=self.stub).run(once=True)
+        job = TranscodeJob.objects.get(video=self.video)
+        self.assertEqual([(r["width"], r["height"]) for r in job.renditions], [(960, 720), (640, 480), (480, 360)])
+        with open(os.path.join(self.media_root, "hls", str(self.video.id), "master.m3u8")) as f:
+            self.assertIn("RESOLUTION=640x480", f.read())
+
+    def test_failures_retry_then_stop_and_new_file_requeues(self):
+        TranscodeJob.objects.exclude(video=self.video).delete()
+        worker = TranscodeWorker(processes=0, backend=self.stub)
+        worker.run(once=True)  # source file missing: attempt 1 fails, back to pending
+        worker.run(once=True)
+        job = TranscodeJob.objects.get(video=self.video)
+        self.assertEqual((job.status, job.attempts), (TranscodeJob.FAILED, 2))
+
+        enqueue_transcode(self.video.id, "videos/replacement.mp4")
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (TranscodeJob.PENDING, 0))
+
+    def test_ladder_never_upscales(self):
+        self.assertEqual([r[0] for r in ladder_for(480)], [480, 360])
+        self.assertEqual([r[0] for r in ladder_for(240)], [360])
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], IMAGE_RENDITION_WIDTHS=(320, 640))
+class ImageRenditionTests(TestCase):
+    """WebP/JPEG renditions for srcset, built on upload or on first request."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        seed(0, cls.teacher, cls.student, courses=1, lessons=0, videos=0, students=0)
+        cls.course = Course.objects.filter(teacher=cls.teacher).first()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(self.media_root, "Media", "course_image"))
+        Image.new("RGBA", (1200, 800), (200, 30, 30, 255)).save(os.path.join(self.media_root, COURSE_IMAGE))
+
+    def test_lazy_generation_and_serving(self):
+        response = self.client.get(reverse("image_rendition", args=[320, "webp", COURSE_IMAGE]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("public", response["Cache-Control"])
+        with Image.open(io.BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (320, 213))
+        self.assertEqual(ImageRendition.objects.filter(source_name=COURSE_IMAGE).count(), 4)
+
+        # second request is served from disk without touching the database
+        with self.assertNumQueries(0):
+            self.client.get(reverse("image_rendition", args=[640, "jpeg", COURSE_IMAGE]))
+
+    def test_concurrent_generators_do_not_collide(self):
+        # another request generates the same renditions between our first write
+        # and its rename, then inserts a row between our delete and insert
+        replace, delete = os.replace, QuerySet.delete
+        racing = []
+
+        def replace_after_another_generates(src, dst):
+            if not racing:
+                racing.append("generating")
+                generate_renditions(COURSE_IMAGE)
+                racing[:] = ["files"]
+            return replace(src, dst)
+
+        def delete_then_another_inserts(queryset):
+            result = delete(queryset)
+            if queryset.model is ImageRendition and racing == ["files"]:
+                racing.append("rows")
+                ImageRendition.objects.create(source_name=COURSE_IMAGE, width=320, format="webp",
+                                              name="other", source_mtime=0, size=1)
+            return result
+
+        with mock.patch("os.replace", replace_after_another_generates), \
+                mock.patch.object(QuerySet, "delete", delete_then_another_inserts):
+            generate_renditions(COURSE_IMAGE)
+        self.assertEqual(racing, ["files", "rows"])
+        self.assertEqual(ImageRendition.objects.filter(source_name=COURSE_IMAGE).count(), 4)
+        self.assertEqual([n for n in os.listdir(os.path.join(self.media_root, "Media", "course_image"))
+                          if n.endswith(".tmp")], [])
+
+    def test_only_known_images_are_resized(self):
+        Image.new("RGB", (10, 10)).save(os.path.join(self.media_root, "Media", "stray.png"))
+        self.assertEqual(self.client.get(reverse("image_rendition", args=[320, "webp", "Media/stray.png"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("image_rendition", args=[333, "webp", COURSE_IMAGE])).status_code, 404)
+
+    def test_generated_on_save_and_srcset_tag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.save()
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, "Media", "course_image", "python_basic__w640.webp")))
+
+        html = responsive_image(self.course.course_image, "Intro", "card-img-top")
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(reverse("image_rendition", args=[640, "webp", COURSE_IMAGE]) + " 640w", html)
+
+
+class DedupStorageTests(TestCase):
+    """Content-addressed default storage: one blob per SHA-256, names are counted hard links."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_identical_files_share_one_blob(self):
+        body = os.urandom(5000)
+        first = default_storage.save("videos/a/course-one/intro/01_intro.mp4", ContentFile(body))
+        second = default_storage.save("videos/a/course-two/intro/01_intro.mp4", ContentFile(body))
+        other = default_storage.save("videos/a/course-two/intro/02_other.mp4", ContentFile(b"other"))
+
+        blob = MediaBlob.objects.get(sha256=hashlib.sha256(body).hexdigest())
+        self.assertEqual(blob.refcount, 2)
+        self.assertEqual(MediaBlob.objects.count(), 2)
+        blob_path = default_storage.path(blob_name(blob.sha256))
+        self.assertEqual(os.stat(default_storage.path(first)).st_ino, os.stat(blob_path).st_ino)
+        self.assertEqual(os.stat(default_storage.path(second)).st_ino, os.stat(blob_path).st_ino)
+        with default_storage.open(second) as f:
+            self.assertEqual(f.read(), body)
+
+        default_storage.delete(first)
+        self.assertFalse(default_storage.exists(first))
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertEqual(MediaBlob.objects.get(pk=blob.pk).refcount, 1)
+
+        default_storage.delete(second)
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertFalse(MediaBlob.objects.filter(pk=blob.pk).exists())
+        self.assertTrue(default_storage.exists(other))
+
+    def test_taken_name_gets_an_alternative(self):
+        first = default_storage.save("Media/course_image/x.png", ContentFile(b"one"))
+        second = default_storage.save("Media/course_image/x.png", ContentFile(b"two"))
+        self.assertNotEqual(first, second)
+        self.assertEqual(MediaAlias.objects.filter(name__in=[first, second]).count(), 2)
+
+    def test_adopt_links_a_file_written_in_place(self):
+        existing = default_storage.save("videos/a/b/c/01_x.mp4", ContentFile(b"lecture"))
+        name = "videos/a/d/c/01_x.mp4"
+        os.makedirs(os.path.dirname(default_storage.path(name)))
+        with open(default_storage.path(name), "wb") as f:
+            f.write(b"lecture")
+        self.assertEqual(default_storage.adopt(name), name)
+        self.assertEqual(os.stat(default_storage.path(name)).st_ino, os.stat(default_storage.path(existing)).st_ino)
+        self.assertEqual(MediaBlob.objects.get().refcount, 2)
+
+    def test_failed_link_gives_the_reference_back(self):
+        digest = hashlib.sha256(b"gone").hexdigest()
+        with self.assertRaises(FileNotFoundError):
+            default_storage._link("Media/x.png", os.path.join(self.media_root, "missing"), digest, 4)
+        self.assertFalse(MediaBlob.objects.filter(sha256=digest).exists())
+        self.assertFalse(MediaAlias.objects.exists())
+
+    def test_copies_where_hard_links_are_unsupported(self):
+        with mock.patch("app.storage.os.link", side_effect=OSError(errno.EXDEV, "Invalid cross-device link")):
+            first = default_storage.save("Media/a.png", ContentFile(b"same"))
+            second = default_storage.save("Media/b.png", ContentFile(b"same"))
+        self.assertEqual(MediaBlob.objects.get().refcount, 2)
+        for name in (first, second):
+            with default_storage.open(name) as f:
+                self.assertEqual(f.read(), b"same")
+        default_storage.delete(first)
+        default_storage.delete(second)
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertFalse(os.path.exists(default_storage.path(blob_name(hashlib.sha256(b"same").hexdigest()))))
+
+    def test_untracked_files_are_deleted_directly(self):
+        os.makedirs(os.path.join(self.media_root, "Media"))
+        with open(os.path.join(self.media_root, "Media", "old.png"), "wb") as f:
+            f.write(b"legacy")
+        default_storage.delete("Media/old.png")
+        self.assertFalse(default_storage.exists("Media/old.png"))
+
+
+class MediaGcTests(TestCase):
+    """media_gc removes files no row points at, after a grace period."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        seed(0, cls.teacher, cls.student, courses=1, lessons=1, videos=1, students=0)
+        cls.video = Video.objects.filter(course__teacher=cls.teacher).first()
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write(self, name, age_hours=48):
+        path = os.path.join(self.media_root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+        past = time.time() - age_hours * 3600
+        os.utime(path, (past, past))
+        return path
+
+    def gc(self, *args):
+        out = io.StringIO()
+        call_command("media_gc", *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_then_delete(self):
+        kept = [
+            self.write(self.video.video_file.name),
+            self.write(COURSE_IMAGE),
+            self.write(f"hls/{self.video.id}/master.m3u8"),
+            self.write("videos/new_upload.mp4", age_hours=1),
+        ]
+        orphans = [
+            self.write("videos/deleted/01_old.mp4"),
+            self.write("Media/course_image/replaced.png"),
+            self.write("hls/999999/master.m3u8"),
+            self.write("blobs/ab/cd/abcd"),
+        ]
+        self.assertIn("Would delete 4 unreferenced file(s)", self.gc("--dry-run"))
+        self.assertTrue(all(os.path.exists(p) for p in orphans))
+
+        self.assertIn("Deleted 4 unreferenced file(s)", self.gc())
+        self.assertFalse(any(os.path.exists(p) for p in orphans))
+        self.assertTrue(all(os.path.exists(p) for p in kept))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "videos", "deleted")))
+
+    def test_references_are_looked_up_per_batch(self):
+        lesson = self.video.lesson
+        upload = VideoUpload.objects.create(
+            teacher=self.teacher, lesson=lesson, serial_number=9, title="Upload", file_name="videos/up/09_upload.mp4",
+            total_size=10, chunk_size=10,
+        )
+        rendition = "Media/course_image/python_basic__w320.webp"
+        ImageRendition.objects.create(source_name=COURSE_IMAGE, width=320, format="webp", name=rendition,
+                                      source_mtime=0, size=10)
+        ImageRendition.objects.create(source_name="Media/course_image/gone.png", width=320, format="webp",
+                                      name="Media/course_image/gone__w320.webp", source_mtime=0, size=10)
+        kept = [self.write(name) for name in (
+            self.video.video_file.name, COURSE_IMAGE, rendition, upload.file_name, upload.file_name + ".part",
+        )]
+        orphans = [self.write(name) for name in (
+            "Media/course_image/gone__w320.webp", "videos/up/08_old.mp4", "videos/up/09_upload.mp4.tmp",
+        )]
+        with mock.patch("app.management.commands.media_gc.GC_BATCH_SIZE", 2):
+            self.assertIn("Deleted 3 unreferenced file(s)", self.gc())
+        self.assertTrue(all(os.path.exists(p) for p in kept))
+        self.assertFalse(any(os.path.exists(p) for p in orphans))
+        self.assertFalse(ImageRendition.objects.filter(name="Media/course_image/gone__w320.webp").exists())
+
+    def test_unreferenced_alias_releases_its_blob(self):
+        name = default_storage.save("videos/gone/01_x.mp4", ContentFile(b"lecture"))
+        past = time.time() - 48 * 3600
+        os.utime(default_storage.path(name), (past, past))
+        self.gc()
+        self.assertFalse(MediaAlias.objects.filter(name=name).exists())
+        self.assertFalse(MediaBlob.objects.exists())
+
+
+class StaticPipelineTests(TestCase):
+    """collectstatic bundles, fingerprints and precompresses; the middleware serves the variants."""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.root)
+        files = {
+            "css/a.css": "/* header */\n.a  {  background: url('../img/x.png'); }\n",
+            "img/x.png": "png",
+            "js/a.js": "function a() { return 1; }\n" * 100,
+            "js/b.min.js": "var b=2;",
+        }
+        for name, content in files.items():
+            os.makedirs(os.path.join(self.source, os.path.dirname(name)), exist_ok=True)
+            with open(os.path.join(self.source, name), "w") as f:
+                f.write(content)
+        settings_override = override_settings(
+            STATICFILES_DIRS=[self.source], STATIC_ROOT=self.root, DEBUG=False,
+            STATIC_BUNDLES={"bundles/t.css": ["css/a.css"], "bundles/t.js": ["js/a.js", "js/b.min.js"]},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+    def test_bundles_are_fingerprinted_and_compressed(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        from .templatetags.static_bundles import bundle
+
+        js_name = staticfiles_storage.stored_name("bundles/t.js")
+        self.assertRegex(js_name, r"^bundles/t\.[0-9a-f]{12}\.js$")
+        with staticfiles_storage.open(js_name) as f:
+            content = f.read().decode()
+        self.assertIn("function a()", content)
+        self.assertTrue(content.rstrip().endswith("var b=2;"))
+        self.assertTrue(staticfiles_storage.exists(js_name + ".gz"))
+
+        with staticfiles_storage.open(staticfiles_storage.stored_name("bundles/t.css")) as f:
+            css = f.read().decode()
+        self.assertNotIn("header", css)
+        self.assertIn(staticfiles_storage.stored_name("img/x.png").split("/")[-1], css)
+
+        self.assertEqual(bundle("bundles/t.js").count("<script"), 1)
+        with override_settings(DEBUG=True):
+            self.assertEqual(bundle("bundles/t.js").count("<script"), 2)
+
+    def test_precompressed_variant_and_cache_headers(self):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        url = staticfiles_storage.url("bundles/t.js")
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING="br;q=0, gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertIn("immutable", response["Cache-Control"])
+        body = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertIn("function a()", body)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"],
+                                         HTTP_ACCEPT_ENCODING="gzip").status_code, 304)
+
+        response = self.client.get(url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertIn("must-revalidate", self.client.get("/static/bundles/t.js")["Cache-Control"])
+        self.assertEqual(self.client.get("/static/../settings.py").status_code, 404)
+
+
+def make_pdf(text, pages=1):
+    """Smallest useful PDF: `pages` pages, the first showing `text` in a Flate content stream."""
+    content = zlib.compress(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode())
+    kids = " ".join(f"{4 + i} 0 R" for i in range(pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    objects.append(f"<< /Type /Page /Parent 2 0 R /Resources << /Font << /F1 3 0 R >> >> /Contents {4 + pages} 0 R >>".encode())
+    objects += [b"<< /Type /Page /Parent 2 0 R >>"] * (pages - 1)
+    objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+    body = b"%PDF-1.4\n"
+    for number, obj in enumerate(objects, start=1):
+        body += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    return body + b"trailer\n<< /Root 1 0 R >>\n%%EOF\n"
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"], RESUME_MAX_SIZE=4096)
+class ResumeIngestionTests(TestCase):
+    """apply_as_teacher checks the PDF while it uploads; resume_worker extracts the preview."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = Users.objects.create_user(username="a", password=PASSWORD, role="admin")
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def apply(self, content, filename="cv.pdf"):
+        return self.client.post(reverse("apply_as_teacher"), {
+            "username": "newteacher", "first_name": "New", "last_name": "Teacher",
+            "email": "new@example.com", "contact_no": "9876543210", "qualification": "MSc",
+            "experience": "3", "resume": SimpleUploadedFile(filename, content, content_type="application/pdf"),
+        })
+
+    def test_pdf_is_stored_by_id_and_extracted_later(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.apply(make_pdf("Ten years of Django", pages=2))
+        self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["apply_as_teacher:POST"])
+        application = TeacherApplication.objects.get()
+        self.assertTrue(application.resume.name.startswith(f"joiningapplications/{application.id}_new_teacher/"))
+        self.assertEqual(application.resume_status, TeacherApplication.RESUME_PENDING)
+        self.assertEqual(application.resume_size, application.resume.size)
+
+        call_command("resume_worker", "--once", stdout=io.StringIO())
+        application.refresh_from_db()
+        self.assertEqual(application.resume_status, TeacherApplication.RESUME_READY)
+        self.assertEqual(application.resume_pages, 2)
+        self.client.force_login(self.admin_user)
+        self.assertContains(self.client.get(reverse("admin_joining_applications")), "2 pages")
+        # the text preview needs pypdf
+        if pdf_extract.pypdf is not None:
+            self.assertEqual(application.resume_text, "Ten years of Django")
+            self.assertContains(self.client.get(reverse("admin_joining_applications")), "Ten years of Django")
+
+    def test_any_extraction_error_marks_the_resume_failed(self):
+        self.apply(make_pdf("cv"))
+        with mock.patch("app.resumes.read_pdf", side_effect=RecursionError("deeply nested page tree")):
+            call_command("resume_worker", "--once", stdout=io.StringIO())
+        self.assertEqual(TeacherApplication.objects.get().resume_status, TeacherApplication.RESUME_FAILED)
+
+    def test_signature_and_size_are_checked_during_upload(self):
+        for content, error in [
+            (b"MZ\x90\x00 renamed executable", "Resume must be a PDF file."),
+            (make_pdf("cv") + b"%" + b"0" * 5000, "Resume must be smaller than 4.0\xa0KB."),
+        ]:
+            self.client = Client()
+            response = self.apply(content)
+            self.assertEqual([str(m) for m in response.wsgi_request._messages], [error])
+        self.assertFalse(TeacherApplication.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "joiningapplications")))
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class PaymentSettlementTests(TestCase):
+    """Checkout and verify_payment against the gateway adapter; settlement happens once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = Users.objects.create_user(username="s", password=PASSWORD, role="student").student_profile
+        teacher = Users.objects.create_user(username="t", password=PASSWORD, role="teacher").teacher_profile
+        cls.course = Course.objects.create(
+            teacher=teacher, title="Paid", descriptions="d", course_category=Categories.objects.create(name="C"),
+            level=Level.objects.create(name="L"), language=Language.objects.create(name="En"),
+            price=Decimal("999.00"), discount=Decimal("0"), course_image=COURSE_IMAGE,
+        )
+        cls.payment = Payment.objects.create(
+            student=cls.student, course=cls.course, order_id="order_1", amount_paid=Decimal("999.99"),
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def callback(self):
+        signature = hmac.new(settings.KEY_SECRET.encode(), b"order_1|pay_1", hashlib.sha256).hexdigest()
+        return self.client.post(reverse("verify_payment"), {
+            "razorpay_order_id": "order_1", "razorpay_payment_id": "pay_1", "razorpay_signature": signature,
+        })
+
+    def test_replayed_callback_is_a_no_op(self):
+        with CaptureQueriesContext(connection) as settlement:
+            self.assertTemplateUsed(self.callback(), "verify_payment/success.html")
+        self.assertLessEqual(len(settlement), settings.QUERY_BUDGETS["verify_payment:POST"])
+        with CaptureQueriesContext(connection) as replay:
+            self.assertTemplateUsed(self.callback(), "verify_payment/success.html")
+
+        self.payment.refresh_from_db()
+        self.assertEqual((self.payment.status, self.payment.transaction_id), ("successful", "pay_1"))
+        self.assertEqual(Enrollment.objects.filter(student=self.student, course=self.course).count(), 1)
+        earning = TeacherEarning.objects.get()
+        commission = AdminEarning.objects.get()
+        self.assertEqual(earning.amount + commission.commission_amount, self.payment.amount_paid)
+        self.assertFalse([q for q in replay.captured_queries if not q["sql"].startswith("SELECT")])
+
+    def test_checkout_creates_the_order_through_the_gateway(self):
+        stub = StubGateway(("127.0.0.1", 0), settings.KEY_ID, settings.KEY_SECRET)
+        stub.start()
+        self.addCleanup(stub.server_close)
+        self.addCleanup(stub.shutdown)
+        self.client.force_login(self.student.user)
+        address = {
+            "first_name": "Stu", "last_name": "Dent", "country": "IN", "address_1": "1 Road", "city": "Pune",
+            "state": "MH", "postcode": "411001", "phone": "9876543210", "email": "s@example.com",
+        }
+        url = reverse("checkout", kwargs={"slug": self.course.slug}) + "?action=create_payment"
+
+        with self.settings(PAYMENT_GATEWAY_URL=stub.url):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(url, address)
+            self.assertLessEqual(len(queries), settings.QUERY_BUDGETS["checkout:POST"])
+            order = response.context["order"]
+            self.assertEqual(stub.orders[order["id"]]["amount"], 99900)
+            self.assertTrue(Payment.objects.filter(order_id=order["id"], status="failed").exists())
+
+        # nothing listening: one failure opens the breaker, the next checkout is refused without a request
+        with self.settings(PAYMENT_GATEWAY_URL="http://127.0.0.1:9", PAYMENT_GATEWAY_BREAKER=(1, 60)):
+            for _ in range(2):
+                response = self.client.post(url, address)
+                self.assertRedirects(response, reverse("checkout", kwargs={"slug": self.course.slug}),
+                                     fetch_redirect_response=False)
+            self.assertEqual(get_gateway().breaker.state, "open")
+            outcomes = {outcome: stats["count"] for (_, outcome), stats in get_gateway().latency.summary().items()}
+            self.assertEqual(outcomes, {"error": 1, "refused": 1})
+
+    def test_breaker_half_opens_after_the_reset_period(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failures=2, reset_after=30, clock=lambda: now[0])
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+        now[0] = 31
+        self.assertTrue(breaker.allow())     # the one trial call
+        self.assertFalse(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, "open")
+        now[0] = 62
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, "closed")
+
+    @override_settings(PAYMENT_WEBHOOK_SECRET="whsec")
+    def test_webhooks_are_queued_then_settled_in_a_batch(self):
+        def deliver(event_id, event, signature=None):
+            body = json.dumps(event).encode()
+            return self.client.post(
+                reverse("payment_webhook"), body, content_type="application/json",
+                HTTP_X_RAZORPAY_SIGNATURE=signature or webhook_signature(body), HTTP_X_RAZORPAY_EVENT_ID=event_id,
+            )
+        captured = {"event": "payment.captured",
+                    "payload": {"payment": {"entity": {"id": "pay_1", "order_id": "order_1", "status": "captured"}}}}
+
+        self.assertEqual(deliver("evt_0", captured, signature="forged").status_code, 403)
+        with CaptureQueriesContext(connection) as queued:
+            self.assertEqual(deliver("evt_1", captured).status_code, 200)
+        self.assertEqual(len(queued), settings.QUERY_BUDGETS["payment_webhook:POST"])
+        deliver("evt_1", captured)          # gateway retry of the same delivery
+        deliver("evt_2", dict(captured, event="order.paid"))
+        deliver("evt_3", {"event": "payment.captured", "payload": {}})
+        self.assertEqual(PaymentEvent.objects.count(), 3)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).status, "failed")
+
+        call_command("payment_webhook_worker", "--once", stdout=io.StringIO())
+
+        self.assertFalse(PaymentEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertTrue(PaymentEvent.objects.get(event_id="evt_3").error)
+        self.assertEqual(Payment.objects.get(pk=self.payment.pk).transaction_id, "pay_1")
+        self.assertEqual(TeacherEarning.objects.count(), 1)
+        stats = CourseStats.objects.get(course=self.course)
+        self.assertEqual((stats.enrollment_count, stats.gross_revenue), (1, Decimal("999.99")))
+        # the browser callback arriving afterwards finds the order settled
+        self.assertTemplateUsed(self.callback(), "verify_payment/success.html")
+        self.assertEqual(AdminEarning.objects.count(), 1)
+
+    def test_daily_rollups_follow_settlement_and_payout(self):
+        admin = Users.objects.create_user(username="adm", password=PASSWORD, role="admin")
+        self.callback()
+        rollup = DailyEarnings.objects.get()
+        self.assertEqual(rollup.day, timezone.localdate(self.payment.payment_date))
+        self.assertEqual((rollup.sales, rollup.gross, rollup.teacher_share + rollup.commission),
+                         (1, Decimal("999.99"), Decimal("999.99")))
+        self.assertEqual(rollup.teacher_unpaid, rollup.teacher_share)
+
+        self.client.force_login(admin)
+        self.client.get(reverse("pay_teacher_earning", kwargs={"course_id": self.course.id}))
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.teacher_paid, rollup.teacher_unpaid), (rollup.teacher_share, 0))
+        out = io.StringIO()
+        call_command("rebuild_earnings_rollups", "--dry-run", stdout=out)
+        self.assertIn("in sync", out.getvalue())
+
+        report = self.client.get(reverse("admin_earnings"), {"start_date": rollup.day.isoformat()})
+        self.assertEqual(report.context["total_admin_earnings"], rollup.commission)
+        payouts = self.client.get(reverse("admin_payments"), {"status": "paid"}).context["teacher_earnings"]
+        self.assertEqual([(row["is_paid"], row["total_earned"]) for row in payouts], [(True, rollup.teacher_share)])
+
+        DailyEarnings.objects.all().delete()
+        self.assertEqual(len(rebuild_rollups()), 1)
+        self.assertEqual(DailyEarnings.objects.get().commission, rollup.commission)
+
+    def test_teacher_metrics_are_one_query_and_dropped_on_settlement_and_payout(self):
+        teacher_id = self.course.teacher_id
+        with self.assertNumQueries(1):
+            metrics = get_teacher_metrics(teacher_id)
+        self.assertEqual(metrics, {"course_count": 1, "student_count": 0, "sales": 0,
+                                   "pending": 0, "received": 0, "total": 0})
+        with self.assertNumQueries(0):
+            get_teacher_metrics(teacher_id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.callback()
+        share = TeacherEarning.objects.get().amount
+        metrics = get_teacher_metrics(teacher_id)
+        self.assertEqual((metrics["student_count"], metrics["sales"], metrics["pending"], metrics["received"]),
+                         (1, 1, share, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_course_paid(self.course.id)
+        metrics = get_teacher_metrics(teacher_id)
+        self.assertEqual((metrics["pending"], metrics["received"], metrics["total"]), (0, share, share))
+
+    def test_order_id_is_unique(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Payment.objects.create(student=self.student, course=self.course, order_id="order_1", amount_paid=1)
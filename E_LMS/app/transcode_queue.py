@@ -0,0 +1,204 @@
+import logging
+import os
+import re
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.models import F, Q
+from django.utils import timezone
+from .curriculum import bump_curriculum_version
+from .models import TranscodeJob, Video
+from .transcoding import FFmpegBackend, MASTER_PLAYLIST, run_transcode
+
+logger = logging.getLogger("app.transcode")
+
+HLS_ROOT = 'hls'
+HLS_FILE_REGEX = re.compile(r'^[A-Za-z0-9_]+\.(?:m3u8|ts)$')  # flat files only, no path traversal
+
+# (height, video kbps, audio kbps), highest first
+DEFAULT_LADDER = [
+    (1080, 5000, 128),
+    (720, 2800, 128),
+    (480, 1400, 96),
+    (360, 800, 96),
+]
+
+
+def hls_dir_name(video_id):
+    return f'{HLS_ROOT}/{video_id}'
+
+
+def hls_manifest_name(video_id):
+    return f'{hls_dir_name(video_id)}/{MASTER_PLAYLIST}'
+
+
+def ladder_for(height):
+    """Rungs no taller than the source (upscaling only wastes bytes); always at least one."""
+    ladder = getattr(settings, 'TRANSCODE_LADDER', DEFAULT_LADDER)
+    if not height:
+        return list(ladder)
+    return [rung for rung in ladder if rung[0] <= height] or [min(ladder)]
+
+
+def backend_config():
+    """
+    (dotted class path, options) for the encoder. TRANSCODE_BACKEND = None
+    means ffmpeg when it is on PATH, otherwise no backend (jobs stay queued).
+    """
+    options = getattr(settings, 'TRANSCODE_BACKEND_OPTIONS', {})
+    backend = getattr(settings, 'TRANSCODE_BACKEND', None)
+    if backend:
+        return backend, options
+    if FFmpegBackend.available(options.get('binary', 'ffmpeg')):
+        return 'app.transcoding.FFmpegBackend', options
+    return None, options
+
+
+def enqueue_transcode(video_id, source_name):
+    """Queue (or re-queue, if the file changed) a video; a no-op for an unchanged file."""
+    job, created = TranscodeJob.objects.get_or_create(video_id=video_id, defaults={'source_name': source_name})
+    if created or job.source_name == source_name:
+        return job
+    TranscodeJob.objects.filter(pk=job.pk).update(
+        source_name=source_name, status=TranscodeJob.PENDING, attempts=0, error='',
+        locked_by='', locked_at=None, manifest_name='', renditions=[],
+    )
+    # the old ladder no longer matches the file
+    bump_curriculum_version(Video.objects.filter(pk=video_id).values_list('course_id', flat=True).first())
+    job.refresh_from_db()
+    return job
+
+
+def _claimable():
+    lease = getattr(settings, 'TRANSCODE_LEASE_SECONDS', 600)
+    expired = timezone.now() - timedelta(seconds=lease)
+    return Q(status=TranscodeJob.PENDING) | Q(status=TranscodeJob.RUNNING, locked_at__lt=expired)
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Claim up to `limit` jobs. Each claim is a conditional UPDATE, so concurrent
+    workers never get the same job, on SQLite as well as Postgres.
+    """
+    claimed = []
+    candidates = TranscodeJob.objects.filter(_claimable()).order_by('id').values_list('id', flat=True)[:limit * 4]
+    for job_id in candidates:
+        won = TranscodeJob.objects.filter(_claimable(), pk=job_id).update(
+            status=TranscodeJob.RUNNING, locked_by=worker_id, locked_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if won:
+            claimed.append(job_id)
+            if len(claimed) >= limit:
+                break
+    return list(TranscodeJob.objects.filter(pk__in=claimed).select_related('video').order_by('id'))
+
+
+def heartbeat(jobs, worker_id):
+    if jobs:
+        TranscodeJob.objects.filter(pk__in=[j.pk for j in jobs], locked_by=worker_id).update(locked_at=timezone.now())
+
+
+def complete_job(job, renditions):
+    TranscodeJob.objects.filter(pk=job.pk).update(
+        status=TranscodeJob.READY, manifest_name=hls_manifest_name(job.video_id), renditions=renditions,
+        error='', locked_by='', locked_at=None,
+    )
+    bump_curriculum_version(job.video.course_id)
+
+
+def fail_job(job, error):
+    max_attempts = getattr(settings, 'TRANSCODE_MAX_ATTEMPTS', 3)
+    job.refresh_from_db(fields=['attempts'])
+    status = TranscodeJob.FAILED if job.attempts >= max_attempts else TranscodeJob.PENDING
+    TranscodeJob.objects.filter(pk=job.pk).update(status=status, error=str(error)[-4000:], locked_by='', locked_at=None)
+    logger.warning("Transcode of video %s failed (attempt %s): %s", job.video_id, job.attempts, error)
+
+
+def source_aspect(video):
+    """width/height from the probed metadata, or None when it wasn't read."""
+    if video.width and video.height:
+        return video.width / video.height
+    return None
+
+
+def job_arguments(job, backend):
+    backend_class, options = backend
+    return (
+        backend_class, options,
+        default_storage.path(job.source_name),
+        default_storage.path(hls_dir_name(job.video_id)),
+        ladder_for(job.video.height),
+        source_aspect(job.video),
+    )
+
+
+class TranscodeWorker:
+    """
+    Polls the queue and runs transcodes on a process pool (`processes` = 0
+    runs them inline, for tests). Only this process talks to the database.
+    """
+
+    def __init__(self, processes=2, poll_interval=5.0, backend=None):
+        self.processes = processes
+        self.poll_interval = poll_interval
+        self.backend = backend or backend_config()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def run(self, once=False):
+        if self.backend[0] is None:
+            raise RuntimeError("No transcoding backend: install ffmpeg or set TRANSCODE_BACKEND.")
+        if self.processes <= 0:
+            return self._run_inline(once)
+
+        # Forked children must not inherit open database connections
+        connections.close_all()
+        done_count = 0
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            running = {}
+            while True:
+                free = self.processes - len(running)
+                if free > 0:
+                    for job in claim_jobs(self.worker_id, free):
+                        running[pool.submit(run_transcode, *job_arguments(job, self.backend))] = job
+                if not running:
+                    if once:
+                        return done_count
+                    time.sleep(self.poll_interval)
+                    continue
+                finished, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    job = running.pop(future)
+                    self._finish(job, future)
+                    done_count += 1
+                heartbeat(list(running.values()), self.worker_id)
+
+    def _run_inline(self, once):
+        done_count = 0
+        while True:
+            jobs = claim_jobs(self.worker_id, 1)
+            if not jobs:
+                if once:
+                    return done_count
+                time.sleep(self.poll_interval)
+                continue
+            job = jobs[0]
+            try:
+                renditions = run_transcode(*job_arguments(job, self.backend))
+            except Exception as e:
+                fail_job(job, e)
+            else:
+                complete_job(job, renditions)
+            done_count += 1
+
+    def _finish(self, job, future):
+        try:
+            renditions = future.result()
+        except Exception as e:
+            fail_job(job, e)
+        else:
+            complete_job(job, renditions)
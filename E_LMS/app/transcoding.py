@@ -0,0 +1,128 @@
+"""
+Encoder backends for the HLS bitrate ladder. Nothing here touches Django,
+so `run_transcode` can execute in a worker process of the pool started by
+app/transcode_queue.py (which owns all database access).
+"""
+import mimetypes
+import os
+import shutil
+import subprocess
+
+MASTER_PLAYLIST = 'master.m3u8'
+SEGMENT_SECONDS = 6
+# width/height assumed when the source dimensions weren't probed
+DEFAULT_ASPECT = 16 / 9
+
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+
+def rendition_name(height):
+    return f'{height}p'
+
+
+class StubBackend:
+    """Writes tiny placeholder playlists and segments; for tests and machines without ffmpeg."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def transcode(self, source_path, output_dir, ladder, aspect=None):
+        with open(source_path, 'rb') as f:
+            sample = f.read(188)
+        renditions = []
+        for height, video_kbps, audio_kbps in ladder:
+            name = rendition_name(height)
+            with open(os.path.join(output_dir, f'{name}_000.ts'), 'wb') as f:
+                f.write(sample)
+            _write_media_playlist(os.path.join(output_dir, f'{name}.m3u8'), [f'{name}_000.ts'])
+            renditions.append(_rendition(height, video_kbps, audio_kbps, aspect))
+        return renditions
+
+
+class FFmpegBackend:
+    """One ffmpeg run per rung: H.264/AAC, fixed-length HLS segments, VOD playlists."""
+
+    def __init__(self, binary='ffmpeg', preset='veryfast', timeout=None, **options):
+        self.binary = binary
+        self.preset = preset
+        self.timeout = timeout
+
+    @staticmethod
+    def available(binary='ffmpeg'):
+        return shutil.which(binary) is not None
+
+    def transcode(self, source_path, output_dir, ladder, aspect=None):
+        renditions = []
+        for height, video_kbps, audio_kbps in ladder:
+            name = rendition_name(height)
+            command = [
+                self.binary, '-hide_banner', '-loglevel', 'error', '-y', '-i', source_path,
+                '-vf', f'scale=-2:{height}',
+                '-c:v', 'libx264', '-preset', self.preset, '-profile:v', 'main',
+                '-b:v', f'{video_kbps}k', '-maxrate', f'{int(video_kbps * 1.07)}k', '-bufsize', f'{video_kbps * 2}k',
+                # keyframe every segment so every rung switches cleanly
+                '-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_SECONDS})',
+                '-c:a', 'aac', '-b:a', f'{audio_kbps}k', '-ac', '2',
+                '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                '-hls_segment_filename', os.path.join(output_dir, f'{name}_%03d.ts'),
+                os.path.join(output_dir, f'{name}.m3u8'),
+            ]
+            result = subprocess.run(command, capture_output=True, timeout=self.timeout)
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed for {name}: {result.stderr.decode(errors='replace')[-2000:]}")
+            renditions.append(_rendition(height, video_kbps, audio_kbps, aspect))
+        return renditions
+
+
+def _rendition(height, video_kbps, audio_kbps, aspect=None):
+    # the even width ffmpeg's scale=-2:<height> gives for this source
+    return {
+        'name': rendition_name(height),
+        'height': height,
+        'width': int(round(height * (aspect or DEFAULT_ASPECT) / 2)) * 2,
+        'bandwidth': (video_kbps + audio_kbps) * 1000,
+        'playlist': f'{rendition_name(height)}.m3u8',
+    }
+
+
+def _write_media_playlist(path, segments):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{SEGMENT_SECONDS}',
+             '#EXT-X-PLAYLIST-TYPE:VOD', '#EXT-X-MEDIA-SEQUENCE:0']
+    for segment in segments:
+        lines += [f'#EXTINF:{SEGMENT_SECONDS:.1f},', segment]
+    lines.append('#EXT-X-ENDLIST')
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def write_master_playlist(output_dir, renditions):
+    lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+    for r in sorted(renditions, key=lambda r: r['bandwidth']):
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={r['bandwidth']},RESOLUTION={r['width']}x{r['height']}")
+        lines.append(r['playlist'])
+    with open(os.path.join(output_dir, MASTER_PLAYLIST), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def run_transcode(backend_class, backend_options, source_path, output_dir, ladder, aspect=None):
+    """
+    Entry point for pool workers. Builds into a scratch directory and swaps
+    it in at the end, so a half-written ladder is never served. `aspect` is
+    the source's width/height, for the RESOLUTION of each rung.
+    """
+    from django.utils.module_loading import import_string  # no settings access
+
+    scratch = output_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(scratch, ignore_errors=True)
+    os.makedirs(scratch)
+    try:
+        backend = import_string(backend_class)(**backend_options)
+        renditions = backend.transcode(source_path, scratch, ladder, aspect)
+        write_master_playlist(scratch, renditions)
+    except BaseException:
+        shutil.rmtree(scratch, ignore_errors=True)
+        raise
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(scratch, output_dir)
+    return renditions
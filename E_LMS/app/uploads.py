@@ -0,0 +1,187 @@
+import hashlib
+import os
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+from django.utils import timezone
+from .media_probe import probe_video
+from .models import Video, VideoUpload, VideoUploadChunk, video_upload_path
+
+READ_BUFFER = 64 * 1024
+PART_SUFFIX = '.part'
+
+
+class UploadError(Exception):
+    """Client-side problem with an upload request; `status` is the HTTP code to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_chunk_size():
+    return getattr(settings, 'VIDEO_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def part_path(upload):
+    return default_storage.path(upload.file_name + PART_SUFFIX)
+
+
+def start_upload(teacher, lesson, serial_number, title, time_duration, filename, total_size):
+    """
+    Reserve the final storage name (same layout as Video.video_file) with an
+    empty placeholder file, and create an empty '.part' file of the final
+    size next to it.
+    """
+    video = Video(course=lesson.course, lesson=lesson, serial_number=serial_number, title=title)
+    name = video_upload_path(video, filename)
+    os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+    while True:
+        try:
+            # 'x' so two uploads can't claim the same name, and the placeholder
+            # makes get_available_name() steer add_video saves away from it
+            with open(default_storage.path(name), 'xb'):
+                pass
+            break
+        except FileExistsError:
+            name = default_storage.get_alternative_name(*os.path.splitext(name))
+    with open(default_storage.path(name + PART_SUFFIX), 'wb') as f:
+        f.truncate(total_size)
+
+    return VideoUpload.objects.create(
+        teacher=teacher, lesson=lesson, serial_number=serial_number, title=title,
+        time_duration=time_duration, file_name=name, total_size=total_size,
+        chunk_size=upload_chunk_size(),
+    )
+
+
+def chunk_count(upload):
+    return max((upload.total_size + upload.chunk_size - 1) // upload.chunk_size, 1)
+
+
+def expected_chunk_size(upload, index):
+    return min(upload.chunk_size, upload.total_size - index * upload.chunk_size)
+
+
+def write_chunk(upload, index, stream, sha256):
+    """
+    Copy one chunk from the request stream into its offset in the '.part'
+    file, READ_BUFFER bytes at a time, verifying length and SHA-256.
+    Re-sending a chunk overwrites it, so retries are safe.
+    """
+    if index < 0 or index >= chunk_count(upload):
+        raise UploadError("Chunk index out of range.")
+    if not sha256:
+        raise UploadError("Missing X-Chunk-Sha256 header.")
+
+    expected = expected_chunk_size(upload, index)
+    digest = hashlib.sha256()
+    written = 0
+    with open(part_path(upload), 'r+b') as f:
+        f.seek(index * upload.chunk_size)
+        while written < expected:
+            data = stream.read(min(READ_BUFFER, expected - written))
+            if not data:
+                break
+            f.write(data)
+            digest.update(data)
+            written += len(data)
+        # anything past the expected size is a client bug, not more data
+        if stream.read(1):
+            raise UploadError(f"Chunk {index} is larger than {expected} bytes.")
+
+    if written != expected:
+        raise UploadError(f"Chunk {index} is {written} bytes, expected {expected}.")
+    if digest.hexdigest() != sha256.lower():
+        raise UploadError(f"Checksum mismatch for chunk {index}.", status=422)
+
+    VideoUploadChunk.objects.bulk_create(
+        [VideoUploadChunk(upload=upload, index=index, size=written, sha256=digest.hexdigest())],
+        update_conflicts=True, unique_fields=['upload', 'index'], update_fields=['size', 'sha256'],
+    )
+    # updated_at drives cleanup of abandoned uploads
+    VideoUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return written
+
+
+def received_chunks(upload):
+    return sorted(upload.chunks.values_list('index', flat=True))
+
+
+def upload_status(upload):
+    received = received_chunks(upload)
+    return {
+        'upload_id': str(upload.id),
+        'chunk_size': upload.chunk_size,
+        'total_size': upload.total_size,
+        'chunk_count': chunk_count(upload),
+        'received': received,
+        'complete': len(received) == chunk_count(upload),
+    }
+
+
+def finish_upload(upload, thumbnail=None, time_duration=None):
+    """
+    Move the assembled file into place (a rename, not a copy) and create the
+    Video, with duration/resolution read from its headers when possible.
+    """
+    # the Video, its stats/search/curriculum signals and the upload's removal commit together
+    with transaction.atomic():
+        # claim the upload: a concurrent finish waits here, then finds the row gone
+        claimed = VideoUpload.objects.select_for_update().filter(pk=upload.pk).values_list('pk', flat=True)
+        if not list(claimed):
+            raise UploadError("This upload has already been finished or aborted.", status=409)
+        received, taken = (
+            VideoUpload.objects.filter(pk=upload.pk)
+            .annotate(
+                received=Count('chunks'),
+                taken=Exists(Video.objects.filter(lesson_id=OuterRef('lesson_id'), serial_number=OuterRef('serial_number'))),
+            )
+            .values_list('received', 'taken').get()
+        )
+        if received < chunk_count(upload):
+            raise UploadError(f"{chunk_count(upload) - received} chunk(s) still missing.", status=409)
+        if taken:
+            raise UploadError("A video with this serial number already exists in the selected lesson.", status=409)
+
+        media_info = probe_video(part_path(upload))
+        time_duration = time_duration or upload.time_duration
+        if media_info is None and not time_duration:
+            raise UploadError("Could not read the video duration, please enter it in minutes.")
+
+        # over our own placeholder, so nothing saved since start_upload can be lost
+        name = upload.file_name
+        os.replace(part_path(upload), default_storage.path(name))
+        try:
+            if hasattr(default_storage, 'adopt'):
+                # a re-upload of an existing lecture becomes another link to the same blob
+                name = default_storage.adopt(name)
+            video = Video(
+                course=upload.lesson.course,
+                lesson=upload.lesson,
+                serial_number=upload.serial_number,
+                title=upload.title,
+                time_duration=time_duration,
+                thumbnail=thumbnail,
+                video_file=name,
+            )
+            if media_info:
+                video.apply_media_info(media_info)
+            video.save()
+            upload.delete()
+        except BaseException:
+            # hand the file back to the upload, name reserved again, so finishing can be retried
+            os.replace(default_storage.path(name), part_path(upload))
+            open(default_storage.path(upload.file_name), 'ab').close()
+            raise
+    return video
+
+
+def abort_upload(upload):
+    for path in (part_path(upload), default_storage.path(upload.file_name)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    upload.delete()
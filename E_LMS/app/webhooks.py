@@ -0,0 +1,80 @@
+"""
+Gateway webhooks. The payment_webhook view only checks the signature and
+appends the raw event to the PaymentEvent inbox (one INSERT, duplicates
+ignored by event id); `manage.py payment_webhook_worker` drains the inbox
+in batches and settles the paid orders together (app/payments.py).
+"""
+import hashlib
+import hmac
+import json
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import PaymentEvent
+from .payments import settle_payments
+
+logger = logging.getLogger("app.webhooks")
+
+# events that mean an order has been paid; both carry the payment entity
+SETTLE_EVENTS = ('payment.captured', 'order.paid')
+
+
+def webhook_signature(body, secret=None):
+    secret = secret or getattr(settings, 'PAYMENT_WEBHOOK_SECRET', None)
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def signature_valid(body, signature):
+    """False for every request while PAYMENT_WEBHOOK_SECRET is unset."""
+    if not getattr(settings, 'PAYMENT_WEBHOOK_SECRET', None) or not signature:
+        return False
+    return hmac.compare_digest(webhook_signature(body), signature)
+
+
+def record_event(body, event_id=None):
+    """Append a verified event to the inbox. Gateway retries of the same event id are dropped."""
+    event_id = event_id or hashlib.sha256(body).hexdigest()
+    PaymentEvent.objects.bulk_create(
+        [PaymentEvent(event_id=event_id[:64], body=body.decode('utf-8'))], ignore_conflicts=True,
+    )
+
+
+def settlement_for(body):
+    """(order id, payment id) if the event settles an order, else None; ValueError if malformed."""
+    try:
+        event = json.loads(body)
+        if event['event'] not in SETTLE_EVENTS:
+            return None
+        payment = event['payload']['payment']['entity']
+        return payment['order_id'], payment['id']
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"unexpected event shape: {e!r}")
+
+
+def drain_inbox(batch_size=200):
+    """
+    Apply the oldest `batch_size` unprocessed events in one transaction.
+    Returns (events processed, payments settled). Safe to run in several
+    workers: settlement is idempotent and takes its own row locks.
+    """
+    with transaction.atomic():
+        events = list(PaymentEvent.objects.filter(processed_at__isnull=True).order_by('id')[:batch_size])
+        settlements = {}
+        for event in events:
+            event.error = ''
+            try:
+                settlement = settlement_for(event.body)
+            except ValueError as e:
+                event.error = str(e)[:255]
+                logger.warning("Payment event %s ignored: %s", event.event_id, e)
+                continue
+            if settlement:
+                settlements[settlement[0]] = settlement[1]
+
+        settled = settle_payments(settlements)
+        now = timezone.now()
+        for event in events:
+            event.processed_at = now
+        PaymentEvent.objects.bulk_update(events, ['processed_at', 'error'])
+    return len(events), len(settled)